@@ -0,0 +1,555 @@
+"""Offline benchmarks for Book Builder UI.
+
+Usage:
+    python bench.py epub-metadata [--chapters N] [--chapter-kb KB] [--images N] [--image-kb KB]
+    python bench.py shelf [--books N] [--chapters M] [--epub-kb KB] [--keep DIR]
+                          [--save-baseline FILE | --baseline FILE [--threshold PCT] [--min-delta-ms MS]]
+    python bench.py build [--books N] [--chapters M] [--jobs J] [--build-php FILE]
+
+``shelf`` generates a synthetic bookshelf (books.ini, chapters, EPUBs,
+covers and a stub build.php) and times the hot paths.  The Tk timings
+need a display: the current $DISPLAY, or an Xvfb server started for the
+run if Xvfb is installed; otherwise they are skipped.  With --baseline it
+exits 1 when any timing is more than --threshold percent and more than
+--min-delta-ms slower.
+
+Each timing is the median of at least --repeat runs, with more runs for
+fast operations until they add up to MIN_TIMING_SECONDS.  The synthetic
+shelf is the same, byte for byte and down to file mtimes, on every run,
+so two runs on an unchanged tree compare clean.
+
+``build`` times per-book builds with the php and native engines, one at a
+time and then as a parallel batch.  The synthetic shelf's build.php is a
+stub that only sleeps for 50ms, so pass the real one with --build-php for
+a fair comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+CHAPTER_XHTML = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>Chapter {n}</title></head>
+<body>
+<h1>Chapter {n}</h1>
+{body}
+</body>
+</html>
+"""
+
+SOURCE_DATE = (2024, 1, 1, 0, 0, 0)  # Zip entry and file times, so generated shelves are identical
+SOURCE_MTIME = time.mktime(SOURCE_DATE + (0, 0, -1))
+MIN_TIMING_SECONDS = 0.5  # timeit repeats fast operations until they add up to this
+MAX_TIMING_REPEAT = 200
+
+WORDS = ("the quick brown fox jumps over a lazy dog while seven wizards "
+         "quietly box jugglers and sphinxes judge vows of black quartz").split()
+
+
+def lorem(size_bytes, rng):
+    """Paragraphs of filler text totalling roughly size_bytes."""
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        paragraph = '<p>' + ' '.join(rng.choice(WORDS) for _ in range(80)) + '.</p>'
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 1
+    return '\n'.join(paragraphs)
+
+
+def zip_entry(name, compress_type=zipfile.ZIP_DEFLATED):
+    info = zipfile.ZipInfo(name, date_time=SOURCE_DATE)
+    info.compress_type = compress_type
+    return info
+
+
+def make_synthetic_epub(path, title='Synthetic Book', author='Bench Author',
+                        chapters=50, chapter_kb=60, images=20, image_kb=100, seed=0):
+    """Write a valid EPUB 3 with the given number and size of chapters and images."""
+    rng = random.Random(seed)
+    manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+    spine = []
+    nav_links = []
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr(zip_entry('mimetype', zipfile.ZIP_STORED), 'application/epub+zip')
+        zf.writestr(zip_entry('META-INF/container.xml'), CONTAINER_XML)
+        for i in range(images):
+            name = f'images/img{i}.jpg'
+            # Random bytes don't compress, like real JPEG data
+            zf.writestr(zip_entry(f'OEBPS/{name}', zipfile.ZIP_STORED), rng.randbytes(image_kb * 1024))
+            manifest.append(f'<item id="img{i}" href="{name}" media-type="image/jpeg"/>')
+        for n in range(1, chapters + 1):
+            body = lorem(chapter_kb * 1024, rng)
+            if images:
+                body += f'\n<p><img src="images/img{n % images}.jpg" alt=""/></p>'
+            zf.writestr(zip_entry(f'OEBPS/chapter{n}.xhtml'), CHAPTER_XHTML.format(n=n, body=body))
+            manifest.append(f'<item id="ch{n}" href="chapter{n}.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{n}"/>')
+            nav_links.append(f'<li><a href="chapter{n}.xhtml">Chapter {n}</a></li>')
+        zf.writestr(zip_entry('OEBPS/nav.xhtml'), (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            '<head><title>Contents</title></head><body><nav epub:type="toc"><ol>'
+            + ''.join(nav_links) + '</ol></nav></body></html>'
+        ))
+        zf.writestr(zip_entry('OEBPS/content.opf'), (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="id">synthetic-{seed}</dc:identifier>'
+            f'<dc:title>{title}</dc:title><dc:creator>{author}</dc:creator>'
+            '<dc:language>en</dc:language>'
+            '<meta property="dcterms:modified">2024-01-01T00:00:00Z</meta>'
+            '</metadata><manifest>' + ''.join(manifest) + '</manifest>'
+            '<spine>' + ''.join(spine) + '</spine></package>'
+        ))
+    return path
+
+
+THUMBNAIL_SAMPLE = 100  # Covers rendered by the thumbnail timings
+
+STUB_BUILD_PHP = """<?php
+// Stub build.php for benchmarks: echoes like the real one and writes nothing.
+$book = end($argv);
+echo "Building {$book}\n";
+usleep(50000);
+echo "Done {$book}\n";
+"""
+
+
+def make_cover(path, rng, size=(600, 900)):
+    """Write a JPEG cover with Pillow; without it, placeholder bytes (the index only checks existence)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        with open(path, 'wb') as f:
+            f.write(b'\xff\xd8' + rng.randbytes(32 * 1024) + b'\xff\xd9')
+        return
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    image.save(path, 'JPEG', quality=85)
+
+
+def make_synthetic_shelf(root, books=500, chapters=30, chapter_kb=8, epub_kb=200, covers=True, seed=0):
+    """Create root/bookshelf with books.ini and N book directories; returns root.
+
+    Every book gets ``chapters`` Markdown chapters named so natural sorting
+    matters (Chapter 2 before Chapter 10), a media/ directory, an EPUB of
+    roughly ``epub_kb`` KB and, if ``covers``, a cover image.  The same
+    arguments always give the same files, with the same mtimes.
+    """
+    rng = random.Random(seed)
+    shelf = os.path.join(root, 'bookshelf')
+    os.makedirs(shelf, exist_ok=True)
+    categories = ['Fiction', 'Poetry', 'History', 'Science', 'Children']
+    statuses = ['draft', 'editing', 'Published']
+    ini_lines = []
+    epub_chapters = max(1, epub_kb // 20)
+    first_cover = None
+    for n in range(books):
+        book = f"book-{n:05d}"
+        ini_lines += [
+            f"[{book}]",
+            f"book[title] = Synthetic Title {n}",
+            f"book[subtitle] = A benchmark volume",
+            f"book[category] = {categories[n % len(categories)]}",
+            f"book[status] = {statuses[n % len(statuses)]}",
+            f"amazon[us] = https://www.amazon.com/dp/B{n:09d}",
+            f"amazon[uk] = https://www.amazon.co.uk/dp/B{n:09d}",
+            "",
+        ]
+        book_path = os.path.join(shelf, book)
+        os.makedirs(os.path.join(book_path, 'chapters'), exist_ok=True)
+        os.makedirs(os.path.join(book_path, 'media'), exist_ok=True)
+        for c in range(1, chapters + 1):
+            with open(os.path.join(book_path, 'chapters', f"Chapter {c}.md"), 'w') as f:
+                f.write(f"# Chapter {c}\n\n" + lorem(chapter_kb * 1024, rng).replace('<p>', '').replace('</p>', '\n'))
+        make_synthetic_epub(os.path.join(book_path, f"{book}.epub"), title=f"Synthetic Title {n}",
+                            chapters=epub_chapters, chapter_kb=20, images=0, seed=seed + n)
+        if covers:
+            cover = os.path.join(book_path, 'media', 'cover-image-template.jpg')
+            if first_cover is None:
+                # Print-resolution, like real covers; copied because encoding one takes ~0.1s
+                make_cover(cover, rng, size=(1800, 2700))
+                first_cover = cover
+            else:
+                shutil.copyfile(first_cover, cover)
+    with open(os.path.join(shelf, 'books.ini'), 'w') as f:
+        f.write("\n".join(ini_lines))
+    with open(os.path.join(shelf, 'build.php'), 'w') as f:
+        f.write(STUB_BUILD_PHP)
+    for dirpath, dirnames, filenames in os.walk(shelf):
+        for name in filenames + dirnames:
+            os.utime(os.path.join(dirpath, name), (SOURCE_MTIME, SOURCE_MTIME))
+    return root
+
+
+def timeit(func, repeat):
+    """Median wall time of func(), in seconds.
+
+    func runs at least repeat times, and fast ones run again until the
+    runs add up to MIN_TIMING_SECONDS (at most MAX_TIMING_REPEAT runs).
+    """
+    times = []
+    while len(times) < repeat or (sum(times) < MIN_TIMING_SECONDS and len(times) < MAX_TIMING_REPEAT):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def bench_epub_metadata(args):
+    from ebooklib import epub
+    from epub_meta import read_epub_metadata, read_epub_metadata_uncached
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_synthetic_epub(
+            os.path.join(tmp, 'large.epub'),
+            chapters=args.chapters, chapter_kb=args.chapter_kb,
+            images=args.images, image_kb=args.image_kb
+        )
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"Synthetic EPUB: {size_mb:.1f} MB, {args.chapters} chapters, {args.images} images")
+
+        def via_read_epub():
+            book_obj = epub.read_epub(path)
+            return book_obj.get_metadata('DC', 'title'), book_obj.get_metadata('DC', 'creator')
+
+        full = timeit(via_read_epub, args.repeat)
+        opf = timeit(lambda: read_epub_metadata_uncached(path), args.repeat)
+        read_epub_metadata(path)
+        cached = timeit(lambda: read_epub_metadata(path), args.repeat)
+        print(f"  epub.read_epub             {full * 1000:10.2f} ms")
+        print(f"  read_epub_metadata (OPF)   {opf * 1000:10.2f} ms  ({full / opf:.0f}x faster)")
+        print(f"  read_epub_metadata cached  {cached * 1000:10.3f} ms")
+
+
+def run_builds(engine, base, books, workers):
+    """Build books through a JobRunner; returns (job durations, wall time, failed books)."""
+    from jobs import JobRunner, SUCCEEDED
+    runner = JobRunner(max_workers=workers)
+    started = time.perf_counter()
+    jobs = [runner.submit('build', book, engine.command(base, 'build', book), os.path.join(base, 'bookshelf'))
+            for book in books]
+    finished = 0
+    while finished < len(jobs):
+        if runner.events.get()[0] == 'finished':
+            finished += 1
+    return [job.duration for job in jobs], time.perf_counter() - started, [j.book for j in jobs if j.status != SUCCEEDED]
+
+
+def bench_build(args):
+    import build_engines
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_synthetic_shelf(tmp, books=args.books, chapters=args.chapters, epub_kb=20)
+        if args.build_php:
+            shutil.copyfile(args.build_php, os.path.join(tmp, 'bookshelf', 'build.php'))
+        books = [f"book-{n:05d}" for n in range(args.books)]
+        print(f"Synthetic shelf: {args.books} books x {args.chapters} chapters"
+              f"{'' if args.build_php else ' (stub build.php)'}")
+        engines = build_engines.make_engines(workers=args.jobs)
+        try:
+            for name in (build_engines.PHP, build_engines.NATIVE):
+                engine = engines[name]
+                problem = engine.problem(tmp)
+                if problem:
+                    print(f"  {name:<7} skipped: {problem}")
+                    continue
+                durations, _, failed = run_builds(engine, tmp, books, 1)
+                _, wall, batch_failed = run_builds(engine, tmp, books, args.jobs)
+                steady = durations[1:] or durations
+                print(f"  {name:<7} first book {durations[0] * 1000:8.1f} ms   "
+                      f"per book (median) {statistics.median(steady) * 1000:8.1f} ms   "
+                      f"{len(books)} books with {args.jobs} jobs {wall:6.2f} s")
+                if failed or batch_failed:
+                    print(f"          failed: {', '.join(sorted(set(failed + batch_failed)))}")
+        finally:
+            for engine in engines.values():
+                engine.shutdown()
+
+
+def start_display():
+    """Return (display available, Xvfb process or None), starting Xvfb if needed."""
+    if os.environ.get('DISPLAY'):
+        return True, None
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        return False, None
+    display = f":{random.randint(100, 999)}"
+    process = subprocess.Popen([xvfb, display, '-screen', '0', '1920x1080x24', '-nolisten', 'tcp'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        if os.path.exists(f"/tmp/.X11-unix/X{display[1:]}"):
+            os.environ['DISPLAY'] = display
+            return True, process
+        time.sleep(0.1)
+    process.terminate()
+    return False, None
+
+
+def bench_tk(base, results, repeat):
+    """refresh_book_list and the first preview page under a real Tk root."""
+    import main as app
+    import bookshelf
+    import epub_preview
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        # Don't let the user's last shelf load into the benchmark window
+        app.CONFIG_FILE = os.path.join(config_dir, 'config.json')
+        root = app.tk.Tk()
+        root.withdraw()
+        ui = app.BookBuilderUI(root)
+        ui.path_var.set(base)
+
+        index_file = os.path.join(bookshelf.cache_dir(base), bookshelf.INDEX_FILE_NAME)
+
+        def wait_for_scans():
+            # Shelf roots are scanned on threads; hand their results over as soon as they land
+            while "scanning" in ui.root_problems.values():
+                callback, value = ui.background_results.get(timeout=60)
+                callback(value)
+            root.update()
+
+        def refresh_cold():
+            ui.index = None
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            ui.refresh_book_list(base)
+            wait_for_scans()
+
+        def refresh_warm():
+            ui.refresh_book_list(base)
+            wait_for_scans()
+
+        results['tk.refresh_book_list.cold'] = timeit(refresh_cold, repeat)
+        results['tk.refresh_book_list.warm'] = timeit(refresh_warm, repeat)
+        results['tk.sort_by_title'] = timeit(lambda: (ui.set_sort('title', False), root.update()), repeat)
+
+        book = ui.index.order[0]
+        parsed = epub_preview.parse_epub(os.path.join(base, 'bookshelf', book, f"{book}.epub"))
+
+        def preview_first_page():
+            window = app.Toplevel(root)
+            ui.show_preview_pages(window, parsed)
+            root.update()
+            window.destroy()
+
+        results['tk.preview_first_page'] = timeit(preview_first_page, repeat)
+        ui.stop_watchers()
+        if ui.post_queue is not None:
+            ui.post_queue.stop()
+        root.destroy()
+
+
+def bench_shelf(args):
+    import bookshelf
+    import epub_preview
+    import social
+    from bookshelf import ShelfIndex, BookShelfModel, list_chapter_files, natural_sort_key, parse_books_ini
+
+    results = {}
+    keep = args.keep
+    tmp = None
+    if keep and os.path.isfile(os.path.join(keep, 'bookshelf', 'books.ini')):
+        base = keep
+        print(f"Reusing synthetic shelf at {base}")
+    else:
+        base = keep or tempfile.mkdtemp(prefix='bench-shelf-')
+        tmp = None if keep else base
+        started = time.perf_counter()
+        make_synthetic_shelf(base, books=args.books, chapters=args.chapters, epub_kb=args.epub_kb)
+        print(f"Generated {args.books} books x {args.chapters} chapters in {time.perf_counter() - started:.1f}s at {base}")
+
+    try:
+        books = list(parse_books_ini(base))
+        results['parse_books_ini'] = timeit(lambda: parse_books_ini(base), args.repeat)
+        results['list_chapter_files.all'] = timeit(lambda: [list_chapter_files(base, b) for b in books], args.repeat)
+        names = [f"Chapter {c}.md" for c in range(1, args.chapters + 1)] * max(1, args.books // 10)
+        random.Random(0).shuffle(names)
+        results['natural_sort_key.sort'] = timeit(lambda: sorted(names, key=natural_sort_key), args.repeat)
+
+        def index_cold():
+            shutil.rmtree(os.path.join(base, 'bookshelf', '.bookbuilder'), ignore_errors=True)
+            ShelfIndex.load(base).refresh()
+
+        results['index.refresh.cold'] = timeit(index_cold, args.repeat)
+        index = ShelfIndex.load(base)
+        index.refresh()
+        index.save()
+        results['index.refresh.warm'] = timeit(lambda: ShelfIndex.load(base).refresh(), args.repeat)
+        model = BookShelfModel(index, 'title', False)
+        results['model.sort_filter'] = timeit(
+            lambda: (model.set_sort('title', False), model.set_filter('title 1', None, None), model.visible()),
+            args.repeat
+        )
+
+        import manuscript_stats
+
+        def stats_cold():
+            stats_file = os.path.join(bookshelf.cache_dir(base), manuscript_stats.STATS_FILE_NAME)
+            if os.path.exists(stats_file):
+                os.remove(stats_file)
+            stats = manuscript_stats.ShelfStats.load(base)
+            stats.update(books)
+            stats.save()
+
+        results['stats.update.cold'] = timeit(stats_cold, args.repeat)
+        results['stats.update.warm'] = timeit(lambda: manuscript_stats.ShelfStats.load(base).update(books), args.repeat)
+
+        epub_file = bookshelf.epub_path(base, books[0])
+        results['preview.parse_epub'] = timeit(lambda: epub_preview.parse_epub(epub_file), args.repeat)
+        parsed = epub_preview.parse_epub(epub_file)
+        results['preview.chapter_html.all'] = timeit(
+            lambda: [parsed.chapter_html(i) for i in range(len(parsed))], args.repeat
+        )
+
+        import epub_verify
+        results['epub_verify.one'] = timeit(lambda: epub_verify.verify_epub(epub_file), args.repeat)
+
+        records = index.records()
+        results['post_text.tweets'] = timeit(lambda: [social.tweet_payload(base, r, 'Bench Author') for r in records], args.repeat)
+        results['post_text.captions'] = timeit(
+            lambda: [social.instagram_payload(base, r, r['title'], 'Bench Author') for r in records], args.repeat
+        )
+
+        import thumbnails
+        if thumbnails.available():
+            covers = [bookshelf.cover_path(base, r['book']) for r in records if r['has_cover']][:THUMBNAIL_SAMPLE]
+
+            def render_thumbnails(cache):
+                for cover in covers:
+                    key, path = cache.lookup(cover)
+                    if path is None:
+                        cache.request(None, cover, key)
+                for _ in covers:
+                    cache.results.get()
+
+            def thumbnails_cold():
+                shutil.rmtree(os.path.join(base, 'bookshelf', '.bookbuilder', thumbnails.THUMBS_DIR_NAME),
+                              ignore_errors=True)
+                cache = thumbnails.ThumbnailCache(base)
+                render_thumbnails(cache)
+                cache.shutdown()
+
+            results['thumbnails.render.cold'] = timeit(thumbnails_cold, args.repeat)
+            cache = thumbnails.ThumbnailCache(base)
+            results['thumbnails.lookup.warm'] = timeit(lambda: [cache.lookup(cover) for cover in covers], args.repeat)
+            cache.shutdown()
+
+        has_display, xvfb = start_display()
+        if has_display:
+            try:
+                bench_tk(base, results, args.repeat)
+            finally:
+                if xvfb is not None:
+                    xvfb.terminate()
+        else:
+            print("No display and no Xvfb: skipping Tk timings")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    for name, seconds in results.items():
+        print(f"  {name:<30} {seconds * 1000:10.2f} ms")
+    return report_baseline(results, args)
+
+
+def report_baseline(results, args):
+    """Save or compare against a baseline; returns the exit status."""
+    meta = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'books': args.books,
+        'chapters': args.chapters,
+        'epub_kb': args.epub_kb,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save_baseline}")
+        return 0
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if {k: baseline['meta'].get(k) for k in ('books', 'chapters', 'epub_kb')} != \
+            {k: meta[k] for k in ('books', 'chapters', 'epub_kb')}:
+        print("WARNING: baseline was recorded with a different shelf size; comparisons are not like for like")
+    regressions = []
+    print(f"Compared with {args.baseline} (threshold {args.threshold:.0f}%):")
+    for name, seconds in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"  {name:<30} new")
+            continue
+        change = (seconds - before) / before * 100 if before else 0.0
+        flag = ''
+        # Timings of a few milliseconds jitter by more than any sensible threshold
+        if change > args.threshold and (seconds - before) * 1000 >= args.min_delta_ms:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<30} {before * 1000:10.2f} -> {seconds * 1000:10.2f} ms  {change:+6.1f}%{flag}")
+    if regressions:
+        print(f"FAIL: {len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Book Builder UI benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    meta = subparsers.add_parser('epub-metadata', help="OPF-only metadata reader vs epub.read_epub")
+    meta.add_argument('--chapters', type=int, default=200)
+    meta.add_argument('--chapter-kb', type=int, default=15)
+    meta.add_argument('--images', type=int, default=40)
+    meta.add_argument('--image-kb', type=int, default=50)
+    meta.add_argument('--repeat', type=int, default=5)
+    meta.set_defaults(func=bench_epub_metadata)
+
+    shelf = subparsers.add_parser('shelf', help="synthetic bookshelf: index, sorting, preview, post text, Tk")
+    shelf.add_argument('--books', type=int, default=500)
+    shelf.add_argument('--chapters', type=int, default=30)
+    shelf.add_argument('--epub-kb', type=int, default=200)
+    shelf.add_argument('--repeat', type=int, default=5,
+                       help="minimum runs per timing; the median is reported (default 5)")
+    shelf.add_argument('--keep', metavar='DIR', help="generate the shelf in DIR and reuse it on later runs")
+    shelf.add_argument('--save-baseline', metavar='FILE', help="write the timings to FILE")
+    shelf.add_argument('--baseline', metavar='FILE', help="compare with timings saved by --save-baseline")
+    shelf.add_argument('--threshold', type=float, default=25.0, metavar='PCT',
+                       help="with --baseline, flag timings more than PCT percent slower (default 25)")
+    shelf.add_argument('--min-delta-ms', type=float, default=5.0, metavar='MS',
+                       help="with --baseline, ignore slowdowns smaller than this (default 5)")
+    shelf.set_defaults(func=bench_shelf)
+
+    build = subparsers.add_parser('build', help="per-book build latency: build.php vs the native engine")
+    build.add_argument('--books', type=int, default=20)
+    build.add_argument('--chapters', type=int, default=30)
+    build.add_argument('--jobs', type=int, default=os.cpu_count() or 2)
+    build.add_argument('--build-php', metavar='FILE', help="a real build.php to compare against (default: a stub)")
+    build.set_defaults(func=bench_build)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""Bookshelf layout helpers and the persistent book metadata index.
+
+The index caches each book's books.ini fields, artifact flags and
+naturally sorted chapter list in ``bookshelf/.bookbuilder/index.json``.
+A refresh only re-parses books.ini when its mtime or size changed, and
+only rescans a book when the mtimes of its directory, ``chapters/``,
+``media/`` or EPUB changed, so refreshing an untouched shelf costs a few
+stats per book instead of a listdir plus a stat per chapter.  The cache
+is JSON, not pickle: shelves can live on shared mounts, and loading a
+pickle someone else wrote there would run their code.  A cache that
+doesn't parse is treated as missing.
+
+A ``ShelfSet`` merges the indexes of several shelf roots into one list.
+Each root is scanned with ``scan_root`` on its own thread and attached
+when its scan finishes.
+"""
+import configparser
+import json
+import logging
+import os
+import re
+import tempfile
+
+import tracing
+
+log = logging.getLogger('book_builder.bookshelf')
+
+CACHE_DIR_NAME = '.bookbuilder'
+INDEX_FILE_NAME = 'index.json'
+INDEX_VERSION = 3
+COVER_FILE_NAME = 'cover-image-template.jpg'
+NO_CHAPTERS_DIR = "No chapters directory"
+NO_CHAPTER_FILES = "No chapter files"
+CHAPTER_PLACEHOLDERS = (NO_CHAPTERS_DIR, NO_CHAPTER_FILES)
+
+
+def validate_book_dir(path):
+    bookshelf_exists = os.path.isdir(os.path.join(path, 'bookshelf'))
+    ini_exists = os.path.isfile(os.path.join(path, 'bookshelf/books.ini'))
+    return bookshelf_exists and ini_exists
+
+def parse_books_ini(path):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(path, 'bookshelf/books.ini'))
+    return {section: config[section] for section in config.sections()}
+
+def natural_sort_key(s):
+    """Key function for natural sorting (e.g., chapter1.md, chapter2.md, chapter10.md)."""
+    return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', s)]
+
+def list_chapter_files(base_path, book):
+    """Return a naturally sorted list of files in the book's chapters directory."""
+    chapters_dir = os.path.join(base_path, 'bookshelf', book, 'chapters')
+    if not os.path.isdir(chapters_dir):
+        return [NO_CHAPTERS_DIR]
+    files = [f for f in os.listdir(chapters_dir) if os.path.isfile(os.path.join(chapters_dir, f))]
+    if not files:
+        return [NO_CHAPTER_FILES]
+    return sorted(files, key=natural_sort_key)
+
+def book_dir(base_path, book):
+    return os.path.join(base_path, 'bookshelf', book)
+
+def epub_path(base_path, book):
+    return os.path.join(base_path, 'bookshelf', book, f"{book}.epub")
+
+def cover_path(base_path, book):
+    return os.path.join(base_path, 'bookshelf', book, 'media', COVER_FILE_NAME)
+
+def chapter_path(base_path, book, filename):
+    return os.path.join(base_path, 'bookshelf', book, 'chapters', filename)
+
+def build_script_path(base_path):
+    return os.path.join(base_path, 'bookshelf', 'build.php')
+
+
+def build_command(base_path, command, book):
+    """The build.php argv for a 'build' or 'clean' of one book; run it from bookshelf/."""
+    if command == 'build':
+        return ['php', build_script_path(base_path), book]
+    if command == 'clean':
+        return ['php', build_script_path(base_path), '--clean', book]
+    raise ValueError(f"Unknown command: {command}")
+
+
+def cache_dir(base_path):
+    """Directory for the app's caches under the shelf, created on demand."""
+    path = os.path.join(base_path, 'bookshelf', CACHE_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def atomic_write(path, data):
+    """Replace path with data (bytes or str) so readers never see a partial file.
+
+    Writes a temp file in the same directory, fsyncs it, then renames it
+    over the original, keeping the original's permissions.
+    """
+    directory = os.path.dirname(path) or '.'
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)  # Persist the rename itself
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def _stat_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def stamp_from_json(value):
+    """A (mtime_ns, size) stamp read back from JSON, where it became a list."""
+    return None if value is None else (int(value[0]), int(value[1]))
+
+
+def _book_stamp(base_path, book):
+    directory = book_dir(base_path, book)
+    return (
+        _stat_stamp(directory),
+        _stat_stamp(os.path.join(directory, 'chapters')),
+        _stat_stamp(os.path.join(directory, 'media')),
+        _stat_stamp(epub_path(base_path, book)),
+    )
+
+
+class ShelfIndex:
+    """Cached view of one shelf's books, keyed by directory and file mtimes.
+
+    Records are plain dicts so they serialize cheaply:
+        book, key, base_path, fields, title, category, status, amazon_us,
+        amazon_uk, has_dir, has_epub, epub_mtime, has_cover, chapters, stamp
+    ``key`` is the book list's row id: the book name, unless a ShelfSet
+    qualifies it with the root.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.ini_stamp = None
+        self.order = []  # Sections in books.ini order
+        self.books = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, base_path):
+        """Load the saved index for a shelf, or start an empty one."""
+        path = os.path.join(base_path, 'bookshelf', CACHE_DIR_NAME, INDEX_FILE_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION and data.get('base_path') == base_path:
+                index = cls(base_path)
+                index.ini_stamp = stamp_from_json(data['ini_stamp'])
+                index.order = [str(book) for book in data['order']]
+                for book, record in data['books'].items():
+                    record['stamp'] = tuple(stamp_from_json(stamp) for stamp in record['stamp'])
+                    index.books[book] = record
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Ignoring unreadable index %s: %s", path, e)
+        return cls(base_path)
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'base_path': self.base_path,
+            'ini_stamp': self.ini_stamp,
+            'order': self.order,
+            'books': self.books,
+        }
+        try:
+            path = os.path.join(cache_dir(self.base_path), INDEX_FILE_NAME)
+            atomic_write(path, json.dumps(data))
+            self.dirty = False
+        except OSError as e:
+            log.warning("Failed to save index: %s", e)
+
+    def get(self, book):
+        return self.books.get(book)
+
+    def records(self):
+        """All book records in books.ini order."""
+        return [self.books[book] for book in self.order if book in self.books]
+
+    def refresh(self, books=None):
+        """Bring the index up to date and return the set of books that changed.
+
+        With ``books`` only those books are restatted (books.ini is always
+        checked, since it is one stat).
+        """
+        changed = set()
+        ini_file = os.path.join(self.base_path, 'bookshelf', 'books.ini')
+        ini_stamp = _stat_stamp(ini_file)
+        sections = None
+        if ini_stamp != self.ini_stamp or any(book not in self.books for book in self.order):
+            with tracing.span('ini.parse', path=ini_file):
+                sections = {book: dict(section) for book, section in parse_books_ini(self.base_path).items()}
+            removed = set(self.books) - set(sections)
+            for book in removed:
+                del self.books[book]
+            changed |= removed
+            self.order = list(sections)
+            self.ini_stamp = ini_stamp
+            self.dirty = True
+
+        to_check = self.order if books is None or sections is not None else [b for b in books if b in self.order]
+        with tracing.span('fs.scan', books=len(to_check)) as scan:
+            for book in to_check:
+                record = self.books.get(book)
+                fields = sections[book] if sections is not None else record['fields']
+                stamp = _book_stamp(self.base_path, book)
+                if record is not None and record['stamp'] == stamp and record['fields'] == fields:
+                    continue
+                self.books[book] = self._scan_book(book, fields, stamp)
+                changed.add(book)
+                self.dirty = True
+            scan.set(rescanned=len(changed))
+        return changed
+
+    def _scan_book(self, book, fields, stamp):
+        dir_stamp, _, _, epub_stamp = stamp
+        has_dir = dir_stamp is not None
+        return {
+            'book': book,
+            'key': book,
+            'base_path': self.base_path,
+            'fields': fields,
+            'title': fields.get('book[title]', 'unknown'),
+            'category': fields.get('book[category]', 'unknown'),
+            'status': fields.get('book[status]', 'unknown'),
+            'amazon_us': fields.get('amazon[us]'),
+            'amazon_uk': fields.get('amazon[uk]'),
+            'has_dir': has_dir,
+            'has_epub': epub_stamp is not None,
+            'epub_mtime': epub_stamp[0] / 1e9 if epub_stamp is not None else None,
+            'has_cover': has_dir and os.path.exists(cover_path(self.base_path, book)),
+            'chapters': list_chapter_files(self.base_path, book) if has_dir else [NO_CHAPTERS_DIR],
+            'stamp': stamp,
+        }
+
+
+def scan_root(base_path):
+    """Validate a shelf root and bring its index up to date; returns (index, changed books).
+
+    Touches the disk throughout, so run it off the Tk thread.
+    """
+    with tracing.span('shelf.scan', path=base_path):
+        if not validate_book_dir(base_path):
+            raise ValueError(f"{base_path}: directory must contain 'bookshelf/' and 'books.ini'")
+        index = ShelfIndex.load(base_path)
+        changed = index.refresh()
+        index.save()
+    return index, changed
+
+
+def root_labels(roots):
+    """Short names for roots: the directory name, or the whole path where names clash."""
+    names = [os.path.basename(os.path.normpath(root)) or root for root in roots]
+    return {root: name if names.count(name) == 1 else os.path.normpath(root) for root, name in zip(roots, names)}
+
+
+class ShelfSet:
+    """The indexes of several shelf roots, presented like one ShelfIndex.
+
+    Books in the first root keep their names as keys; books in the others
+    get "book @ root label", so the same book on two shelves gets two
+    rows.  ``get``, ``refresh`` and ``order`` work with keys, and records
+    carry their ``base_path`` for anything that touches the book's files.
+    A root shows up once its scanned index is attached with ``attach``.
+    """
+
+    def __init__(self, roots):
+        self.roots = list(roots)
+        self.labels = root_labels(self.roots)
+        self.indexes = {}  # root -> ShelfIndex, for the roots scanned so far
+        self.books = {}  # key -> record, across the attached roots
+
+    @property
+    def base_path(self):
+        """The first root, where shelf-wide state like the post queue lives."""
+        return self.roots[0]
+
+    def key_for(self, root, book):
+        return book if root == self.roots[0] else f"{book} @ {self.labels[root]}"
+
+    def attach(self, root, index):
+        self.indexes[root] = index
+        self._rekey(root, index.books.values())
+        self._merge()
+
+    def detach(self, root):
+        if self.indexes.pop(root, None) is not None:
+            self._merge()
+
+    def _rekey(self, root, records):
+        for record in records:
+            record['key'] = self.key_for(root, record['book'])
+
+    def _merge(self):
+        self.books = {record['key']: record for record in self.records()}
+
+    @property
+    def order(self):
+        return [record['key'] for record in self.records()]
+
+    def get(self, key):
+        return self.books.get(key)
+
+    def records(self):
+        """Records root by root, each root's in books.ini order."""
+        return [record for root in self.roots if root in self.indexes for record in self.indexes[root].records()]
+
+    def books_by_root(self):
+        return {root: list(index.order) for root, index in self.indexes.items()}
+
+    def refresh(self, keys=None):
+        """Refresh every attached root, or only the roots of keys; returns the changed keys."""
+        if keys is None:
+            wanted = {root: None for root in self.indexes}
+        else:
+            wanted = {}
+            for key in keys:
+                record = self.books.get(key)
+                if record is not None:
+                    wanted.setdefault(record['base_path'], []).append(record['book'])
+        changed = set()
+        for root, books in wanted.items():
+            changed |= self.refresh_root(root, books)
+        return changed
+
+    def refresh_root(self, root, books=None):
+        """Refresh one attached root (only books, if given); returns the changed keys."""
+        index = self.indexes.get(root)
+        if index is None:
+            return set()
+        books = index.refresh(books)
+        self._rekey(root, filter(None, map(index.get, books)))
+        if books:
+            self._merge()
+        return {self.key_for(root, book) for book in books}
+
+    def save(self):
+        for index in self.indexes.values():
+            index.save()
+
+
+SORT_FIELDS = ('added', 'key', 'title', 'category', 'status', 'epub_mtime')
+
+
+class BookShelfModel:
+    """Sorted and filtered view over a ShelfIndex, kept in memory.
+
+    Changing the sort or filter only recomputes the visible list of books;
+    nothing is read from disk.
+    """
+
+    def __init__(self, index, sort_field='added', reverse=True):
+        self.index = index
+        self.sort_field = sort_field
+        self.reverse = reverse
+        self.text = ''
+        self.category = None
+        self.status = None
+        self._derived = {}  # book -> (record, lowercased searchable text, natural sort key)
+
+    def set_sort(self, sort_field, reverse):
+        if sort_field not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field: {sort_field}")
+        self.sort_field = sort_field
+        self.reverse = reverse
+
+    def set_filter(self, text='', category=None, status=None):
+        self.text = text.strip().lower()
+        self.category = category or None
+        self.status = status or None
+
+    def categories(self):
+        return sorted({record['category'] for record in self.index.books.values()}, key=str.lower)
+
+    def statuses(self):
+        return sorted({record['status'] for record in self.index.books.values()}, key=str.lower)
+
+    def _derived_values(self, record):
+        """Per-record values that are costly to recompute on every sort."""
+        cached = self._derived.get(record['key'])
+        if cached is None or cached[0] is not record:
+            text = ' '.join((record['book'], record['title'], record['category'], record['status'])).lower()
+            cached = (record, text, natural_sort_key(record['book']))
+            self._derived[record['key']] = cached
+        return cached
+
+    def _matches(self, record):
+        if self.category is not None and record['category'] != self.category:
+            return False
+        if self.status is not None and record['status'] != self.status:
+            return False
+        return not self.text or self.text in self._derived_values(record)[1]
+
+    def _sort_key(self):
+        field = self.sort_field
+        if field == 'key':
+            return lambda item: self._derived_values(item[1])[2]
+        if field == 'epub_mtime':
+            return lambda item: item[1]['epub_mtime'] or 0
+        if field in ('title', 'category', 'status'):
+            return lambda item: item[1][field].lower()
+        return lambda item: item[0]  # 'added': books.ini order
+
+    def visible(self):
+        """Books passing the filter, in display order."""
+        return self._in_display_order(self._matches)
+
+    def all_books(self):
+        """Every book, including those the filter hides, in display order."""
+        return self._in_display_order(lambda record: True)
+
+    def _in_display_order(self, include):
+        records = [(position, record) for position, record in enumerate(self.index.records())
+                   if include(record)]
+        if self.sort_field != 'added':
+            # Stable sorts: ties keep books.ini order
+            records.sort(key=lambda item: item[0], reverse=self.reverse)
+        records.sort(key=self._sort_key(), reverse=self.reverse)
+        return [record['key'] for _, record in records]
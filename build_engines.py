@@ -0,0 +1,396 @@
+"""Build engines: how a 'build' or 'clean' job turns a book into its EPUB.
+
+``PhpEngine`` runs the shelf's ``build.php`` in a subprocess, as the app
+always has.  ``NativeEngine`` assembles ``<book>.epub`` in Python with
+ebooklib, from the ``chapters/`` files in natural-sort order, the files in
+``media/`` and the book's books.ini section.  It needs no PHP, and books
+are built in a long-lived process pool, so after the first build there is
+no interpreter start-up per book.  Output lines stream back to the job
+through a ``multiprocessing.Manager`` queue.
+
+Both engines hand ``JobRunner.submit`` a ``cmd``.  For PHP it is an argv
+list.  For the native engine it is a callable, which the runner calls on
+the job's worker thread with an output callback and a cancellation check.
+
+``select_engine`` resolves the 'auto' setting: PHP when ``php`` and
+``build.php`` are there, otherwise native.
+"""
+import concurrent.futures
+import html
+import importlib.util
+import logging
+import mimetypes
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import threading
+import uuid
+from urllib.parse import unquote, urlsplit
+
+import bookshelf
+import tracing
+
+log = logging.getLogger('book_builder.build_engines')
+
+AUTO = 'auto'
+PHP = 'php'
+NATIVE = 'native'
+ENGINE_CHOICES = (AUTO, PHP, NATIVE)
+OUTPUT_POLL_SECONDS = 0.1
+MARKDOWN_EXTENSIONS = ('.md', '.markdown', '.txt')
+HTML_EXTENSIONS = ('.html', '.xhtml', '.htm')
+BULLET_RE = re.compile(r'^\s*[-*+]\s+')
+NUMBERED_RE = re.compile(r'^\s*\d+[.)]\s+')
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*$')
+RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+INLINE_RE = re.compile(r'`([^`]+)`|!\[([^\]]*)\]\(([^)\s]+)\)|\[([^\]]+)\]\(([^)\s]+)\)')
+STRONG_RE = re.compile(r'(?<!\*)\*\*(?=\S)(.+?)(?<=\S)\*\*(?!\*)|(?<!\w)__(?=\S)(.+?)(?<=\S)__(?!\w)')
+MEDIA_REF_RE = re.compile(r'(\s(?:src|href|xlink:href)\s*=\s*)(["\'])([^"\']*)\2', re.IGNORECASE)
+EM_RE = re.compile(r'(?<!\*)\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?!\*)|(?<!\w)_(?=[^\s_])(.+?)(?<=[^\s_])_(?!\w)')
+
+
+def describe_command(cmd):
+    return ' '.join(cmd) if isinstance(cmd, (list, tuple)) else str(cmd)
+
+
+class PhpEngine:
+    name = PHP
+
+    def problem(self, base_path):
+        """Why this engine can't build books on this shelf, or None."""
+        script = bookshelf.build_script_path(base_path)
+        if not os.path.isfile(script):
+            return f"build.php not found at {script}"
+        if shutil.which('php') is None:
+            return "php is not installed or not on PATH"
+        return None
+
+    def command(self, base_path, command, book):
+        return bookshelf.build_command(base_path, command, book)
+
+    def shutdown(self):
+        pass
+
+
+class NativeCommand:
+    """A native build or clean, run in the engine's pool when the job runner calls it."""
+
+    def __init__(self, engine, base_path, command, book):
+        self.engine = engine
+        self.base_path = base_path
+        self.command = command
+        self.book = book
+
+    def __str__(self):
+        return f"native {self.command} {self.book}"
+
+    def __call__(self, emit, cancelled):
+        """Run in the pool, passing output lines to emit; returns the exit status."""
+        pool, manager = self.engine.resources()
+        output = manager.Queue()
+        cancel = manager.Event()
+        future = pool.submit(run_native, self.base_path, self.command, self.book, output, cancel)
+        while True:
+            try:
+                line = output.get(timeout=OUTPUT_POLL_SECONDS)
+            except queue.Empty:
+                if cancelled() and not cancel.is_set():
+                    cancel.set()
+                if future.done() and output.empty():
+                    break  # The worker died before sending its end marker
+                continue
+            if line is None:
+                break
+            emit(line)
+        return future.result()
+
+
+class NativeEngine:
+    name = NATIVE
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 2
+        self._pool = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    def problem(self, base_path):
+        if importlib.util.find_spec('ebooklib') is None:
+            return "ebooklib is not installed"
+        return None
+
+    def command(self, base_path, command, book):
+        if command not in ('build', 'clean'):
+            raise ValueError(f"Unknown command: {command}")
+        return NativeCommand(self, base_path, command, book)
+
+    def resources(self):
+        """The process pool and Manager, started on first use and then kept."""
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: builds are started from threads of a Tk process
+                context = multiprocessing.get_context('spawn')
+                with tracing.span('build.pool_start', workers=self.workers):
+                    self._manager = context.Manager()
+                    self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool, self._manager
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._manager.shutdown()
+                self._pool = self._manager = None
+
+
+def make_engines(workers=None):
+    return {PHP: PhpEngine(), NATIVE: NativeEngine(workers)}
+
+
+def select_engine(engines, name, base_path):
+    """The engine for a setting of 'php', 'native' or 'auto' (PHP if usable, else native)."""
+    if name == AUTO:
+        return engines[PHP] if engines[PHP].problem(base_path) is None else engines[NATIVE]
+    return engines[name]
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+def run_native(base_path, command, book, output, cancel):
+    """Pool worker entry point; puts output lines, then None, on output."""
+    emit = output.put
+    try:
+        if command == 'clean':
+            return clean_epub(base_path, book, emit)
+        return build_epub(base_path, book, emit, cancel.is_set)
+    except BuildCancelled:
+        emit(f"Cancelled {book}")
+        return 1
+    except Exception as e:
+        emit(f"[ERROR] {type(e).__name__}: {e}")
+        return 1
+    finally:
+        emit(None)
+
+
+def clean_epub(base_path, book, emit):
+    path = bookshelf.epub_path(base_path, book)
+    try:
+        os.remove(path)
+        emit(f"Removed {path}")
+    except FileNotFoundError:
+        emit(f"Nothing to clean for {book}")
+    return 0
+
+
+def emphasis(text):
+    """Strong and emphasis in already-escaped text that has no tags yet.
+
+    ``_`` only counts at word boundaries, so snake_case names stay as
+    they are; ``*`` needs non-space text just inside each marker.
+    """
+    text = STRONG_RE.sub(lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", text)
+    return EM_RE.sub(lambda m: f"<em>{m.group(1) or m.group(2)}</em>", text)
+
+
+def inline_markdown(text):
+    """Code spans, images, links and emphasis in one line of chapter text.
+
+    Code, images and links are cut out first, so emphasis is never
+    applied inside a tag, an attribute or a code span.
+    """
+    parts = []
+    position = 0
+    for match in INLINE_RE.finditer(text):
+        parts.append(emphasis(html.escape(text[position:match.start()], quote=False)))
+        code, alt, src, label, href = match.groups()
+        if code is not None:
+            parts.append(f"<code>{html.escape(code, quote=False)}</code>")
+        elif src is not None:
+            parts.append(f'<img alt="{html.escape(alt)}" src="{html.escape(src)}"/>')
+        else:
+            parts.append(f'<a href="{html.escape(href)}">{emphasis(html.escape(label, quote=False))}</a>')
+        position = match.end()
+    parts.append(emphasis(html.escape(text[position:], quote=False)))
+    return "".join(parts)
+
+
+def markdown_blocks(text):
+    """Lists of lines separated by blank lines; an ATX heading line is always a block of its own."""
+    blocks = []
+    current = []
+    for line in text.strip().splitlines():
+        line = line.rstrip()
+        heading = HEADING_RE.match(line)
+        if line.strip() and not heading:
+            current.append(line)
+            continue
+        if current:
+            blocks.append(current)
+            current = []
+        if heading:
+            blocks.append([line])
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def markdown_to_html(text):
+    """Chapter Markdown as XHTML, with python-markdown if installed.
+
+    The fallback covers what chapters use: headings, paragraphs, lists,
+    block quotes, rules, emphasis, code, links and images.
+    """
+    try:
+        import markdown
+    except ImportError:
+        pass
+    else:
+        return markdown.markdown(text, output_format='xhtml')
+    parts = []
+    for lines in markdown_blocks(text):
+        heading = HEADING_RE.match(lines[0])
+        if heading:
+            level = len(heading.group(1))
+            parts.append(f"<h{level}>{inline_markdown(heading.group(2))}</h{level}>")
+        elif len(lines) == 1 and RULE_RE.match(lines[0]):
+            parts.append("<hr/>")
+        elif all(BULLET_RE.match(line) for line in lines):
+            items = "".join(f"<li>{inline_markdown(BULLET_RE.sub('', line))}</li>" for line in lines)
+            parts.append(f"<ul>{items}</ul>")
+        elif all(NUMBERED_RE.match(line) for line in lines):
+            items = "".join(f"<li>{inline_markdown(NUMBERED_RE.sub('', line))}</li>" for line in lines)
+            parts.append(f"<ol>{items}</ol>")
+        elif all(line.startswith('>') for line in lines):
+            quoted = " ".join(line.lstrip('>').strip() for line in lines)
+            parts.append(f"<blockquote><p>{inline_markdown(quoted)}</p></blockquote>")
+        else:
+            parts.append(f"<p>{inline_markdown(' '.join(line.strip() for line in lines))}</p>")
+    return "\n".join(parts)
+
+
+def chapter_body(path):
+    """(title or None, XHTML body) for a chapter file, or None if it isn't text."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in MARKDOWN_EXTENSIONS + HTML_EXTENSIONS:
+        return None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    if extension in MARKDOWN_EXTENSIONS:
+        heading = re.search(r'^#{1,2}\s+(.+?)\s*#*$', text, re.MULTILINE)
+        return (heading.group(1).strip() if heading else None), markdown_to_html(text)
+    body = re.search(r'<body[^>]*>(.*)</body>', text, re.DOTALL | re.IGNORECASE)
+    heading = re.search(r'<h[12][^>]*>(.*?)</h[12]>', text, re.DOTALL | re.IGNORECASE)
+    title = html.unescape(re.sub(r'<[^>]+>', '', heading.group(1))).strip() if heading else None
+    return title, body.group(1) if body else text
+
+
+def rewrite_media_refs(body, media_paths):
+    """Point a chapter's references to its book's media at where they are in the EPUB.
+
+    Chapter sources refer to media the way build.php resolves them, as
+    ``media/NAME`` or a bare ``NAME``; in the EPUB the chapters are one
+    directory down from ``media/``.  ``media_paths`` maps each media file
+    name to its path in the EPUB.  Other references are left alone.
+    """
+    def rewrite(match):
+        prefix, quote, ref = match.groups()
+        parts = urlsplit(ref)
+        if parts.scheme or parts.netloc or not parts.path or parts.path.startswith('/'):
+            return match.group(0)
+        path = unquote(parts.path)
+        if path.startswith('./'):
+            path = path[2:]
+        name = path[len('media/'):] if path.startswith('media/') else path
+        target = media_paths.get(name)
+        if target is None:
+            return match.group(0)
+        fragment = f"#{parts.fragment}" if parts.fragment else ''
+        return f"{prefix}{quote}../{html.escape(target)}{fragment}{quote}"
+    return MEDIA_REF_RE.sub(rewrite, body)
+
+
+def build_epub(base_path, book, emit, cancelled=lambda: False):
+    """Write bookshelf/<book>/<book>.epub from its chapters, media and books.ini section."""
+    from ebooklib import epub
+
+    section = bookshelf.parse_books_ini(base_path).get(book)
+    if section is None:
+        emit(f"[ERROR] {book} is not in books.ini")
+        return 1
+    fields = dict(section)
+    title = fields.get('book[title]', book)
+    language = fields.get('book[language]', 'en')
+    emit(f"Building {book}")
+
+    document = epub.EpubBook()
+    document.set_identifier(fields.get('book[isbn]') or f"urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, book)}")
+    document.set_title(title)
+    document.set_language(language)
+    if fields.get('book[author]'):
+        document.add_author(fields['book[author]'])
+    if fields.get('book[subtitle]'):
+        document.add_metadata('DC', 'description', fields['book[subtitle]'])
+
+    directory = bookshelf.book_dir(base_path, book)
+    spine = ['nav']
+    cover = bookshelf.cover_path(base_path, book)
+    media_dir = os.path.join(directory, 'media')
+    media_paths = {}  # Media file name -> its path in the EPUB, for rewrite_media_refs
+    if os.path.isdir(media_dir):
+        for name in sorted(os.listdir(media_dir), key=bookshelf.natural_sort_key):
+            path = os.path.join(media_dir, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                content = f.read()
+            if path == cover:
+                media_paths[name] = 'media/cover' + os.path.splitext(name)[1].lower()
+                document.set_cover(media_paths[name], content)
+                spine.insert(0, 'cover')
+                continue
+            media_paths[name] = f"media/{name}"
+            media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            document.add_item(epub.EpubItem(uid=f"media-{len(document.items)}", file_name=f"media/{name}",
+                                            media_type=media_type, content=content))
+
+    chapters = []
+    for number, filename in enumerate(bookshelf.list_chapter_files(base_path, book), 1):
+        if filename in bookshelf.CHAPTER_PLACEHOLDERS:
+            emit(f"[ERROR] {filename}")
+            return 1
+        if cancelled():
+            raise BuildCancelled()
+        parsed = chapter_body(bookshelf.chapter_path(base_path, book, filename))
+        if parsed is None:
+            emit(f"Skipping {filename}: not a Markdown or HTML file")
+            continue
+        chapter_title, body = parsed
+        chapter = epub.EpubHtml(title=chapter_title or os.path.splitext(filename)[0],
+                                file_name=f"chapters/chapter-{number:03d}.xhtml", lang=language)
+        chapter.content = rewrite_media_refs(body, media_paths)  # Chapters are in chapters/
+        document.add_item(chapter)
+        chapters.append(chapter)
+        emit(f"Added {filename}")
+    if not chapters:
+        emit("[ERROR] No chapters to build")
+        return 1
+
+    document.toc = chapters
+    document.add_item(epub.EpubNcx())
+    document.add_item(epub.EpubNav())
+    document.spine = spine + chapters
+    path = bookshelf.epub_path(base_path, book)
+    tmp_path = path + '.tmp'
+    try:
+        epub.write_epub(tmp_path, document)
+        os.replace(tmp_path, path)  # Previewers never see a half-written EPUB
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    emit(f"Done {book}: {len(chapters)} chapters, {os.path.getsize(path) // 1024} KB")
+    return 0
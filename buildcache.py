@@ -0,0 +1,126 @@
+"""Content-hash manifests for incremental builds.
+
+After a successful build a manifest is written next to the EPUB
+(``bookshelf/<book>/<book>.epub.manifest.json``) recording the hash of every
+file under ``chapters/`` and ``media/`` plus the book's ``books.ini``
+section.  A later build whose inputs hash the same is skipped.
+
+File hashes are reused from the previous manifest when a file's size and
+mtime are unchanged, so checking an untouched book only costs a few stats.
+"""
+import hashlib
+import json
+import os
+
+import tracing
+from bookshelf import atomic_write, book_dir, epub_path
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+SOURCE_DIRS = ('chapters', 'media')
+
+
+def manifest_path(base_path, book):
+    return epub_path(base_path, book) + '.manifest.json'
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_section(section):
+    """Hash a books.ini section independently of key order."""
+    items = sorted((key, str(value)) for key, value in dict(section).items())
+    return hashlib.sha256(json.dumps(items).encode('utf-8')).hexdigest()
+
+
+def hash_tree(root, previous=None):
+    """Map each file under root (relative path) to its size, mtime and sha256."""
+    previous = previous or {}
+    entries = {}
+    if not os.path.isdir(root):
+        return entries
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            st = os.stat(path)
+            old = previous.get(rel)
+            if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+                sha256 = old['sha256']
+            else:
+                sha256 = hash_file(path)
+            entries[rel] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': sha256}
+    return entries
+
+
+def load_manifest(base_path, book):
+    try:
+        with open(manifest_path(base_path, book), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(base_path, book, manifest):
+    atomic_write(manifest_path(base_path, book), json.dumps(manifest, indent=1, sort_keys=True))
+
+
+def compute_manifest(base_path, book, section, previous=None):
+    directory = book_dir(base_path, book)
+    manifest = {'version': MANIFEST_VERSION, 'ini': hash_section(section)}
+    for name in SOURCE_DIRS:
+        old = previous.get(name) if previous else None
+        manifest[name] = hash_tree(os.path.join(directory, name), old)
+    return manifest
+
+
+def same_sources(a, b):
+    """True when two manifests describe identical inputs (ignoring stat data)."""
+    if a is None or b is None or a.get('ini') != b.get('ini'):
+        return False
+    for name in SOURCE_DIRS:
+        hashes_a = {rel: entry['sha256'] for rel, entry in a.get(name, {}).items()}
+        hashes_b = {rel: entry['sha256'] for rel, entry in b.get(name, {}).items()}
+        if hashes_a != hashes_b:
+            return False
+    return True
+
+
+class IncrementalBuild:
+    """Up-to-date check and manifest bookkeeping for one book build.
+
+    ``skip_reason`` and ``record`` are meant to run on the job's worker
+    thread, before and after the build command respectively.
+    """
+
+    def __init__(self, base_path, book, section, force=False):
+        self.base_path = base_path
+        self.book = book
+        self.section = dict(section)
+        self.force = force
+        self.manifest = None
+
+    def skip_reason(self):
+        with tracing.span('build.manifest', book=self.book):
+            previous = load_manifest(self.base_path, self.book)
+            self.manifest = compute_manifest(self.base_path, self.book, self.section, previous)
+        if self.force:
+            return None
+        if not os.path.isfile(epub_path(self.base_path, self.book)):
+            return None
+        if same_sources(previous, self.manifest):
+            return "Up to date: sources unchanged since the last build"
+        return None
+
+    def record(self):
+        if self.manifest is not None:
+            save_manifest(self.base_path, self.book, self.manifest)
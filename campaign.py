@@ -0,0 +1,160 @@
+"""Bulk promotion campaigns: many books, one review, rate-limited sends.
+
+A campaign turns a set of books into tweet and Instagram posts using the
+same text as the single-book buttons (``social.tweet_payload`` and
+``social.instagram_payload``), spreads them over a time window and
+enqueues them on the shelf's PostQueue.  Each platform has a token
+bucket; a handler that finds its bucket empty raises ``Deferred`` so the
+job waits without using up a retry or blocking a worker that could be
+posting to the other platform.
+"""
+import logging
+import threading
+import time
+
+import bookshelf
+import epub_meta
+import social
+from post_queue import Deferred, DONE, FAILED, PENDING, RUNNING
+
+log = logging.getLogger('book_builder.campaign')
+
+# Posts per period per platform.  Twitter allows 100 tweet creations per
+# 15 minutes per user; Instagram has no published limit for this API, so
+# stay well clear of the automated-behaviour checks.
+DEFAULT_RATE_LIMITS = {
+    'twitter': {'posts': 100, 'period': 15 * 60, 'burst': 5},
+    'instagram': {'posts': 6, 'period': 60 * 60, 'burst': 1},
+}
+PLATFORM_FOR_KIND = {
+    social.TWEET: 'twitter',
+    social.TWEET_REPLY: 'twitter',
+    social.INSTAGRAM: 'instagram',
+}
+DEFAULT_WINDOW_HOURS = 2.0
+DEFAULT_POST_WORKERS = 4
+
+
+class TokenBucket:
+    """Allow ``rate`` posts per second on average with bursts of ``capacity``."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token; return 0 on success or the seconds until one is available."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+def make_limiters(rate_limits=None):
+    """A TokenBucket per platform; each configured limit is merged over that platform's default."""
+    limits = {platform: dict(limit) for platform, limit in DEFAULT_RATE_LIMITS.items()}
+    for platform, limit in (rate_limits or {}).items():
+        limits.setdefault(platform, {}).update(limit)
+    return {
+        platform: TokenBucket(limit['posts'] / limit['period'], limit.get('burst', 1))
+        for platform, limit in limits.items()
+    }
+
+
+def rate_limited(handlers, limiters):
+    """Wrap PostQueue handlers so each call first takes a token for its platform."""
+    def wrap(kind, handler):
+        limiter = limiters.get(PLATFORM_FOR_KIND.get(kind))
+        if limiter is None:
+            return handler
+
+        def limited(job, post_queue):
+            wait = limiter.try_acquire()
+            if wait:
+                raise Deferred(wait, f"{PLATFORM_FOR_KIND[kind]} rate limit")
+            return handler(job, post_queue)
+        return limited
+    return {kind: wrap(kind, handler) for kind, handler in handlers.items()}
+
+
+def plan_posts(index, books, platforms):
+    """One entry per (book, platform) with its payload or the reason it can't be posted.
+
+    ``books`` are index keys; each entry has the book's ``key`` and its
+    name as ``book``.  Reads EPUB metadata, so call it off the Tk thread.
+    """
+    posts = []
+    for key in books:
+        record = index.get(key)
+        if record is None:
+            continue
+        book, base_path = record['book'], record['base_path']
+        metadata = {}
+        if record['has_epub']:
+            try:
+                metadata = epub_meta.read_epub_metadata(bookshelf.epub_path(base_path, book))
+            except Exception as e:
+                log.warning("Cannot read EPUB metadata for %s: %s", book, e)
+        author = epub_meta.first(metadata, 'creator')
+        for kind in platforms:
+            if kind == social.TWEET:
+                problem = social.tweet_problem(record)
+                payload = None if problem else social.tweet_payload(base_path, record, author)
+                text = payload and payload['text'] + "\n\n" + payload['reply_text']
+            else:
+                problem = social.instagram_problem(record)
+                payload = None if problem else social.instagram_payload(
+                    base_path, record, epub_meta.first(metadata, 'title'), author
+                )
+                text = payload and payload['caption']
+            posts.append({
+                'key': key,
+                'book': book,
+                'kind': kind,
+                'payload': payload,
+                'text': text or '',
+                'problem': problem[1] if problem else None,
+            })
+    return posts
+
+
+def schedule_delays(posts, window_seconds):
+    """Spread each platform's posts evenly over the window; returns delays in post order."""
+    counts = {}
+    for post in posts:
+        counts[post['kind']] = counts.get(post['kind'], 0) + 1
+    seen = {}
+    delays = []
+    for post in posts:
+        i = seen.get(post['kind'], 0)
+        seen[post['kind']] = i + 1
+        delays.append(window_seconds * i / counts[post['kind']])
+    return delays
+
+
+def campaign_jobs(post_queue, campaign_id):
+    return post_queue.jobs(campaign=campaign_id)
+
+
+def summarize(jobs, started_at, now=None):
+    """Counts per status, completed posts per hour and the failures of a campaign."""
+    now = time.time() if now is None else now
+    counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+    for job in jobs:
+        counts[job['status']] = counts.get(job['status'], 0) + 1
+    elapsed = max(now - started_at, 1.0)
+    return {
+        'counts': counts,
+        'total': len(jobs),
+        'per_hour': counts[DONE] * 3600 / elapsed,
+        'elapsed': elapsed,
+        'failures': [(job['book'], job['kind'], job['last_error']) for job in jobs if job['status'] == FAILED],
+    }
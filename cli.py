@@ -0,0 +1,340 @@
+"""Headless command line for build servers: build, clean, post and list books.
+
+Usage:
+    python main.py cli build  SHELF [BOOK ...] [--jobs N] [--status S] [--category C] [--force]
+                              [--engine auto|php|native]
+    python main.py cli clean  SHELF [BOOK ...] [--jobs N] [--status S] [--category C]
+    python main.py cli post   SHELF [BOOK ...] --platform twitter|instagram [--window HOURS] [--no-wait]
+                              [--repost-window DAYS]
+    python main.py cli list   SHELF [--status S] [--category C]
+    python main.py cli history SHELF [BOOK ...] [--since DAYS]
+    python main.py cli stats  SHELF [BOOK ...] [--status S] [--category C] [--chapters]
+    python main.py cli verify SHELF [BOOK ...] [--jobs N] [--status S] [--category C]
+
+(``python cli.py ...`` works the same.)  Nothing here imports tkinter.
+Results go to stdout as JSON lines, one per book and a final summary, with
+per-book timings; logging goes to stderr.  Every EPUB a build writes is
+checked with epub_verify.  The exit status is 1 if any book failed to
+build or failed its EPUB check.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+import bookshelf
+import build_engines
+import campaign
+import epub_verify
+import post_history
+import social
+import tracing
+from bookshelf import ShelfIndex, validate_book_dir
+from buildcache import IncrementalBuild
+from jobs import JobRunner, SUCCEEDED, FAILED, CANCELLED, SKIPPED
+from manuscript_stats import ShelfStats, reading_minutes
+from post_history import PostHistory
+from post_queue import PostQueue, DONE
+
+log = logging.getLogger('book_builder.cli')
+
+POST_QUEUE_FILE = 'posts.sqlite3'
+PLATFORM_KINDS = {'twitter': social.TWEET, 'instagram': social.INSTAGRAM}
+FAILED_OUTPUT_LINES = 20  # Tail of a failed build's output included in its JSON line
+
+
+class JsonLines:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def emit(self, event, **fields):
+        self.stream.write(json.dumps(dict(event=event, **fields), ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+def select_books(index, books=None, statuses=None, categories=None):
+    """Books in ini order, narrowed to the named books and status/category filters."""
+    wanted = set(books or ())
+    statuses = {s.lower() for s in statuses or ()}
+    categories = {c.lower() for c in categories or ()}
+    selected = []
+    for record in index.records():
+        if wanted and record['book'] not in wanted:
+            continue
+        if statuses and record['status'].lower() not in statuses:
+            continue
+        if categories and record['category'].lower() not in categories:
+            continue
+        selected.append(record['book'])
+    return selected
+
+
+def run_jobs(args, index, books, out):
+    base_path = args.shelf
+    work_dir = os.path.join(base_path, 'bookshelf')
+    engines = build_engines.make_engines(workers=args.jobs)
+    engine = build_engines.select_engine(engines, args.engine, base_path)
+    problem = engine.problem(base_path)
+    if problem:
+        raise SystemExit(f"Cannot {args.command} with the {engine.name} engine: {problem}")
+    log.debug("Using the %s build engine", engine.name)
+
+    runner = JobRunner(max_workers=args.jobs)
+    verify_cache = epub_verify.VerifyCache.load(base_path)
+    started = time.monotonic()
+    pending = set()
+    skipped = 0
+    invalid = 0
+    for book in books:
+        record = index.get(book)
+        if args.command == 'build' and record['status'].lower() == 'published':
+            out.emit('job', command=args.command, book=book, status='skipped', reason='published', duration=0.0)
+            skipped += 1
+            continue
+        skip_if = on_success = None
+        if args.command == 'build':
+            incremental = IncrementalBuild(base_path, book, record['fields'], force=args.force)
+            skip_if = incremental.skip_reason
+            on_success = epub_verify.verified(verify_cache, book, incremental.record)
+        cmd = engine.command(base_path, args.command, book)
+        pending.add(runner.submit(args.command, book, cmd, work_dir, skip_if=skip_if, on_success=on_success).id)
+
+    counts = {SUCCEEDED: 0, SKIPPED: skipped, FAILED: 0, CANCELLED: 0}
+    job_time = 0.0
+    try:
+        while pending:
+            event = runner.events.get()
+            job = event[1]
+            if event[0] == 'output' and args.verbose:
+                log.info("[%s] %s", job.book, event[2])
+            if event[0] != 'finished':
+                continue
+            pending.discard(job.id)
+            counts[job.status] += 1
+            job_time += job.duration
+            fields = dict(command=job.command, book=job.book, status=job.status,
+                          returncode=job.returncode, duration=round(job.duration, 3))
+            if job.error:
+                fields['error'] = job.error
+            if job.status == SKIPPED and job.output:
+                fields['reason'] = job.output[-1]
+            elif job.status == FAILED:
+                fields['output'] = job.output[-FAILED_OUTPUT_LINES:]
+            if job.command == 'build' and job.status == SUCCEEDED:
+                stamp = epub_verify.epub_stamp(bookshelf.epub_path(base_path, job.book))
+                fields['verify'] = verify_cache.get(job.book, stamp)
+                invalid += bool(fields['verify'])
+            out.emit('job', **fields)
+    except KeyboardInterrupt:
+        runner.cancel_all()
+        raise
+    finally:
+        engine.shutdown()
+
+    out.emit('summary', command=args.command, books=len(books), jobs=args.jobs, engine=engine.name,
+             wall_time=round(time.monotonic() - started, 3), job_time=round(job_time, 3), invalid=invalid, **counts)
+    return 1 if counts[FAILED] or invalid else 0
+
+
+def run_posts(args, index, books, out):
+    base_path = args.shelf
+    kinds = [PLATFORM_KINDS[platform] for platform in args.platform]
+    db_path = os.path.join(bookshelf.cache_dir(base_path), POST_QUEUE_FILE)
+    history = PostHistory(db_path)
+    history.import_tweet_logs(base_path)
+    handlers = campaign.rate_limited(social.make_handlers(social.SocialClients()), campaign.make_limiters())
+    post_queue = PostQueue(db_path, post_history.recorded(handlers, history), workers=args.jobs)
+
+    started = time.time()
+    planned = campaign.plan_posts(index, books, kinds)
+    since = started - args.repost_window * 86400
+    for post in planned:
+        if not post['problem'] and args.repost_window > 0:
+            reposted_at = history.last_posted_text(
+                campaign.PLATFORM_FOR_KIND[post['kind']], post_history.post_text(post['payload']), since
+            )
+            if reposted_at is not None:
+                post['problem'] = f"same text posted {iso_time(reposted_at)}"
+    ready = [post for post in planned if not post['problem']]
+    outstanding = set()
+    for post in planned:
+        if post['problem']:
+            out.emit('post', book=post['book'], kind=post['kind'], status='skipped', reason=post['problem'])
+    for post, delay in zip(ready, campaign.schedule_delays(ready, args.window * 3600)):
+        text = post['payload'].get('text') or post['payload']['caption']
+        job_id, created = post_queue.enqueue(
+            post['kind'], post['book'], post['payload'],
+            social.idempotency_key(post['kind'], post['book'], text), delay=delay
+        )
+        if created:
+            outstanding.add(job_id)
+            out.emit('post', book=post['book'], kind=post['kind'], status='queued', job_id=job_id, delay=round(delay, 1))
+        else:
+            out.emit('post', book=post['book'], kind=post['kind'], status='duplicate', job_id=job_id,
+                     reason=f"already queued today ({post_queue.get(job_id)['status']})")
+
+    failed = 0
+    if not args.no_wait and outstanding:
+        post_queue.start()
+        try:
+            while outstanding:
+                try:
+                    event = post_queue.events.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                job = event[1]
+                if job['id'] not in outstanding or event[0] == 'retry':
+                    continue
+                outstanding.discard(job['id'])
+                fields = dict(book=job['book'], kind=job['kind'], status=job['status'], job_id=job['id'],
+                              attempts=job['attempts'], duration=round(job['updated_at'] - job['created_at'], 3))
+                if job['status'] == DONE and job['result'].get('reply_job_id'):
+                    outstanding.add(job['result']['reply_job_id'])
+                if event[0] == 'failed':
+                    fields['error'] = event[2]
+                    failed += 1
+                out.emit('post', **fields)
+        finally:
+            post_queue.stop()
+
+    out.emit('summary', command='post', books=len(books), queued=len(ready), failed=failed,
+             waited=not args.no_wait, wall_time=round(time.time() - started, 3))
+    return 1 if failed else 0
+
+
+def iso_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+
+
+def run_history(args, index, books, out):
+    db_path = os.path.join(bookshelf.cache_dir(args.shelf), POST_QUEUE_FILE)
+    history = PostHistory(db_path)
+    history.import_tweet_logs(args.shelf)
+    last_posted = history.last_posted()
+    since = time.time() - args.since * 86400 if args.since else None
+    for book in books:
+        posts = [
+            dict(platform=entry['platform'], kind=entry['kind'], status=entry['status'], post_id=entry['post_id'],
+                 posted_at=iso_time(entry['posted_at']), source=entry['source'], error=entry['error'])
+            for entry in history.entries(book=book, since=since)
+        ]
+        last = last_posted.get(book)
+        out.emit('history', book=book, last_promoted=iso_time(last) if last else None, posts=posts)
+    return 0
+
+
+def run_list(args, index, books, out):
+    for book in books:
+        record = index.get(book)
+        out.emit('book', book=book, title=record['title'], category=record['category'],
+                 status=record['status'], has_epub=record['has_epub'], has_cover=record['has_cover'],
+                 chapters=[c for c in record['chapters'] if c not in bookshelf.CHAPTER_PLACEHOLDERS])
+    return 0
+
+
+def run_stats(args, index, books, out):
+    started = time.monotonic()
+    stats = ShelfStats.load(args.shelf)
+    recounted = stats.update(list(index.order), workers=args.jobs)
+    stats.save()
+    by_book = stats.by_book()
+    totals = {'chapters': 0, 'words': 0, 'characters': 0}
+    for book in books:
+        chapters = by_book.get(book, [])
+        fields = dict(chapters=len(chapters), words=sum(row[1] for row in chapters),
+                      characters=sum(row[2] for row in chapters))
+        for name, value in fields.items():
+            totals[name] += value
+        if args.chapters:
+            fields['chapter_stats'] = [dict(chapter=filename, words=words, characters=characters)
+                                       for filename, words, characters in chapters]
+        out.emit('stats', book=book, reading_minutes=round(reading_minutes(fields['words']), 1), **fields)
+    out.emit('summary', command='stats', books=len(books), recounted=recounted,
+             reading_minutes=round(reading_minutes(totals['words']), 1),
+             wall_time=round(time.monotonic() - started, 3), **totals)
+    return 0
+
+
+def run_verify(args, index, books, out):
+    started = time.monotonic()
+    cache = epub_verify.VerifyCache.load(args.shelf)
+    results = cache.check_books(books, workers=args.jobs)
+    failed = 0
+    for book in books:
+        problems = results.get(book)
+        if problems is None:
+            out.emit('verify', book=book, status='no_epub')
+            continue
+        failed += bool(problems)
+        out.emit('verify', book=book, status='failed' if problems else 'passed', problems=problems)
+    out.emit('summary', command='verify', books=len(books), checked=len(results), failed=failed,
+             wall_time=round(time.monotonic() - started, 3))
+    return 1 if failed else 0
+
+
+COMMANDS = {'build': run_jobs, 'clean': run_jobs, 'post': run_posts, 'list': run_list, 'history': run_history,
+            'stats': run_stats, 'verify': run_verify}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='main.py cli', description="Headless Book Builder")
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('shelf', help="directory containing bookshelf/ and books.ini")
+    parser.add_argument('books', nargs='*', help="only these books (default: all)")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 2,
+                        help="parallel build/clean jobs or post workers (default: CPU count)")
+    parser.add_argument('--status', action='append', help="only books with this status (repeatable)")
+    parser.add_argument('--category', action='append', help="only books in this category (repeatable)")
+    parser.add_argument('--force', action='store_true', help="build even if the sources are unchanged")
+    parser.add_argument('--engine', choices=build_engines.ENGINE_CHOICES,
+                        default=os.getenv('BOOK_BUILDER_ENGINE', build_engines.AUTO),
+                        help="build.php, the built-in ebooklib builder, or php when available (default: auto)")
+    parser.add_argument('--platform', action='append', choices=sorted(PLATFORM_KINDS),
+                        help="post: where to post (repeatable)")
+    parser.add_argument('--window', type=float, default=0.0, metavar='HOURS',
+                        help="post: spread posts over this many hours")
+    parser.add_argument('--no-wait', action='store_true',
+                        help="post: only queue the posts; the app or a later run sends them")
+    parser.add_argument('--repost-window', type=float, default=post_history.DEFAULT_REPOST_WINDOW_DAYS,
+                        metavar='DAYS', help="post: skip text already posted in the last DAYS days (0: never skip)")
+    parser.add_argument('--since', type=float, metavar='DAYS', help="history: only posts from the last DAYS days")
+    parser.add_argument('--chapters', action='store_true', help="stats: include per-chapter counts")
+    parser.add_argument('--verbose', '-v', action='store_true', help="stream build output to stderr")
+    parser.add_argument('--log-level', default=os.getenv('BOOK_BUILDER_LOG_LEVEL', 'INFO'),
+                        help="DEBUG, INFO, WARNING or ERROR for the stderr log")
+    parser.add_argument('--trace', metavar='FILE', help="write timing spans to FILE as a Chrome trace")
+    args = parser.parse_args(argv)
+    if args.command == 'post' and not args.platform:
+        parser.error("post needs at least one --platform")
+    args.jobs = max(1, args.jobs)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not validate_book_dir(args.shelf):
+        print(f"{args.shelf}: directory must contain 'bookshelf/' and 'books.ini'", file=sys.stderr)
+        return 2
+    load_dotenv()
+    tracing.configure_logging(args.log_level)  # Logs go to stderr; stdout is only JSON lines
+    if args.trace:
+        tracing.enable(args.trace)
+    out = JsonLines(sys.stdout)
+    index = ShelfIndex.load(args.shelf)
+    index.refresh()
+    index.save()
+    books = select_books(index, args.books, args.status, args.category)
+    missing = set(args.books) - set(index.books)
+    if missing:
+        log.warning("Not in books.ini: %s", ', '.join(sorted(missing)))
+    return COMMANDS[args.command](args, index, books, out)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
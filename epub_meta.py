@@ -0,0 +1,86 @@
+"""Fast EPUB metadata reader.
+
+``epub.read_epub`` loads and parses every item in the archive.  To show or
+post a book's title and author we only need the OPF ``<metadata>`` block,
+so this opens the zip, follows ``META-INF/container.xml`` to the OPF and
+stream-parses it until ``</metadata>``, without touching chapters, images
+or even the OPF manifest.  Results are cached per path, mtime and size.
+"""
+import os
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+import tracing
+
+CONTAINER_PATH = 'META-INF/container.xml'
+CONTAINER_NS = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+OPF_NS = '{http://www.idpf.org/2007/opf}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+METADATA_CACHE_SIZE = 1024
+
+
+def find_opf_path(zf):
+    """Return the archive path of the package document named by container.xml."""
+    root = ET.fromstring(zf.read(CONTAINER_PATH))
+    rootfile = root.find(f'{CONTAINER_NS}rootfiles/{CONTAINER_NS}rootfile')
+    if rootfile is None or not rootfile.get('full-path'):
+        raise ValueError("container.xml has no rootfile")
+    return rootfile.get('full-path')
+
+
+def parse_opf_metadata(stream):
+    """Collect Dublin Core fields from an OPF stream, stopping after <metadata>.
+
+    Returns a dict of lists keyed by DC element name (title, creator, ...),
+    plus 'meta' with the OPF <meta> name/property values.
+    """
+    metadata = {'meta': {}}
+    for event, elem in ET.iterparse(stream, events=('end',)):
+        if elem.tag.startswith(DC_NS):
+            name = elem.tag[len(DC_NS):]
+            text = (elem.text or '').strip()
+            if text:
+                metadata.setdefault(name, []).append(text)
+        elif elem.tag == f'{OPF_NS}meta':
+            key = elem.get('name') or elem.get('property')
+            value = elem.get('content') or (elem.text or '').strip()
+            if key and value:
+                metadata['meta'].setdefault(key, value)
+        elif elem.tag == f'{OPF_NS}metadata':
+            break
+    return metadata
+
+
+def read_epub_metadata_uncached(path):
+    with tracing.span('epub.metadata', path=path), zipfile.ZipFile(path) as zf:
+        opf_path = find_opf_path(zf)
+        with zf.open(opf_path) as stream:
+            metadata = parse_opf_metadata(stream)
+    metadata['opf_path'] = opf_path
+    return metadata
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def read_epub_metadata(path):
+    """Cached metadata for an EPUB, keyed by path, mtime and size."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        metadata = _cache.get(key)
+    if metadata is None:
+        metadata = read_epub_metadata_uncached(path)
+        with _cache_lock:
+            if len(_cache) >= METADATA_CACHE_SIZE:
+                _cache.clear()
+            _cache[key] = metadata
+    return metadata
+
+
+def first(metadata, name, default=None):
+    """First value of a DC field, e.g. first(meta, 'creator', 'Unknown')."""
+    values = metadata.get(name)
+    return values[0] if values else default
@@ -0,0 +1,109 @@
+"""Spine-ordered EPUB parsing for the paginated preview.
+
+``PreviewCache.load`` parses an EPUB once (call it off the Tk thread) and
+keeps the result in a small LRU keyed by path, mtime and size, so
+reopening a preview of an unchanged book is instant.  Chapter HTML is only
+decoded when a page is shown.
+"""
+import collections
+import os
+import threading
+
+import tracing
+
+PREVIEW_CACHE_SIZE = 8
+
+
+class ParsedBook:
+    def __init__(self, path, title, author, chapters):
+        self.path = path
+        self.title = title
+        self.author = author
+        self.chapters = chapters  # [(chapter title, ebooklib item)] in spine order
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def chapter_title(self, index):
+        return self.chapters[index][0]
+
+    def chapter_html(self, index):
+        item = self.chapters[index][1]
+        return item.get_content().decode('utf-8', 'replace')
+
+
+def _toc_titles(toc, titles=None):
+    """Map document hrefs (without fragments) to their table-of-contents titles."""
+    from ebooklib import epub
+
+    titles = {} if titles is None else titles
+    for entry in toc:
+        if isinstance(entry, tuple):
+            section, children = entry
+            if getattr(section, 'href', None):
+                titles.setdefault(section.href.split('#')[0], section.title)
+            _toc_titles(children, titles)
+        elif isinstance(entry, list):
+            _toc_titles(entry, titles)
+        elif isinstance(entry, (epub.Link, epub.Section)) and getattr(entry, 'href', None):
+            titles.setdefault(entry.href.split('#')[0], entry.title)
+    return titles
+
+
+def parse_epub(path):
+    from ebooklib import epub
+    import ebooklib
+
+    with tracing.span('epub.parse', path=path):
+        book_obj = epub.read_epub(path)
+    title = book_obj.get_metadata('DC', 'title')
+    author = book_obj.get_metadata('DC', 'creator')
+    toc_titles = _toc_titles(book_obj.toc)
+
+    chapters = []
+    seen = set()
+    for idref, _linear in book_obj.spine:
+        item = book_obj.get_item_with_id(idref)
+        if item is None or item.get_type() != ebooklib.ITEM_DOCUMENT:
+            continue
+        seen.add(item.get_id())
+        default_title = 'Contents' if isinstance(item, epub.EpubNav) else item.get_name()
+        chapters.append((toc_titles.get(item.get_name(), default_title), item))
+    # Documents missing from the spine still get a page, after the spine ones
+    for item in book_obj.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+        if item.get_id() not in seen and not isinstance(item, epub.EpubNav):
+            chapters.append((toc_titles.get(item.get_name(), item.get_name()), item))
+
+    return ParsedBook(
+        path,
+        title[0][0] if title else 'Unknown',
+        author[0][0] if author else 'Unknown',
+        chapters,
+    )
+
+
+class PreviewCache:
+    """Thread-safe LRU of parsed books keyed by (path, mtime, size)."""
+
+    def __init__(self, max_size=PREVIEW_CACHE_SIZE):
+        self.max_size = max_size
+        self._books = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            parsed = self._books.get(key)
+            if parsed is not None:
+                self._books.move_to_end(key)
+                return parsed
+        parsed = parse_epub(path)
+        with self._lock:
+            # Drop stale versions of the same file before inserting
+            for old_key in [k for k in self._books if k[0] == key[0]]:
+                del self._books[old_key]
+            self._books[key] = parsed
+            while len(self._books) > self.max_size:
+                self._books.popitem(last=False)
+        return parsed
@@ -0,0 +1,293 @@
+"""EPUB integrity checks that stream the archive instead of extracting it.
+
+``verify_epub`` opens the zip and follows ``META-INF/container.xml`` to
+the OPF.  It checks that every manifest item is in the archive and that
+every spine itemref names a manifest item.  Each XHTML document is parsed
+with ``iterparse`` straight from its zip entry, which checks that it is
+well-formed and collects the ``<img>`` and SVG ``<image>`` references to
+check against the archive.  Every other entry is read through once in
+chunks, so zipfile checks its CRC.
+
+Results are cached per shelf in ``bookshelf/.bookbuilder/verify.json``,
+keyed by each EPUB's mtime and size, so re-checking a shelf only opens
+EPUBs that were rebuilt.  Checking many books runs them in a process pool.
+"""
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from urllib.parse import unquote, urlsplit
+
+import tracing
+from bookshelf import CACHE_DIR_NAME, atomic_write, cache_dir, epub_path
+from epub_meta import OPF_NS, find_opf_path
+
+log = logging.getLogger('book_builder.epub_verify')
+
+VERIFY_FILE_NAME = 'verify.json'
+VERIFY_VERSION = 1
+PARALLEL_MIN_BOOKS = 50  # Below this, starting a spawn pool costs more than it saves
+READ_CHUNK_SIZE = 256 * 1024
+MAX_PROBLEMS = 50  # Per book; a badly broken EPUB would otherwise list every file
+EPUB_MIMETYPE = b'application/epub+zip'
+DOCUMENT_TYPES = ('application/xhtml+xml', 'text/html')
+XLINK_HREF = '{http://www.w3.org/1999/xlink}href'
+
+
+class EpubInvalid(Exception):
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__(f"EPUB check found {len(problems)} problem(s): " + "; ".join(problems[:3]))
+
+
+def epub_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def resolve(base_dir, href):
+    """Archive path of a relative href, without its fragment; None for external links."""
+    parts = urlsplit(href)
+    if parts.scheme or parts.netloc or not parts.path:
+        return None
+    return posixpath.normpath(posixpath.join(base_dir, unquote(parts.path)))
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_opf(stream):
+    """({item id: (href, media type)}, [spine idrefs]) from an OPF stream."""
+    manifest = {}
+    spine = []
+    for event, elem in ET.iterparse(stream, events=('end',)):
+        if elem.tag == f'{OPF_NS}item':
+            manifest[elem.get('id')] = (elem.get('href') or '', elem.get('media-type') or '')
+        elif elem.tag == f'{OPF_NS}itemref':
+            spine.append(elem.get('idref'))
+        elem.clear()
+    return manifest, spine
+
+
+def check_document(zf, name, names):
+    """Problems in one XHTML document: not well-formed, or images missing from the archive."""
+    base_dir = posixpath.dirname(name)
+    images = []
+    try:
+        with zf.open(name) as stream:
+            for event, elem in ET.iterparse(stream, events=('end',)):
+                tag = local_name(elem.tag)
+                if tag == 'img':
+                    images.append(elem.get('src'))
+                elif tag == 'image':
+                    images.append(elem.get(XLINK_HREF) or elem.get('href'))
+                elem.clear()
+    except ET.ParseError as e:
+        return [f"{name}: not well-formed ({e})"]
+    except (zipfile.BadZipFile, OSError) as e:
+        return [f"{name}: {e}"]
+    problems = []
+    for src in images:
+        if not src:
+            problems.append(f"{name}: image with no source")
+            continue
+        target = resolve(base_dir, src)
+        if target is not None and target not in names:
+            problems.append(f"{name}: image {src} is not in the archive")
+    return problems
+
+
+def read_through(zf, info):
+    with zf.open(info) as stream:
+        while stream.read(READ_CHUNK_SIZE):
+            pass
+
+
+def verify_epub(path):
+    """A list of problems with the EPUB at path; empty if it passed."""
+    with tracing.span('epub.verify', path=path):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                problems = _verify_archive(zf)
+        except (zipfile.BadZipFile, OSError) as e:
+            problems = [f"not a readable zip archive: {e}"]
+    if len(problems) > MAX_PROBLEMS:
+        problems = problems[:MAX_PROBLEMS] + [f"... and {len(problems) - MAX_PROBLEMS} more"]
+    return problems
+
+
+def _verify_archive(zf):
+    problems = []
+    infos = zf.infolist()
+    names = {info.filename for info in infos}
+    if not infos or infos[0].filename != 'mimetype':
+        problems.append("mimetype is not the first entry")
+    elif zf.read('mimetype').strip() != EPUB_MIMETYPE:
+        problems.append("mimetype is not application/epub+zip")
+
+    try:
+        opf_path = find_opf_path(zf)
+    except (KeyError, ValueError, ET.ParseError) as e:
+        return problems + [f"META-INF/container.xml: {e}"]
+    if opf_path not in names:
+        return problems + [f"{opf_path}: named by container.xml but not in the archive"]
+    try:
+        with zf.open(opf_path) as stream:
+            manifest, spine = parse_opf(stream)
+    except ET.ParseError as e:
+        return problems + [f"{opf_path}: not well-formed ({e})"]
+
+    opf_dir = posixpath.dirname(opf_path)
+    documents = []
+    for item_id, (href, media_type) in manifest.items():
+        target = resolve(opf_dir, href)
+        if target is None:
+            continue  # Remote resources aren't in the archive by design
+        if target not in names:
+            problems.append(f"manifest item {item_id}: {href} is not in the archive")
+        elif media_type in DOCUMENT_TYPES:
+            documents.append(target)
+    if not spine:
+        problems.append("the spine is empty")
+    for idref in spine:
+        if idref not in manifest:
+            problems.append(f"spine itemref {idref} is not in the manifest")
+
+    for name in documents:
+        problems.extend(check_document(zf, name, names))
+    checked = set(documents) | {opf_path}
+    for info in infos:
+        if info.filename in checked or info.is_dir():
+            continue
+        try:
+            read_through(zf, info)
+        except (zipfile.BadZipFile, OSError) as e:
+            problems.append(f"{info.filename}: {e}")
+    return problems
+
+
+def verify_book(base_path, book):
+    """(book, EPUB stamp, problems) for a book's EPUB; runs in a pool worker."""
+    path = epub_path(base_path, book)
+    stamp = epub_stamp(path)
+    return book, stamp, verify_epub(path) if stamp is not None else ["no EPUB"]
+
+
+class VerifyCache:
+    """Check results for one shelf, each valid while its EPUB's mtime and size are unchanged."""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.results = {}  # book -> {'stamp': [mtime_ns, size], 'problems': [...]}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, base_path):
+        cache = cls(base_path)
+        path = os.path.join(base_path, 'bookshelf', CACHE_DIR_NAME, VERIFY_FILE_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == VERIFY_VERSION:
+                cache.results = data['books']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Ignoring unreadable EPUB check results %s: %s", path, e)
+        return cache
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'version': VERIFY_VERSION, 'books': self.results}, indent=1)
+        try:
+            atomic_write(os.path.join(cache_dir(self.base_path), VERIFY_FILE_NAME), data)
+        except OSError as e:
+            log.warning("Failed to save EPUB check results: %s", e)
+
+    def get(self, book, stamp):
+        """Problems found in the EPUB with this stamp, or None if it hasn't been checked."""
+        with self._lock:
+            entry = self.results.get(book)
+        if entry is None or stamp is None or tuple(entry['stamp']) != tuple(stamp):
+            return None
+        return entry['problems']
+
+    def put(self, book, stamp, problems):
+        if stamp is None:
+            return
+        with self._lock:
+            self.results[book] = {'stamp': list(stamp), 'problems': list(problems)}
+
+    def check(self, book):
+        """Check a book's EPUB now, store and save the result, and return its problems."""
+        _, stamp, problems = verify_book(self.base_path, book)
+        self.put(book, stamp, problems)
+        self.save()
+        if problems:
+            log.warning("%s failed the EPUB check: %s", book, "; ".join(problems[:3]))
+        return problems
+
+    def check_books(self, books, workers=None, on_result=None):
+        """{book: problems} for books with an EPUB, only opening EPUBs not checked at their stamp.
+
+        ``on_result(book, problems)`` is called, on this thread, as each
+        EPUB that needed checking is done.
+        """
+        results = {}
+        todo = []
+        for book in books:
+            stamp = epub_stamp(epub_path(self.base_path, book))
+            if stamp is None:
+                continue
+            cached = self.get(book, stamp)
+            if cached is None:
+                todo.append(book)
+            else:
+                results[book] = cached
+
+        def finish(book, stamp, problems):
+            self.put(book, stamp, problems)
+            results[book] = problems
+            if on_result is not None:
+                on_result(book, problems)
+
+        with tracing.span('epub.verify_books', books=len(books), checked=len(todo)):
+            if len(todo) < PARALLEL_MIN_BOOKS:
+                for book in todo:
+                    finish(*verify_book(self.base_path, book))
+            else:
+                # spawn, not fork: the caller is a worker thread of a Tk process
+                context = multiprocessing.get_context('spawn')
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                    futures = [pool.submit(verify_book, self.base_path, book) for book in todo]
+                    for future in concurrent.futures.as_completed(futures):
+                        finish(*future.result())
+        if todo:
+            self.save()
+        return results
+
+
+def verified(cache, book, on_success=None):
+    """An ``on_success`` for build jobs: check the new EPUB, then call on_success if it passed.
+
+    A failed check raises EpubInvalid, which the job runner reports as a
+    warning in the job's output.  on_success (recording the build
+    manifest) is skipped then, so the next build isn't skipped as up to
+    date.
+    """
+    def run():
+        problems = cache.check(book)
+        if problems:
+            raise EpubInvalid(problems)
+        if on_success is not None:
+            on_success()
+    return run
@@ -0,0 +1,284 @@
+"""Background job runner for build/clean commands.
+
+Each job runs its command in a subprocess from a worker thread and streams
+the output line by line.  A command can also be a callable
+``cmd(emit, cancelled)`` returning an exit status (see build_engines),
+which passes its output lines to ``emit`` and should stop early once
+``cancelled()`` is true.  Nothing in here touches Tk: progress is reported
+as events on ``JobRunner.events``, which the UI drains from the main loop
+with ``after()`` so the event loop never blocks.
+"""
+import collections
+import itertools
+import queue
+import subprocess
+import threading
+import time
+
+import tracing
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, SKIPPED)
+
+# Seconds to wait after terminate() before a cancelled process is killed
+KILL_TIMEOUT = 5
+
+
+class Job:
+    def __init__(self, job_id, command, book, cmd, cwd, skip_if=None, on_success=None):
+        self.id = job_id
+        self.command = command
+        self.book = book
+        self.cmd = cmd
+        self.cwd = cwd
+        self.skip_if = skip_if  # Called first; a returned reason skips the command
+        self.on_success = on_success  # Called after the command exits with 0
+        self.status = QUEUED
+        self.returncode = None
+        self.error = None
+        self.output = []  # Output lines, without trailing newlines
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.cancel_requested = False
+
+    @property
+    def done(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def duration(self):
+        """Wall time in seconds, or the time so far for a running job."""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def describe(self):
+        return f"#{self.id} {self.command} {self.book}: {self.status}"
+
+
+class JobRunner:
+    """Run jobs in worker threads, at most ``max_workers`` at a time.
+
+    Events put on ``self.events``:
+        ('started', job)
+        ('output', job, line)
+        ('finished', job)
+    """
+
+    def __init__(self, max_workers=2):
+        self.events = queue.Queue()
+        self.max_workers = max(1, int(max_workers))
+        self._ids = itertools.count(1)
+        self._pending = collections.deque()
+        self._jobs = {}
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self.max_workers = max(1, int(max_workers))
+        self._dispatch()
+
+    def submit(self, command, book, cmd, cwd, skip_if=None, on_success=None):
+        """Queue a command; ``skip_if`` and ``on_success`` run on the worker thread."""
+        job = Job(next(self._ids), command, book, cmd, cwd, skip_if, on_success)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+        self._dispatch()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def forget_finished(self):
+        """Drop finished jobs, and their output, from the runner; returns their ids."""
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.done]
+            for job_id in finished:
+                del self._jobs[job_id]
+        return finished
+
+    def active_job_for(self, book):
+        """Return the queued or running job for a book, if any."""
+        for job in reversed(list(self._jobs.values())):
+            if job.book == book and not job.done:
+                return job
+        return None
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        with self._lock:
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                try:
+                    self._pending.remove(job)
+                except ValueError:
+                    pass
+                job.status = CANCELLED
+                job.finished_at = time.monotonic()
+                self.events.put(('finished', job))
+                return True
+            process = job.process
+        if process is not None:
+            self._terminate(process)
+        return True
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+
+    def _terminate(self, process):
+        try:
+            process.terminate()
+        except OSError:
+            return
+
+        def kill_if_alive():
+            try:
+                process.wait(timeout=KILL_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        threading.Thread(target=kill_if_alive, daemon=True).start()
+
+    def _dispatch(self):
+        with self._lock:
+            while self._pending and self._running < self.max_workers:
+                job = self._pending.popleft()
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                self._running += 1
+                threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        with tracing.span(f'job.{job.command}', category='subprocess', book=job.book) as span:
+            self._run_job(job)
+            span.set(status=job.status, returncode=job.returncode)
+
+    def _run_job(self, job):
+        self.events.put(('started', job))
+        try:
+            if job.skip_if is not None:
+                reason = job.skip_if()
+                if reason:
+                    self._output(job, reason)
+                    job.status = SKIPPED
+                    return
+            if callable(job.cmd):
+                job.returncode = job.cmd(lambda line: self._output(job, line), lambda: job.cancel_requested)
+                self._set_status(job)
+                return
+            process = subprocess.Popen(
+                job.cmd,
+                cwd=job.cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                errors='replace',
+                bufsize=1
+            )
+            with self._lock:
+                job.process = process
+                cancelled = job.cancel_requested
+            if cancelled:
+                self._terminate(process)
+            for line in process.stdout:
+                self._output(job, line.rstrip('\n'))
+            process.stdout.close()
+            job.returncode = process.wait()
+            self._set_status(job)
+        except FileNotFoundError as e:
+            job.error = str(e) if callable(job.cmd) else f"Executable not found: {job.cmd[0]}"
+            job.status = FAILED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.monotonic()
+            job.process = None
+            with self._lock:
+                self._running -= 1
+            self.events.put(('finished', job))
+            self._dispatch()
+
+    def _output(self, job, line):
+        job.output.append(line)
+        self.events.put(('output', job, line))
+
+    def _set_status(self, job):
+        """Set the status of a job whose command exited with job.returncode."""
+        if job.cancel_requested:
+            job.status = CANCELLED
+        elif job.returncode == 0:
+            if job.on_success is not None:
+                try:
+                    job.on_success()
+                except Exception as e:
+                    self._output(job, f"[WARNING] Post-build step failed: {e}")
+            job.status = SUCCEEDED
+        else:
+            job.status = FAILED
+
+
+class Batch:
+    """A group of jobs submitted together, summarised once all have finished."""
+
+    def __init__(self, command, jobs, skipped=None):
+        self.command = command
+        self.jobs = list(jobs)
+        self.skipped = list(skipped or [])  # (book, reason) pairs
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return all(job.done for job in self.jobs)
+
+    @property
+    def wall_time(self):
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def counts(self):
+        counts = {SUCCEEDED: 0, SKIPPED: 0, FAILED: 0, CANCELLED: 0}
+        for job in self.jobs:
+            if job.status in counts:
+                counts[job.status] += 1
+        return counts
+
+    def summary(self):
+        counts = self.counts()
+        lines = [
+            f"{self.command.capitalize()} batch: {len(self.jobs)} jobs, "
+            f"{counts[SUCCEEDED]} succeeded, {counts[SKIPPED]} up to date, "
+            f"{counts[FAILED]} failed, {counts[CANCELLED]} cancelled, "
+            f"{len(self.skipped)} skipped",
+            f"Wall time: {self.wall_time:.1f}s, "
+            f"total job time: {sum(job.duration for job in self.jobs):.1f}s",
+            ""
+        ]
+        for job in sorted(self.jobs, key=lambda j: j.duration, reverse=True):
+            line = f"{job.status:<10} {job.duration:8.1f}s  {job.book}"
+            if job.error:
+                line += f"  ({job.error})"
+            elif job.status == FAILED:
+                line += f"  (exit code {job.returncode})"
+            lines.append(line)
+        for book, reason in self.skipped:
+            lines.append(f"{'skipped':<10} {'':>9}  {book}  ({reason})")
+        return "\n".join(lines)
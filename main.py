@@ -1,51 +1,109 @@
+import time
+_PROCESS_START = time.perf_counter()  # For --profile-startup; keep above other imports
+import sys
+
+if __name__ == '__main__' and sys.argv[1:2] == ['cli']:
+    # Headless entry point for build servers; dispatch before tkinter is imported.
+    # cli.py runs as __main__, so spawn-context pool workers re-import it rather
+    # than this module, and never import tkinter either.
+    import runpy
+    sys.argv = [sys.argv[0]] + sys.argv[2:]
+    runpy.run_module('cli', run_name='__main__', alter_sys=True)
+    sys.exit(0)
+
 import tkinter as tk
-from tkinter import filedialog, messagebox, Toplevel
+from tkinter import filedialog, messagebox, Toplevel, ttk
 import os
-import configparser
 import json
-from ebooklib import epub
-import ebooklib
-from tkhtmlview import HTMLScrolledText  # For rendering HTML
-from PIL import Image, ImageTk
-import webbrowser
+import argparse
+import hashlib
+import logging
 from dotenv import load_dotenv  # Load .env variables
-import tweepy
 import traceback  # For detailed error logging
-from instagrapi import Client as InstagramClient  # For Instagram posting
-from instagrapi.exceptions import LoginRequired, ClientError
 from datetime import datetime  # For timestamp in tweets.txt
-import subprocess  # For running php build.php
-import re  # For natural sorting
+import queue  # For job events from worker threads
+import threading
+import concurrent.futures  # The search index update worker
+# ebooklib, tkhtmlview, tweepy and instagrapi are slow to import (instagrapi
+# pulls in pydantic and requests), so they are imported on first use in
+# preview_book and the social post handlers rather than at startup.
+from jobs import JobRunner, Batch, RUNNING, SUCCEEDED, FAILED, CANCELLED, SKIPPED
+from buildcache import IncrementalBuild
+import build_engines
+import bookshelf
+from bookshelf import ShelfSet, BookShelfModel, validate_book_dir, CHAPTER_PLACEHOLDERS
+from watcher import ShelfWatcher
+from epub_preview import PreviewCache
+import epub_meta
+from epub_meta import read_epub_metadata
+from post_queue import PostQueue
+import post_history
+from post_history import PostHistory
+import social
+import campaign
+import tracing
+from search_index import ChapterSearchIndex
+import manuscript_stats
+from manuscript_stats import ShelfStats
+import epub_verify
+from epub_verify import VerifyCache
+import thumbnails
+from thumbnails import ThumbnailCache
+
+_IMPORTS_DONE = time.perf_counter()
+
+log = logging.getLogger('book_builder.main')
 
 # Load environment variables from .env file
 load_dotenv()
 
 CONFIG_FILE = os.path.expanduser("~/.book_builder_config.json")
 
-def load_last_path():
+DEFAULT_MAX_JOBS = os.cpu_count() or 2
+DEFAULT_LOG_LEVEL = os.getenv('BOOK_BUILDER_LOG_LEVEL', 'INFO')
+JOB_POLL_MS = 100
+WATCH_POLL_MS = 250
+BACKGROUND_POLL_MS = 50
+POST_POLL_MS = 500
+POST_QUEUE_FILE = 'posts.sqlite3'
+CAMPAIGN_POLL_MS = 2000
+SEARCH_DEBOUNCE_MS = 250
+SEARCH_RESULT_LIMIT = 500
+THUMBNAIL_POLL_MS = 100
+DEFAULT_SCAN_TIMEOUT = 30  # Seconds before a shelf root's scan is reported as stuck
+THUMBNAIL_ROW_HEIGHT = thumbnails.DEFAULT_SIZE[1] + 4
+THUMBNAIL_MARGIN_ROWS = 10  # Rows above and below the view whose thumbnails are loaded too
+EDITOR_LOAD_CHUNK = 64 * 1024  # Characters inserted per after() tick
+EDITOR_AUTOSAVE_MS = 3000
+SORT_LABELS = {
+    'added': "Added",
+    'key': "Book",
+    'title': "Title",
+    'category': "Category",
+    'status': "Status",
+    'epub_mtime': "EPUB Date",
+}
+FILTER_ALL = "All"
+JOB_EVENTS_PER_POLL = 500  # Cap per tick so a chatty build can't starve the UI
+
+def load_config():
     if os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE, 'r') as f:
-            data = json.load(f)
-            return data.get('last_path', ''), data.get('sort_reverse', True)  # Default to reversed
-    return '', True
+            return json.load(f)
+    return {}
 
-def save_last_path(path, sort_reverse):
+def save_config(**updates):
+    data = load_config()
+    data.update(updates)
     with open(CONFIG_FILE, 'w') as f:
-        json.dump({'last_path': path, 'sort_reverse': sort_reverse}, f)
+        json.dump(data, f)
 
-def validate_book_dir(path):
-    bookshelf_exists = os.path.isdir(os.path.join(path, 'bookshelf'))
-    ini_exists = os.path.isfile(os.path.join(path, 'bookshelf/books.ini'))
-    return bookshelf_exists and ini_exists
-
-def parse_books_ini(path):
-    config = configparser.ConfigParser()
-    config.read(os.path.join(path, 'bookshelf/books.ini'))
-    return {section: config[section] for section in config.sections()}
+def load_last_path():
+    data = load_config()
+    return data.get('last_path', ''), data.get('sort_reverse', True)  # Default to reversed
 
-def natural_sort_key(s):
-    """Key function for natural sorting (e.g., chapter1.md, chapter2.md, chapter10.md)."""
-    return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', s)]
+def save_last_path(path, sort_reverse):
+    save_config(last_path=path, sort_reverse=sort_reverse)
 
 class BookBuilderUI:
     def __init__(self, root):
@@ -60,16 +118,70 @@ class BookBuilderUI:
 
         self.path_var = tk.StringVar()
         self.books = []
-        self.sort_reverse = True  # Default to reversed (newest first)
-        self.chapter_vars = {}  # Store StringVar instances per book
-
-        self.build_path_selector()
-        self.build_book_list()
+        config = load_config()
+        self.sort_reverse = config.get('sort_reverse', True)  # Default to reversed (newest first)
+        self.sort_field = config.get('sort_field', 'added')
+        if self.sort_field not in SORT_LABELS:
+            self.sort_field = 'added'
+        self.model = None  # BookShelfModel over self.index
+        self.index = None  # ShelfSet over the checked path and the extra shelf_roots
+        self.shelf_roots = config.get('shelf_roots', [])  # Extra roots, listed after the checked path
+        self.scan_timeout = config.get('shelf_scan_timeout', DEFAULT_SCAN_TIMEOUT)
+        self.scan_generation = 0  # Bumped per refresh, so late scan results can be told apart
+        self.root_problems = {}  # root -> why it isn't listed: still scanning, slow or invalid
+        self.watchers = {}  # root -> ShelfWatcher, for the attached roots
+        self.post_queue = None  # PostQueue for the checked path
+        self.post_history = None  # PostHistory in the same database
+        self.last_promoted = {}  # book -> time of its latest post, from post_history
+        self.repost_window_days = config.get('repost_window_days', post_history.DEFAULT_REPOST_WINDOW_DAYS)
+        self.social_clients = social.SocialClients()
+        self.post_limiters = campaign.make_limiters(config.get('rate_limits'))
+        self.post_workers = config.get('post_workers', campaign.DEFAULT_POST_WORKERS)
+        self.visible_books = set()  # Books currently attached to the tree
+        self.row_ids = set()  # All tree items, including rows detached by the filter
+        self.background_results = queue.Queue()  # (callback, value) from run_in_background
+        self.preview_cache = PreviewCache()
+        self.search_indexes = {}  # root -> ChapterSearchIndex, loaded when the search window opens
+        self.search_updates = {}  # root -> Future of the latest index update submitted
+        self.search_worker = None  # One-thread executor that runs every search index update in turn
+        self.shelf_stats = {}  # root -> ShelfStats, loaded by the stats window or a chapter save
+        self.shelf_stats_lock = threading.Lock()  # Both load from worker threads
+        self.verify_caches = {}  # root -> VerifyCache, EPUB check results for the Check column
+        self.show_thumbnails = config.get('show_thumbnails', True) and thumbnails.available()
+        self.thumbnails = None  # ThumbnailCache for the checked path
+        self.thumbnail_images = {}  # book -> (thumbnail key, PhotoImage); Tk needs the references kept
+        self.thumbnail_after = None  # Pending after_idle for request_visible_thumbnails
+        self.job_rows = []  # Job ids in job listbox order
+        self.batches = []  # Batches awaiting their summary
+        self.force_rebuild_var = tk.BooleanVar(value=False)  # Ignore build manifests
+
+        max_jobs = config.get('max_jobs', DEFAULT_MAX_JOBS)
+        self.jobs = JobRunner(max_workers=max_jobs)
+        self.max_jobs_var = tk.IntVar(value=self.jobs.max_workers)
+        self.build_engines = build_engines.make_engines()
+        engine_name = config.get('build_engine', build_engines.AUTO)
+        self.build_engine_var = tk.StringVar(
+            value=engine_name if engine_name in build_engines.ENGINE_CHOICES else build_engines.AUTO
+        )
 
-        last_path, sort_reverse = load_last_path()
+        with tracing.span('ui.build_widgets'):
+            self.build_path_selector()
+            self.build_filter_bar()
+            self.build_batch_toolbar()
+            self.build_row_toolbar()
+            self.build_job_panel()
+            self.build_book_list()
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
+        self.root.after(WATCH_POLL_MS, self.poll_watcher)
+        self.root.after(BACKGROUND_POLL_MS, self.poll_background)
+        self.root.after(POST_POLL_MS, self.poll_post_queue)
+        self.root.after(THUMBNAIL_POLL_MS, self.poll_thumbnails)
+
+        last_path, _ = load_last_path()
         if last_path:
             self.path_var.set(last_path)
-            self.sort_reverse = sort_reverse
             self.check_path()
 
     def build_path_selector(self):
@@ -82,55 +194,598 @@ class BookBuilderUI:
 
         tk.Button(frame, text="Browse", command=self.browse_path).pack(side='left')
         tk.Button(frame, text="Check", command=self.check_path).pack(side='left', padx=5)
+        tk.Button(frame, text="Shelves...", command=self.open_shelf_roots).pack(side='left')
 
-        # Add sort order dropdown
-        tk.Label(frame, text="Sort Order:").pack(side='left', padx=5)
-        sort_options = ["Newest First", "Oldest First"]
+        # Sort field and direction; re-sorting only reorders the in-memory model
+        tk.Label(frame, text="Sort By:").pack(side='left', padx=5)
+        self.sort_field_var = tk.StringVar(frame, value=SORT_LABELS[self.sort_field])
+        tk.OptionMenu(frame, self.sort_field_var, *SORT_LABELS.values()).pack(side='left')
         self.sort_var = tk.StringVar(frame)
-        self.sort_var.set("Newest First" if self.sort_reverse else "Oldest First")
+        self.sort_var.set("Descending" if self.sort_reverse else "Ascending")
         def on_sort_change(*args):
-            self.sort_reverse = (self.sort_var.get() == "Newest First")
-            save_last_path(self.path_var.get(), self.sort_reverse)
-            if self.path_var.get():
-                self.refresh_book_list(self.path_var.get())
-        self.sort_var.trace('w', on_sort_change)
-        sort_dropdown = tk.OptionMenu(frame, self.sort_var, *sort_options)
+            labels = {label: field for field, label in SORT_LABELS.items()}
+            self.set_sort(labels[self.sort_field_var.get()], self.sort_var.get() == "Descending")
+        self.sort_field_var.trace_add('write', on_sort_change)
+        self.sort_var.trace_add('write', on_sort_change)
+        sort_dropdown = tk.OptionMenu(frame, self.sort_var, "Descending", "Ascending")
         sort_dropdown.pack(side='left', padx=5)
 
+        tk.Label(frame, text="Parallel Jobs:").pack(side='left', padx=5)
+        def on_max_jobs_change(*args):
+            try:
+                max_jobs = self.max_jobs_var.get()
+            except tk.TclError:
+                return  # Spinbox is mid-edit
+            if max_jobs < 1:
+                return
+            self.jobs.set_max_workers(max_jobs)
+            save_config(max_jobs=max_jobs)
+        self.max_jobs_var.trace_add('write', on_max_jobs_change)
+        tk.Spinbox(
+            frame, from_=1, to=max(os.cpu_count() or 1, 16),
+            textvariable=self.max_jobs_var, width=4
+        ).pack(side='left')
+
+        tk.Label(frame, text="Engine:").pack(side='left', padx=5)
+        tk.OptionMenu(frame, self.build_engine_var, *build_engines.ENGINE_CHOICES).pack(side='left')
+        self.build_engine_var.trace_add('write', lambda *args: save_config(build_engine=self.build_engine_var.get()))
+
+    def build_filter_bar(self):
+        frame = tk.Frame(self.root)
+        frame.pack(padx=10, pady=(0, 5), fill='x')
+
+        tk.Label(frame, text="Filter:").pack(side='left')
+        self.filter_var = tk.StringVar(frame)
+        tk.Entry(frame, textvariable=self.filter_var, width=40).pack(side='left', padx=5)
+        tk.Label(frame, text="Category:").pack(side='left', padx=(10, 0))
+        self.category_filter_var = tk.StringVar(frame, value=FILTER_ALL)
+        self.category_filter = ttk.Combobox(frame, textvariable=self.category_filter_var,
+                                            values=[FILTER_ALL], state='readonly', width=20)
+        self.category_filter.pack(side='left', padx=5)
+        tk.Label(frame, text="Status:").pack(side='left', padx=(10, 0))
+        self.status_filter_var = tk.StringVar(frame, value=FILTER_ALL)
+        self.status_filter = ttk.Combobox(frame, textvariable=self.status_filter_var,
+                                          values=[FILTER_ALL], state='readonly', width=15)
+        self.status_filter.pack(side='left', padx=5)
+        tk.Button(frame, text="Clear", command=self.clear_filter).pack(side='left', padx=5)
+        tk.Button(frame, text="Search Chapters...", command=self.open_search).pack(side='left', padx=(15, 0))
+        tk.Button(frame, text="Statistics...", command=self.open_stats).pack(side='left', padx=5)
+        self.book_count_label = tk.Label(frame, text="", anchor='e')
+        self.book_count_label.pack(side='right')
+
+        for var in (self.filter_var, self.category_filter_var, self.status_filter_var):
+            var.trace_add('write', lambda *args: self.apply_filter())
+
+    def build_batch_toolbar(self):
+        frame = tk.Frame(self.root)
+        frame.pack(padx=10, fill='x')
+
+        tk.Button(frame, text="Select All", command=lambda: self.set_all_selected(True)).pack(side='left')
+        tk.Button(frame, text="Select None", command=lambda: self.set_all_selected(False)).pack(side='left', padx=5)
+        tk.Button(frame, text="Build Selected", command=lambda: self.run_batch('build', self.selected_books())).pack(side='left', padx=(15, 0))
+        tk.Button(frame, text="Clean Selected", command=lambda: self.run_batch('clean', self.selected_books())).pack(side='left', padx=5)
+        # Every book on the shelf, not just the rows the filter leaves in the tree
+        tk.Button(frame, text="Build All", command=lambda: self.run_batch('build', self.model.all_books() if self.model else [])).pack(side='left')
+        tk.Checkbutton(frame, text="Force Rebuild", variable=self.force_rebuild_var).pack(side='left', padx=15)
+        tk.Button(frame, text="Campaign...", command=lambda: self.open_campaign(self.selected_books())).pack(side='left')
+        self.verify_button = tk.Button(frame, text="Check All EPUBs", command=self.verify_all)
+        self.verify_button.pack(side='left', padx=5)
+
+    def build_job_panel(self):
+        """Job list and log pane for background build/clean jobs."""
+        frame = tk.Frame(self.root)
+        frame.pack(side='bottom', padx=10, pady=(0, 10), fill='x')
+
+        list_frame = tk.Frame(frame)
+        list_frame.pack(side='left', fill='y')
+        tk.Label(list_frame, text="Jobs", anchor='w').pack(fill='x')
+        self.job_listbox = tk.Listbox(list_frame, width=45, height=10, exportselection=False)
+        self.job_listbox.pack(fill='y', expand=True)
+        self.job_listbox.bind('<<ListboxSelect>>', lambda e: self.show_job_log())
+        button_frame = tk.Frame(list_frame)
+        button_frame.pack(fill='x')
+        tk.Button(button_frame, text="Cancel", command=self.cancel_selected_job).pack(side='left', pady=2)
+        tk.Button(button_frame, text="Clear Finished", command=self.clear_finished_jobs).pack(side='left', padx=5, pady=2)
+
+        log_frame = tk.Frame(frame)
+        log_frame.pack(side='left', fill='both', expand=True, padx=(10, 0))
+        self.job_log_label = tk.Label(log_frame, text="Log", anchor='w')
+        self.job_log_label.pack(fill='x')
+        self.job_log = tk.Text(log_frame, height=10, wrap='none', state='disabled')
+        log_scrollbar = tk.Scrollbar(log_frame, orient='vertical', command=self.job_log.yview)
+        self.job_log.configure(yscrollcommand=log_scrollbar.set)
+        self.job_log.pack(side='left', fill='both', expand=True)
+        log_scrollbar.pack(side='right', fill='y')
+
+    def build_row_toolbar(self):
+        """Actions for the focused book, mirrored in the list's context menu."""
+        frame = tk.Frame(self.root)
+        frame.pack(padx=10, pady=(5, 0), fill='x')
+
+        tk.Label(frame, text="Selected Book:").pack(side='left')
+        self.row_buttons = {}
+        for label, action in (
+            ("Build", lambda b: self.run_command('build', b)),
+            ("Clean", lambda b: self.run_command('clean', b)),
+            ("Preview", lambda b: self.preview_book(b)),
+            ("Tweet", self.tweet_book),
+            ("Insta", self.insta_book),
+        ):
+            button = tk.Button(frame, text=label, state='disabled',
+                               command=lambda a=action: self.with_focused_book(a))
+            button.pack(side='left', padx=2)
+            self.row_buttons[label] = button
+
+        self.chapter_menubutton = tk.Menubutton(frame, text="Edit Chapter", relief='raised', state='disabled')
+        self.chapter_menubutton.pack(side='left', padx=2)
+        self.toolbar_chapter_menu = tk.Menu(self.chapter_menubutton, tearoff=0)
+        self.toolbar_chapter_menu.configure(
+            postcommand=lambda: self.fill_chapter_menu(self.toolbar_chapter_menu, self.focused_book())
+        )
+        self.chapter_menubutton.configure(menu=self.toolbar_chapter_menu)
+
     def build_book_list(self):
         self.book_frame = tk.Frame(self.root)
         self.book_frame.pack(padx=10, pady=10, fill='both', expand=True)
 
-        self.canvas = tk.Canvas(self.book_frame)
-        self.scrollbar = tk.Scrollbar(self.book_frame, orient='vertical', command=self.canvas.yview)
-        self.scrollable_frame = tk.Frame(self.canvas)
+        columns = ('title', 'category', 'status', 'promoted', 'verify', 'shelf', 'job')
+        style = 'Treeview'
+        if self.show_thumbnails:
+            # Own style so only the book list gets rows tall enough for a cover
+            style = 'Books.Treeview'
+            ttk.Style(self.root).configure(style, rowheight=THUMBNAIL_ROW_HEIGHT)
+        self.tree = ttk.Treeview(self.book_frame, columns=columns, selectmode='extended', style=style)
+        self.tree.heading('#0', text='Book', anchor='w', command=lambda: self.sort_by_column('key'))
+        self.tree.heading('title', text='Title', anchor='w', command=lambda: self.sort_by_column('title'))
+        self.tree.heading('category', text='Category', anchor='w', command=lambda: self.sort_by_column('category'))
+        self.tree.heading('status', text='Status', anchor='w', command=lambda: self.sort_by_column('status'))
+        self.tree.heading('promoted', text='Last Promoted', anchor='w')
+        self.tree.heading('verify', text='EPUB Check', anchor='w')
+        self.tree.heading('shelf', text='Shelf', anchor='w')
+        self.tree.heading('job', text='Job', anchor='w')
+        self.tree.column('#0', width=350, stretch=False)
+        self.tree.column('title', width=350)
+        self.tree.column('category', width=150, stretch=False)
+        self.tree.column('status', width=110, stretch=False)
+        self.tree.column('promoted', width=110, stretch=False)
+        self.tree.column('verify', width=100, stretch=False)
+        self.tree.column('shelf', width=120, stretch=False)
+        self.tree.column('job', width=180, stretch=False)
+        self.show_shelf_column(False)
+        self.tree.tag_configure(RUNNING, foreground='blue')
+        self.tree.tag_configure(SUCCEEDED, foreground='dark green')
+        self.tree.tag_configure(SKIPPED, foreground='dark green')
+        self.tree.tag_configure(FAILED, foreground='red')
+        self.tree.tag_configure(CANCELLED, foreground='gray')
+
+        self.scrollbar = ttk.Scrollbar(self.book_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_book_list_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
 
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(
-                scrollregion=self.canvas.bbox("all")
-            )
-        )
+        self.row_menu = tk.Menu(self.tree, tearoff=0)
+        self.row_menu.add_command(label="Build", command=lambda: self.with_focused_book(lambda b: self.run_command('build', b)))
+        self.row_menu.add_command(label="Clean", command=lambda: self.with_focused_book(lambda b: self.run_command('clean', b)))
+        self.row_menu.add_command(label="Preview", command=lambda: self.with_focused_book(lambda b: self.preview_book(b)))
+        self.row_menu.add_command(label="Tweet", command=lambda: self.with_focused_book(self.tweet_book))
+        self.row_menu.add_command(label="Insta", command=lambda: self.with_focused_book(self.insta_book))
+        self.chapter_menu = tk.Menu(self.row_menu, tearoff=0)
+        self.row_menu.add_cascade(label="Edit Chapter", menu=self.chapter_menu)
+
+        self.tree.bind('<<TreeviewSelect>>', lambda e: self.update_row_actions())
+        self.tree.bind('<Double-1>', lambda e: self.with_focused_book(lambda b: self.preview_book(b)))
+        self.tree.bind('<Button-3>', self.show_row_menu)
+        self.tree.bind('<Configure>', lambda e: self.schedule_thumbnails())
+
+    def on_book_list_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_thumbnails()
+
+    def schedule_thumbnails(self):
+        """Coalesce scroll, resize and render events into one visible-rows pass."""
+        if self.thumbnails is not None and self.thumbnail_after is None:
+            self.thumbnail_after = self.root.after_idle(self.request_visible_thumbnails)
+
+    def request_visible_thumbnails(self):
+        """Show cached thumbnails for the rows in view and queue renders for the rest.
+
+        Only rows within THUMBNAIL_MARGIN_ROWS of the view are looked at, so
+        the cost doesn't grow with the shelf; queued renders for rows that
+        scrolled away are cancelled.
+        """
+        self.thumbnail_after = None
+        if self.thumbnails is None or self.index is None:
+            return
+        rows = self.tree.get_children('')
+        if not rows:
+            return
+        first, last = self.tree.yview()
+        start = max(0, int(first * len(rows)) - THUMBNAIL_MARGIN_ROWS)
+        end = min(len(rows), int(last * len(rows)) + 1 + THUMBNAIL_MARGIN_ROWS)
+        wanted = set()
+        with tracing.span('ui.thumbnails', rows=end - start) as span:
+            for book in rows[start:end]:
+                record = self.index.get(book)
+                key = path = None
+                if record is not None and record['has_cover']:
+                    cover = bookshelf.cover_path(record['base_path'], record['book'])
+                    key, path = self.thumbnails.lookup(cover)
+                    if key is not None and self.thumbnails.failed(key):
+                        key = None  # Undecodable; tried again once the cover changes
+                    elif key is not None and path is None:
+                        self.thumbnails.request(book, cover, key)
+                        wanted.add(key)
+                        continue
+                loaded = self.thumbnail_images.get(book)
+                if (loaded[0] if loaded else None) != key:
+                    self.set_thumbnail(book, key, path)
+            self.thumbnails.retain(wanted)
+            span.set(queued=len(wanted))
+
+    def set_thumbnail(self, book, key, path):
+        image = None
+        if path is not None:
+            try:
+                image = tk.PhotoImage(file=path)
+            except tk.TclError as e:
+                log.warning("Cannot load thumbnail for %s: %s", book, e)
+        if image is None:
+            self.thumbnail_images.pop(book, None)
+        else:
+            self.thumbnail_images[book] = (key, image)
+        if self.tree.exists(book):
+            self.tree.item(book, image=image if image is not None else '')
 
-        self.canvas_frame = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor='nw')
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+    def poll_thumbnails(self):
+        """Show thumbnails rendered by the pool since the last tick."""
+        if self.thumbnails is not None:
+            try:
+                while True:
+                    book, key, path = self.thumbnails.results.get_nowait()
+                    if path is not None:
+                        self.set_thumbnail(book, key, path)
+            except queue.Empty:
+                pass
+        self.root.after(THUMBNAIL_POLL_MS, self.poll_thumbnails)
+
+    def focused_book(self):
+        book = self.tree.focus()
+        return book if self.index and self.index.get(book) else None
+
+    def with_focused_book(self, action):
+        book = self.focused_book()
+        if book is not None:
+            action(book)
+
+    def tweet_book(self, book):
+        self.post_to_twitter(book)
+
+    def insta_book(self, book):
+        self.post_to_instagram(book)
+
+    def row_action_states(self, book):
+        """Map each row action label to 'normal' or 'disabled' for a book."""
+        info = self.index.get(book) if self.index and book else None
+        if info is None:
+            return {label: 'disabled' for label in ("Build", "Clean", "Preview", "Tweet", "Insta", "Edit Chapter")}
+        def state(enabled):
+            return 'normal' if enabled else 'disabled'
+        return {
+            "Build": state(info['status'].lower() != 'published'),
+            "Clean": 'normal',
+            "Preview": state(info['has_epub']),
+            "Tweet": state(info['has_cover']),
+            "Insta": state(info['has_cover']),
+            "Edit Chapter": state(info['has_dir']),
+        }
+
+    def update_row_actions(self):
+        states = self.row_action_states(self.focused_book())
+        for label, button in self.row_buttons.items():
+            button.config(state=states[label])
+        self.chapter_menubutton.config(state=states["Edit Chapter"])
+
+    def show_row_menu(self, event):
+        book = self.tree.identify_row(event.y)
+        if not book:
+            return
+        if book not in self.tree.selection():
+            self.tree.selection_set(book)
+        self.tree.focus(book)
+        self.update_row_actions()
+        for label, state in self.row_action_states(book).items():
+            self.row_menu.entryconfig(label, state=state)
+        self.fill_chapter_menu(self.chapter_menu, book)
+        self.row_menu.tk_popup(event.x_root, event.y_root)
+
+    def fill_chapter_menu(self, menu, book):
+        """Populate a chapter menu on demand, so only the opened book is listed."""
+        menu.delete(0, 'end')
+        if book is None:
+            return
+        self.index.refresh([book])
+        record = self.index.get(book)
+        if record is None:
+            return
+        path, name = record['base_path'], record['book']
+        for filename in record['chapters']:
+            if filename in CHAPTER_PLACEHOLDERS:
+                menu.add_command(label=filename, state='disabled')
+            else:
+                menu.add_command(label=filename, command=lambda f=filename: self.edit_chapter_file(path, name, f))
+
+    def selected_job(self):
+        selection = self.job_listbox.curselection()
+        if not selection:
+            return None
+        return self.jobs.get(self.job_rows[selection[0]])
+
+    def show_job_log(self):
+        job = self.selected_job()
+        self.job_log.config(state='normal')
+        self.job_log.delete('1.0', 'end')
+        if job is not None:
+            self.job_log_label.config(text=f"Log: {job.describe()}")
+            lines = list(job.output)
+            if job.error:
+                lines.append(f"[ERROR] {job.error}")
+            if lines:
+                self.job_log.insert('end', "\n".join(lines) + "\n")
+            self.job_log.see('end')
+        else:
+            self.job_log_label.config(text="Log")
+        self.job_log.config(state='disabled')
 
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
+    def append_job_log(self, job, line):
+        if self.selected_job() is not job:
+            return
+        at_bottom = self.job_log.yview()[1] >= 1.0
+        self.job_log.config(state='normal')
+        self.job_log.insert('end', line + "\n")
+        self.job_log.config(state='disabled')
+        if at_bottom:
+            self.job_log.see('end')
+
+    def cancel_selected_job(self):
+        job = self.selected_job()
+        if job is not None:
+            self.jobs.cancel(job.id)
+
+    def clear_finished_jobs(self):
+        selected = self.selected_job()
+        self.jobs.forget_finished()  # The runner would otherwise keep every job's output for good
+        self.job_rows = [job_id for job_id in self.job_rows if self.jobs.get(job_id) is not None]
+        self.job_listbox.delete(0, 'end')
+        for job_id in self.job_rows:
+            self.job_listbox.insert('end', self.jobs.get(job_id).describe())
+        if selected is not None and selected.id in self.job_rows:
+            self.job_listbox.selection_set(self.job_rows.index(selected.id))
+        self.show_job_log()
+
+    def update_job_row(self, job):
+        if self.jobs.get(job.id) is None:
+            return  # Cleared before its last events were drained
+        if job.id not in self.job_rows:
+            self.job_rows.append(job.id)
+            self.job_listbox.insert('end', job.describe())
+            if not self.job_listbox.curselection():
+                self.job_listbox.selection_set('end')
+                self.show_job_log()
+            return
+        index = self.job_rows.index(job.id)
+        selected = index in self.job_listbox.curselection()
+        self.job_listbox.delete(index)
+        self.job_listbox.insert(index, job.describe())
+        if selected:
+            self.job_listbox.selection_set(index)
+            self.job_log_label.config(text=f"Log: {job.describe()}")
+
+    def job_status_text(self, job):
+        if job.status == RUNNING:
+            return f"{job.command}ing... ({len(job.output)} lines)"
+        if job.status == SUCCEEDED:
+            return f"{job.command} ok ({job.duration:.1f}s)"
+        if job.status == SKIPPED:
+            return "up to date"
+        if job.status in (FAILED, CANCELLED):
+            return f"{job.command} {job.status}"
+        return f"{job.command} queued"
+
+    def update_book_status(self, job):
+        if not self.tree.exists(job.book):
+            return
+        self.tree.set(job.book, 'job', self.job_status_text(job))
+        self.tree.item(job.book, tags=(job.status,))
 
-        self.canvas.bind("<Enter>", lambda e: self.canvas.bind_all("<MouseWheel>", self._on_mousewheel))
-        self.canvas.bind("<Leave>", lambda e: self.canvas.unbind_all("<MouseWheel>"))
-        self.canvas.bind_all("<Button-4>", self._on_mousewheel_linux)
-        self.canvas.bind_all("<Button-5>", self._on_mousewheel_linux)
+    def poll_jobs(self):
+        """Drain job events on the Tk thread, then re-arm."""
+        changed = {}
+        try:
+            for _ in range(JOB_EVENTS_PER_POLL):
+                event = self.jobs.events.get_nowait()
+                job = event[1]
+                if event[0] == 'output':
+                    self.append_job_log(job, event[2])
+                changed[job.id] = job
+        except queue.Empty:
+            pass
+        finished_books = []
+        for job in changed.values():
+            self.update_job_row(job)
+            self.update_book_status(job)
+            if job.done:
+                log.debug("%s returncode=%s in %.1fs", job.describe(), job.returncode, job.duration)
+                finished_books.append(job.book)
+        if finished_books:
+            self.refresh_books(finished_books)
+            for book in finished_books:
+                self.update_verify_cell(book)  # Checked after the EPUB was written, maybe after the refresh
+        if changed and self.batches:
+            self.check_batches()
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
+
+    def set_all_selected(self, selected):
+        if selected:
+            self.tree.selection_set(self.tree.get_children())
+        else:
+            self.tree.selection_remove(self.tree.selection())
+
+    def selected_books(self):
+        return [book for book in self.tree.selection() if book in self.visible_books]
+
+    def run_batch(self, command, books):
+        """Queue a build/clean job per book and summarise once all have finished."""
+        if not books:
+            messagebox.showinfo("Batch", "No books selected.")
+            return
+        self.index.refresh(books)
+        engines = {}  # Shelf root -> (engine, problem); roots can differ in build.php
+        jobs = []
+        skipped = []
+        for book in books:
+            record = self.index.get(book)
+            if record is None:
+                skipped.append((book, 'not in books.ini'))
+                continue
+            base_path = record['base_path']
+            if base_path not in engines:
+                engine = self.build_engine(base_path)
+                engines[base_path] = engine, engine.problem(base_path)
+            engine, problem = engines[base_path]
+            if problem:
+                skipped.append((book, f"{engine.name} engine: {problem}"))
+                continue
+            if command == 'build' and record['status'].lower() == 'published':
+                skipped.append((book, 'published'))
+                continue
+            active_job = self.jobs.active_job_for(book)
+            if active_job is not None:
+                skipped.append((book, f"job #{active_job.id} in progress"))
+                continue
+            jobs.append(self.submit_book_job(record, command, engine))
 
-    def _on_mousewheel(self, event):
-        self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+        batch = Batch(command, jobs, skipped)
+        log.debug("Queued %s batch: %s jobs, %s skipped", command, len(jobs), len(skipped))
+        if batch.done:
+            self.show_batch_summary(batch)
+        else:
+            self.batches.append(batch)
+
+    def check_batches(self):
+        for batch in [b for b in self.batches if b.done]:
+            self.batches.remove(batch)
+            batch.finished_at = max(job.finished_at for job in batch.jobs)
+            self.show_batch_summary(batch)
+
+    def show_batch_summary(self, batch):
+        summary = batch.summary()
+        log.debug("%s", summary)
+        self.show_summary(f"{batch.command.capitalize()} Batch Summary", summary)
+
+    def show_summary(self, title, summary):
+        window = Toplevel(self.root)
+        window.title(title)
+        window.geometry("800x500")
+        text = tk.Text(window, wrap='none', font='TkFixedFont')
+        scrollbar = tk.Scrollbar(window, orient='vertical', command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        text.insert('1.0', summary)
+        text.config(state='disabled')
+        scrollbar.pack(side='right', fill='y')
+        text.pack(side='left', fill='both', expand=True)
+
+    def verify_cache_for(self, root):
+        cache = self.verify_caches.get(root)
+        if cache is None:
+            cache = self.verify_caches[root] = VerifyCache.load(root)
+        return cache
+
+    def verify_text(self, record):
+        """The EPUB Check cell: blank until the current EPUB has been checked."""
+        stamp = record['stamp'][3]
+        if stamp is None:
+            return ""
+        problems = self.verify_cache_for(record['base_path']).get(record['book'], stamp)
+        if problems is None:
+            return ""
+        return f"failed ({len(problems)})" if problems else "passed"
+
+    def update_verify_cell(self, key):
+        record = self.index.get(key) if self.index is not None else None
+        if record is not None and self.tree.exists(key):
+            self.tree.set(key, 'verify', self.verify_text(record))
+
+    def verify_all(self):
+        """Check every EPUB on the shelf in parallel; rows update as each book is done."""
+        if self.index is None:
+            messagebox.showinfo("EPUB Check", "Open a bookshelf first.")
+            return
+        index = self.index
+        books_by_root = index.books_by_root()
+        caches = {root: self.verify_cache_for(root) for root in books_by_root}
+        workers = self.jobs.max_workers
+        self.verify_button.config(state='disabled')
+
+        def work():
+            started = time.perf_counter()
+            results = {}
+            for root, books in books_by_root.items():
+                def on_result(book, problems, root=root):
+                    self.background_results.put((self.update_verify_cell, index.key_for(root, book)))
+                for book, problems in caches[root].check_books(books, workers, on_result).items():
+                    results[index.key_for(root, book)] = problems
+            return results, time.perf_counter() - started
+
+        def on_done(result):
+            results, elapsed = result
+            self.verify_button.config(state='normal')
+            failed = {key: problems for key, problems in results.items() if problems}
+            lines = [f"Checked {len(results)} EPUBs in {elapsed:.1f}s: "
+                     f"{len(results) - len(failed)} passed, {len(failed)} failed"]
+            for key, problems in failed.items():
+                lines.append("")
+                lines.append(f"{key}:")
+                lines.extend(f"  {problem}" for problem in problems)
+            self.show_summary("EPUB Check", "\n".join(lines))
+
+        def on_error(e):
+            self.verify_button.config(state='normal')
+            messagebox.showerror("EPUB Check", f"Failed to check EPUBs: {e}")
+        self.run_in_background(work, on_done, on_error)
+
+    def run_in_background(self, work, on_done, on_error=None):
+        """Run work() on a thread and hand its result to on_done on the Tk thread."""
+        def runner():
+            try:
+                self.background_results.put((on_done, work()))
+            except Exception as e:
+                traceback.print_exc()
+                self.background_results.put((on_error or (lambda error: None), e))
+        threading.Thread(target=runner, daemon=True).start()
 
-    def _on_mousewheel_linux(self, event):
-        if event.num == 4:
-            self.canvas.yview_scroll(-1, "units")
-        elif event.num == 5:
-            self.canvas.yview_scroll(1, "units")
+    def poll_background(self):
+        try:
+            while True:
+                callback, value = self.background_results.get_nowait()
+                callback(value)
+        except queue.Empty:
+            pass
+        self.root.after(BACKGROUND_POLL_MS, self.poll_background)
+
+    def on_close(self):
+        self.stop_watchers()
+        if self.post_queue is not None:
+            self.post_queue.stop()
+        if self.thumbnails is not None:
+            self.thumbnails.shutdown()
+        if self.search_worker is not None:
+            self.search_worker.shutdown(wait=False, cancel_futures=True)
+        for stats in self.shelf_stats.values():
+            stats.save()  # Counts recorded by chapter saves since the stats window last ran
+        self.jobs.cancel_all()
+        for engine in self.build_engines.values():
+            engine.shutdown()
+        self.root.destroy()
 
     def browse_path(self):
         selected_path = filedialog.askdirectory()
@@ -148,124 +803,612 @@ class BookBuilderUI:
             self.refresh_book_list(path)
         else:
             messagebox.showerror("Validation Error", "Directory must contain 'bookshelf/' and 'books.ini'.")
-            for widget in self.scrollable_frame.winfo_children():
-                widget.destroy()
+            self.clear_rows()
+            self.index = None
+            self.model = None
+            self.scan_generation += 1  # Drop the results of scans still running
+            self.root_problems.clear()
+            self.stop_watchers()
+            self.update_row_actions()
+
+    def roots_for(self, path):
+        """The checked path followed by the configured shelf roots, without repeats."""
+        roots = []
+        seen = set()
+        for root in [path] + self.shelf_roots:
+            normalized = os.path.normcase(os.path.abspath(root))
+            if root and normalized not in seen:
+                seen.add(normalized)
+                roots.append(root)
+        return roots
 
     def refresh_book_list(self, path):
-        """Refresh the book list with the current sort order."""
-        print("[DEBUG] Refreshing book list")
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        self.chapter_vars.clear()  # Clear old StringVar instances
-
-        books_config = parse_books_ini(path)
-        book_list = reversed(books_config) if self.sort_reverse else books_config
-        for book in book_list:
-            row = tk.Frame(self.scrollable_frame)
-            row.pack(fill='x', pady=2)
-
-            tk.Label(row, text=book, width=50, anchor='w').pack(side='left', padx=5)
-            
-            book_title = books_config[book].get('book[title]', 'unknown')
-            tk.Label(row, text=book_title, width=50, anchor='w').pack(side='left', padx=5)
-
-            book_category = books_config[book].get('book[category]', 'unknown')
-            tk.Label(row, text=book_category, width=20, anchor='w').pack(side='left', padx=5)
-
-            book_status = books_config[book].get('book[status]', 'unknown')
-            tk.Label(row, text=f"{book_status}", width=15, anchor='w').pack(side='left', padx=2)
-
-            build_button = tk.Button(row, text="Build", command=lambda b=book: self.run_command('build', b))
-            build_button.pack(side='left', padx=2)
-            if book_status.lower() == 'published':
-                build_button.config(state='disabled')
-
-            tk.Button(row, text="Clean", command=lambda b=book: self.run_command('clean', b)).pack(side='left', padx=2)
+        """Rescan every shelf root, each on its own thread, merging rows in as scans finish.
+
+        A root whose scan takes longer than ``scan_timeout`` is reported as
+        slow in the book count, and its books are merged in whenever its
+        scan finishes; the other roots are not held up.
+        """
+        log.debug("Refreshing book list")
+        roots = self.roots_for(path)
+        if self.index is None or self.index.roots != roots:
+            self.index = ShelfSet(roots)
+            self.model = BookShelfModel(self.index, self.sort_field, self.sort_reverse)
+            self.apply_filter(render=False)
+            self.clear_rows()
+            self.show_shelf_column(len(roots) > 1)
+        for root in set(self.watchers) - set(roots):
+            self.watchers.pop(root).stop()
+        self.start_post_queue(path)
+        self.start_thumbnails(path)
+
+        self.scan_generation += 1
+        self.root_problems = {}
+        for root in roots:
+            self.scan_shelf_root(root, self.scan_generation)
+        self.render_view()
+
+    def scan_shelf_root(self, root, generation):
+        self.root_problems[root] = "scanning"
+        slow = f"slow, still scanning after {self.scan_timeout}s"
+
+        def current():
+            return generation == self.scan_generation and self.root_problems.get(root) in ("scanning", slow)
+
+        def on_done(result):
+            if not current():
+                return  # Superseded by a newer refresh
+            del self.root_problems[root]
+            index, changed = result
+            log.debug("Scanned %s: %s of %s books rescanned", root, len(changed), len(index.order))
+            self.attach_root(root, index)
+
+        def on_error(e):
+            if current():
+                log.warning("Cannot scan shelf %s: %s", root, e)
+                self.root_problems[root] = str(e)
+                self.render_view()
+
+        def on_timeout():
+            if current():
+                log.warning("Scanning shelf %s is taking over %ss", root, self.scan_timeout)
+                self.root_problems[root] = slow
+                self.render_view()
+
+        self.run_in_background(lambda: bookshelf.scan_root(root), on_done, on_error)
+        self.root.after(int(self.scan_timeout * 1000), on_timeout)
+
+    def attach_root(self, root, index):
+        """Merge a scanned root's books into the list, keeping selection and focus."""
+        self.index.attach(root, index)
+        with tracing.span('ui.insert_rows', books=len(index.order)):
+            for record in self.index.records():
+                if record['base_path'] != root:
+                    continue
+                self.upsert_row(record)
+                active_job = self.jobs.active_job_for(record['key'])
+                if active_job is not None:
+                    self.update_book_status(active_job)
+            stale = [key for key in self.row_ids if self.index.get(key) is None]
+            for key in stale:
+                self.delete_row(key)
+        self.start_watcher(root)
+        self.render_view()
+        self.update_row_actions()
+
+    def open_shelf_roots(self):
+        """Edit the extra shelf roots listed alongside the checked path."""
+        window = Toplevel(self.root)
+        window.title("Shelf Roots")
+        window.geometry("600x300")
+        window.transient(self.root)
+        tk.Label(window, text="Shelves listed after the checked path:", anchor='w').pack(fill='x', padx=10, pady=(10, 0))
+        listbox = tk.Listbox(window, exportselection=False)
+        listbox.pack(fill='both', expand=True, padx=10, pady=5)
+        for root in self.shelf_roots:
+            listbox.insert('end', root)
+
+        def save(roots):
+            self.shelf_roots = roots
+            save_config(shelf_roots=roots)
+            listbox.delete(0, 'end')
+            for root in roots:
+                listbox.insert('end', root)
+            if self.index is not None:
+                self.refresh_book_list(self.index.base_path)
+
+        def add():
+            selected = filedialog.askdirectory(parent=window)
+            if not selected:
+                return
+            if not validate_book_dir(selected):
+                messagebox.showerror("Validation Error", "Directory must contain 'bookshelf/' and 'books.ini'.",
+                                     parent=window)
+                return
+            save(self.shelf_roots + [selected])
+
+        def remove():
+            selection = set(listbox.curselection())
+            save([root for i, root in enumerate(self.shelf_roots) if i not in selection])
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, pady=(0, 10))
+        tk.Button(buttons, text="Add...", command=add).pack(side='left')
+        tk.Button(buttons, text="Remove", command=remove).pack(side='left', padx=5)
+        tk.Button(buttons, text="Close", command=window.destroy).pack(side='right')
+
+    def show_shelf_column(self, show):
+        columns = self.tree['columns']
+        self.tree.configure(displaycolumns=[c for c in columns if show or c != 'shelf'])
+
+    def insert_row(self, record):
+        loaded = self.thumbnail_images.get(record['key'])  # Rechecked when the row comes into view
+        self.tree.insert('', 'end', iid=record['key'], text=record['book'], values=self.row_values(record),
+                         image=loaded[1] if loaded else '')
+        self.row_ids.add(record['key'])
+
+    def upsert_row(self, record):
+        """Insert a record's row, or update its values, keeping the job column."""
+        if not self.tree.exists(record['key']):
+            self.insert_row(record)
+            return
+        job_text = self.tree.set(record['key'], 'job')
+        self.tree.item(record['key'], values=self.row_values(record)[:-1] + (job_text,))
+
+    def delete_row(self, key):
+        if self.tree.exists(key):
+            self.tree.delete(key)
+        self.row_ids.discard(key)
+        self.thumbnail_images.pop(key, None)
+
+    def clear_rows(self):
+        self.tree.delete(*[book for book in self.row_ids if self.tree.exists(book)])
+        self.row_ids.clear()
+        self.visible_books.clear()
+
+    def render_view(self):
+        """Show the model's visible books in order, detaching the rest."""
+        if self.model is None:
+            return
+        with tracing.span('ui.render_view') as span:
+            visible = self.model.visible()
+            self.tree.set_children('', *visible)
+            self.visible_books = set(visible)
+            self.book_count_label.config(text=f"{len(visible)} of {len(self.index.order)} books" + self.shelf_status())
+            self.category_filter.config(values=[FILTER_ALL] + self.model.categories())
+            self.status_filter.config(values=[FILTER_ALL] + self.model.statuses())
+            span.set(rows=len(visible))
+        self.schedule_thumbnails()
+
+    def shelf_status(self):
+        """Book count suffix naming roots that are still scanning or could not be scanned."""
+        if not self.root_problems:
+            return ""
+        scanning = [root for root, problem in self.root_problems.items() if problem == "scanning"]
+        failed = [f"{self.index.labels[root]}: {problem}" for root, problem in self.root_problems.items()
+                  if problem != "scanning"]
+        parts = [f"scanning {len(scanning)} shelves"] if scanning else []
+        return " (" + "; ".join(parts + failed) + ")"
+
+    def set_sort(self, sort_field, reverse):
+        self.sort_field = sort_field
+        self.sort_reverse = reverse
+        if self.model is not None:
+            self.model.set_sort(sort_field, reverse)
+            self.render_view()
+        # Persist off the interaction path
+        self.root.after_idle(lambda: save_config(sort_field=sort_field, sort_reverse=reverse))
+
+    def sort_by_column(self, sort_field):
+        """Heading click: sort by that column, toggling direction on repeat clicks."""
+        reverse = not self.sort_reverse if sort_field == self.sort_field else False
+        self.sort_field_var.set(SORT_LABELS[sort_field])
+        self.sort_var.set("Descending" if reverse else "Ascending")
+
+    def apply_filter(self, render=True):
+        if self.model is None:
+            return
+        category = self.category_filter_var.get()
+        status = self.status_filter_var.get()
+        self.model.set_filter(
+            self.filter_var.get(),
+            None if category == FILTER_ALL else category,
+            None if status == FILTER_ALL else status,
+        )
+        if render:
+            self.render_view()
+
+    def clear_filter(self):
+        self.filter_var.set('')
+        self.category_filter_var.set(FILTER_ALL)
+        self.status_filter_var.set(FILTER_ALL)
+
+    def row_values(self, record):
+        job_text = "" if record['has_dir'] else "No book directory"
+        promoted = self.promoted_text(record['book'])
+        shelf = self.index.labels.get(record['base_path'], '')
+        return (record['title'], record['category'], record['status'], promoted, self.verify_text(record), shelf,
+                job_text)
+
+    def promoted_text(self, book):
+        posted_at = self.last_promoted.get(book)
+        return datetime.fromtimestamp(posted_at).strftime('%Y-%m-%d') if posted_at else ""
+
+    def show_last_promoted(self, last_promoted):
+        changed = [book for book in set(last_promoted) | set(self.last_promoted)
+                   if last_promoted.get(book) != self.last_promoted.get(book)]
+        self.last_promoted = last_promoted
+        if not changed or self.index is None:
+            return
+        changed = set(changed)
+        # Posts are logged by book name, which books on other shelves may share
+        for record in self.index.records():
+            if record['book'] in changed and self.tree.exists(record['key']):
+                self.tree.set(record['key'], 'promoted', self.promoted_text(record['book']))
+
+    def refresh_books(self, books):
+        """Rescan specific books in the index and patch only their rows."""
+        if self.index is None:
+            return
+        self.patch_rows(self.index.refresh(books))
 
-            epub_path = os.path.join(path, 'bookshelf', book, f"{book}.epub")
-            preview_button = tk.Button(
-                row,
-                text="Preview",
-                command=lambda b=book: self.preview_book(path, b)
-            )
-            preview_button.pack(side='left', padx=2)
-            if not os.path.isfile(epub_path):
-                preview_button.config(state='disabled')
-
-            cover_path = os.path.join(path, 'bookshelf', book, 'media', 'cover-image-template.jpg')
-            amazon_us = books_config[book].get('amazon[us]')
-            amazon_uk = books_config[book].get('amazon[uk]')
-            tweet_button = tk.Button(
-                row,
-                text="Tweet",
-                command=lambda b=book, us=amazon_us, uk=amazon_uk: self.post_to_twitter(path, b, us, uk)
+    def patch_rows(self, changed):
+        if not changed:
+            return
+        self.index.save()
+        for key in changed:
+            record = self.index.get(key)
+            if record is None:
+                self.delete_row(key)
+            else:
+                self.upsert_row(record)
+        log.debug("Patched %s rows", len(changed))
+        self.render_view()
+        self.update_row_actions()
+
+    def start_watcher(self, root):
+        if root not in self.watchers:
+            self.watchers[root] = watcher = ShelfWatcher(root)
+            watcher.start()
+
+    def stop_watchers(self):
+        for watcher in self.watchers.values():
+            watcher.stop()
+        self.watchers.clear()
+
+    def start_thumbnails(self, path):
+        if not self.show_thumbnails:
+            return
+        if self.thumbnails is not None:
+            if self.thumbnails.base_path == path:
+                return
+            self.thumbnails.shutdown()
+        self.thumbnail_images.clear()
+        self.thumbnails = ThumbnailCache(path)
+
+    def start_post_queue(self, path):
+        """Open the shelf's post queue; pending and interrupted posts resume here."""
+        db_path = os.path.join(bookshelf.cache_dir(path), POST_QUEUE_FILE)
+        if self.post_queue is not None:
+            if self.post_queue.db_path == db_path:
+                return
+            self.post_queue.stop()
+        self.post_history = history = PostHistory(db_path)
+        self.last_promoted = {}
+        handlers = campaign.rate_limited(social.make_handlers(self.social_clients), self.post_limiters)
+        self.post_queue = PostQueue(db_path, post_history.recorded(handlers, history), workers=self.post_workers)
+
+        def load_history():
+            history.import_tweet_logs(path)
+            return history.last_posted()
+
+        def on_loaded(last_promoted):
+            if self.post_history is history:  # Not switched to another shelf meanwhile
+                self.show_last_promoted(last_promoted)
+        self.run_in_background(load_history, on_loaded)
+        self.post_queue.start()
+        pending = self.post_queue.jobs(statuses=['pending'])
+        if pending:
+            log.debug("Resuming %s queued social posts", len(pending))
+
+    def poll_post_queue(self):
+        """Report finished and failed social posts from the queue worker."""
+        if self.post_queue is not None:
+            try:
+                while True:
+                    self.show_post_event(self.post_queue.events.get_nowait())
+            except queue.Empty:
+                pass
+        self.root.after(POST_POLL_MS, self.poll_post_queue)
+
+    def show_post_event(self, event):
+        outcome, job = event[0], event[1]
+        if outcome == 'done':
+            self.show_last_promoted(dict(self.last_promoted, **{job['book']: job['updated_at']}))
+        if job['payload'].get('campaign'):
+            # Campaign windows report their own progress; don't pop up a dialog per post
+            log.debug("Campaign %s for %s: %s %s", job['kind'], job['book'], outcome, event[2:])
+        elif outcome == 'retry':
+            error, delay = event[2], event[3]
+            log.warning("%s for %s failed (%s); retrying in %.0fs", job['kind'], job['book'], error, delay)
+        elif outcome == 'failed':
+            titles = {social.INSTAGRAM: "Instagram Error", social.TWEET_REPLY: "Partial Success"}
+            messagebox.showerror(
+                titles.get(job['kind'], "Twitter Error"),
+                f"Failed to post {job['kind'].replace('_', ' ')} for {job['book']} "
+                f"after {job['attempts']} attempt(s): {event[2]}"
             )
-            tweet_button.pack(side='left', padx=2)
-            insta_button = tk.Button(
-                row,
-                text="Insta",
-                command=lambda b=book, us=amazon_us, uk=amazon_uk: self.post_to_instagram(path, b, us, uk)
+        elif job['kind'] == social.TWEET:
+            messagebox.showinfo(
+                "Tweeted!",
+                f"Main tweet for {job['book']} posted! Reply of Amazon links will be posted in "
+                f"{social.REPLY_DELAY_SECONDS} seconds."
             )
-            insta_button.pack(side='left', padx=2)
-            if not os.path.exists(cover_path):
-                tweet_button.config(state='disabled')
-                insta_button.config(state='disabled')
-
-            # Add chapter dropdown only if book directory exists
-            book_dir = os.path.join(path, 'bookshelf', book)
-            if not os.path.isdir(book_dir):
-                print(f"[DEBUG] Skipping chapter dropdown for {book}: No book directory")
-                tk.Label(row, text="No book directory", width=20, anchor='w').pack(side='left', padx=2)
-                continue
+        elif job['kind'] == social.TWEET_REPLY:
+            messagebox.showinfo("Tweeted!", f"Reply of Amazon links for {job['book']} posted to Twitter!")
+        elif job['kind'] == social.INSTAGRAM:
+            messagebox.showinfo("Posted!", f"Successfully posted {job['book']} to Instagram!")
+
+    def poll_watcher(self):
+        """Apply debounced filesystem changes reported by each root's watcher."""
+        for root, watcher in list(self.watchers.items()):
+            changes = watcher.drain()
+            if changes is not None and self.index is not None:
+                books, ini_changed = changes
+                # A books.ini change or an inotify overflow (lost events) means every book is rechecked
+                self.patch_rows(self.index.refresh_root(root, None if ini_changed else books))
+                if root in self.search_updates and root in self.index.indexes:
+                    if ini_changed:
+                        self.update_search_index(root, list(self.index.indexes[root].order))
+                    elif books:
+                        self.update_search_index(root, books, complete=False)
+        self.root.after(WATCH_POLL_MS, self.poll_watcher)
+
+    def open_search(self):
+        """Full-text search across every chapter; double-click a hit to edit at that line."""
+        if self.index is None:
+            messagebox.showinfo("Search", "Open a bookshelf first.")
+            return
 
-            chapter_files = self.list_chapter_files(path, book)
-            print(f"[DEBUG] Chapter files for {book}: {chapter_files}")
-            selected_chapter = tk.StringVar(self.root)
-            self.chapter_vars[book] = selected_chapter  # Store StringVar
-            selected_chapter.set(chapter_files[0])  # Default to first item
-            def on_chapter_select(*args, b=book, files=chapter_files):
-                selected_value = selected_chapter.get()
-                print(f"[DEBUG] Chapter selected: {selected_value} for book: {b}")
-                if selected_value not in ["No chapters directory", "No chapter files"]:
-                    print(f"[DEBUG] Opening modal for {selected_value}")
-                    self.edit_chapter_file(path, b, selected_value)
-                else:
-                    print(f"[DEBUG] Invalid selection: {selected_value}, no modal opened")
-            selected_chapter.trace_add('write', on_chapter_select)
-            chapter_dropdown = tk.OptionMenu(row, selected_chapter, *chapter_files)
-            chapter_dropdown.pack(side='left', padx=2)
-            if chapter_files[0] in ["No chapters directory", "No chapter files"]:
-                chapter_dropdown.config(state='disabled')
-
-    def list_chapter_files(self, base_path, book):
-        """Return a naturally sorted list of files in the book's chapters directory."""
-        chapters_dir = os.path.join(base_path, 'bookshelf', book, 'chapters')
-        if not os.path.isdir(chapters_dir):
-            return ["No chapters directory"]
-        files = [f for f in os.listdir(chapters_dir) if os.path.isfile(os.path.join(chapters_dir, f))]
-        if not files:
-            return ["No chapter files"]
-        return sorted(files, key=natural_sort_key)
-
-    def edit_chapter_file(self, base_path, book, filename):
-        """Open a modal to edit the selected chapter file."""
-        print(f"[DEBUG] Entering edit_chapter_file: {filename} for book: {book}")
-        if filename in ["No chapters directory", "No chapter files"]:
-            print(f"[DEBUG] Invalid filename, returning")
-            return  # Silently return, no modal for invalid options
+        window = Toplevel(self.root)
+        window.title("Search Chapters")
+        window.geometry("1000x600")
+        top = tk.Frame(window)
+        top.pack(fill='x', padx=10, pady=5)
+        tk.Label(top, text="Find:").pack(side='left')
+        query_var = tk.StringVar(window)
+        entry = tk.Entry(top, textvariable=query_var, width=50)
+        entry.pack(side='left', padx=5)
+        entry.focus_set()
+        status_label = tk.Label(top, text="Indexing chapters...", anchor='w')
+        status_label.pack(side='left', padx=10, fill='x', expand=True)
+
+        results = ttk.Treeview(window, columns=('book', 'chapter', 'line', 'text'), show='headings')
+        for column, heading, width in (('book', "Book", 180), ('chapter', "Chapter", 180),
+                                       ('line', "Line", 60), ('text', "Text", 560)):
+            results.heading(column, text=heading)
+            results.column(column, width=width, stretch=column == 'text')
+        scrollbar = tk.Scrollbar(window, orient='vertical', command=results.yview)
+        results.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y', padx=(0, 10), pady=(0, 10))
+        results.pack(fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+
+        hits = {}  # Result row id -> SearchHit
+        state = {'seq': 0, 'after_id': None}
+
+        def run_search():
+            state['after_id'] = None
+            state['seq'] += 1
+            seq = state['seq']
+            query = query_var.get()
+            updates = {}
+            for root, books in self.index.books_by_root().items():
+                if root not in self.search_updates:
+                    self.update_search_index(root, books)  # A root attached since the window opened
+                updates[root] = self.search_updates[root]
+
+            def work():
+                found = []
+                indexed = 0
+                elapsed = 0.0
+                for update in updates.values():
+                    search_index = update.result()  # Only waits while that root's update runs
+                    started = time.perf_counter()
+                    indexed += len(search_index.files)
+                    if query.strip() and len(found) < SEARCH_RESULT_LIMIT:
+                        found += search_index.search(query, limit=SEARCH_RESULT_LIMIT - len(found))
+                    elapsed += time.perf_counter() - started
+                return found, indexed, elapsed
+
+            self.run_in_background(work, lambda result: show_results(seq, query, *result),
+                                   lambda e: status_label.config(text=f"Search failed: {e}"))
+
+        def show_results(seq, query, found, indexed, elapsed):
+            if seq != state['seq'] or not window.winfo_exists():
+                return  # A newer search is on its way
+            results.delete(*results.get_children())
+            hits.clear()
+            for i, hit in enumerate(found):
+                hits[str(i)] = hit
+                book = self.index.key_for(hit.base_path, hit.book) if hit.base_path in self.index.labels else hit.book
+                results.insert('', 'end', iid=str(i), values=(book, hit.filename, hit.line, hit.text[:300]))
+            if not query.strip():
+                status_label.config(text=f"{indexed:,} chapter files indexed")
+            else:
+                more = "+" if len(found) >= SEARCH_RESULT_LIMIT else ""
+                status_label.config(text=f"{len(found)}{more} hits in {elapsed * 1000:.0f} ms")
+
+        def on_query_change(*args):
+            if state['after_id'] is not None:
+                window.after_cancel(state['after_id'])
+            state['after_id'] = window.after(SEARCH_DEBOUNCE_MS, run_search)
+
+        def open_hit(event=None):
+            selection = results.selection()
+            hit = hits.get(selection[0]) if selection else None
+            if hit is not None:
+                self.edit_chapter_file(hit.base_path, hit.book, hit.filename, line=hit.line)
+
+        query_var.trace_add('write', on_query_change)
+        results.bind('<Double-1>', open_hit)
+        results.bind('<Return>', open_hit)
+        entry.bind('<Return>', lambda e: run_search())
+        # Bring every root's index up to date once; the watchers keep it current after that
+        for root, books in self.index.books_by_root().items():
+            self.update_search_index(root, books)
+        run_search()
+
+    def update_search_index(self, root, books, complete=True):
+        """Queue an update of the root's ChapterSearchIndex; returns a Future of the index.
+
+        Call it on the Tk thread.  Updates run one at a time on the search
+        worker, and only chapters whose mtime or size changed are re-read.
+        Searches wait for the root's latest update and never start one.
+        """
+        if self.search_worker is None:
+            self.search_worker = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+
+        def update():
+            search_index = self.search_indexes.get(root)
+            if search_index is None:
+                search_index = self.search_indexes[root] = ChapterSearchIndex.load(root)
+            try:
+                search_index.update(books, complete=complete)
+                search_index.save()
+            except Exception as e:
+                # Searches still get the index as the last successful update left it
+                log.warning("Search index update for %s failed: %s", root, e)
+            return search_index
+
+        future = self.search_updates[root] = self.search_worker.submit(update)
+        return future
+
+    def stats_for(self, root):
+        """The root's ShelfStats, loaded on first use; safe to call from worker threads."""
+        with self.shelf_stats_lock:
+            stats = self.shelf_stats.get(root)
+            if stats is None:
+                stats = self.shelf_stats[root] = ShelfStats.load(root)
+            return stats
+
+    def open_stats(self):
+        """Word, character and chapter counts per book, per chapter and for the whole shelf."""
+        if self.index is None:
+            messagebox.showinfo("Statistics", "Open a bookshelf first.")
+            return
 
-        chapters_dir = os.path.join(base_path, 'bookshelf', book, 'chapters')
-        file_path = os.path.join(chapters_dir, filename)
+        window = Toplevel(self.root)
+        window.title("Manuscript Statistics")
+        window.geometry("900x600")
+        top = tk.Frame(window)
+        top.pack(fill='x', padx=10, pady=5)
+        status_label = tk.Label(top, text="Counting chapters...", anchor='w')
+        status_label.pack(side='left', fill='x', expand=True)
+        refresh_button = tk.Button(top, text="Refresh")
+        refresh_button.pack(side='right')
+        totals_label = tk.Label(window, text="", anchor='w')
+        totals_label.pack(side='bottom', fill='x', padx=10, pady=(0, 10))
+
+        table = ttk.Treeview(window, columns=('chapters', 'words', 'characters', 'reading'))
+        table.heading('#0', text="Book / Chapter", anchor='w')
+        for column, heading in (('chapters', "Chapters"), ('words', "Words"),
+                                ('characters', "Characters"), ('reading', "Reading Time")):
+            table.heading(column, text=heading, anchor='e')
+            table.column(column, width=110, anchor='e', stretch=False)
+        table.column('#0', width=400)
+        scrollbar = tk.Scrollbar(window, orient='vertical', command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y', padx=(0, 10))
+        table.pack(fill='both', expand=True, padx=(10, 0))
+
+        chapters_by_key = {}  # Book row id -> [(filename, words, characters)], inserted when opened
+
+        def count():
+            refresh_button.config(state='disabled')
+            status_label.config(text="Counting chapters...")
+            books_by_root = self.index.books_by_root()
+
+            def work():
+                started = time.perf_counter()
+                counted = {}
+                recounted = 0
+                for root, books in books_by_root.items():
+                    stats = self.stats_for(root)
+                    # Only chapters whose mtime or size changed are re-read
+                    recounted += stats.update(books)
+                    stats.save()
+                    counted[root] = stats.by_book()
+                return counted, recounted, time.perf_counter() - started
+
+            def on_error(e):
+                if window.winfo_exists():
+                    refresh_button.config(state='normal')
+                    status_label.config(text=f"Counting failed: {e}")
+            self.run_in_background(work, lambda result: show(*result), on_error)
+
+        def show(counted, recounted, elapsed):
+            if not window.winfo_exists():
+                return
+            opened = {row for row in table.get_children() if table.item(row, 'open')}
+            table.delete(*table.get_children())
+            chapters_by_key.clear()
+            books = chapter_total = word_total = character_total = 0
+            for record in self.index.records():
+                chapters = counted.get(record['base_path'], {}).get(record['book'], [])
+                words = sum(row[1] for row in chapters)
+                characters = sum(row[2] for row in chapters)
+                key = record['key']
+                table.insert('', 'end', iid=key, text=key, values=(
+                    len(chapters), f"{words:,}", f"{characters:,}", manuscript_stats.format_reading_time(words)
+                ))
+                if chapters:
+                    chapters_by_key[key] = chapters
+                    table.insert(key, 'end')  # Placeholder so the row can be opened
+                    if key in opened:
+                        fill_chapters(key)
+                        table.item(key, open=True)
+                books += 1
+                chapter_total += len(chapters)
+                word_total += words
+                character_total += characters
+            totals_label.config(text=(
+                f"Shelf: {books} books, {chapter_total:,} chapters, {word_total:,} words, "
+                f"{character_total:,} characters, about {manuscript_stats.format_reading_time(word_total)} "
+                f"of reading at {manuscript_stats.WORDS_PER_MINUTE} words a minute"
+            ))
+            status_label.config(text=f"{recounted:,} chapter files counted in {elapsed * 1000:.0f} ms")
+            refresh_button.config(state='normal')
+
+        def fill_chapters(key):
+            chapters = chapters_by_key.pop(key, None)
+            if chapters is None:
+                return  # Already filled
+            table.delete(*table.get_children(key))
+            for filename, words, characters in chapters:
+                table.insert(key, 'end', text=filename, values=(
+                    "", f"{words:,}", f"{characters:,}", manuscript_stats.format_reading_time(words)
+                ))
+
+        table.bind('<<TreeviewOpen>>', lambda e: fill_chapters(table.focus()))
+        refresh_button.config(command=count)
+        count()
+
+    def edit_chapter_file(self, base_path, book, filename, line=None):
+        """Open a modal to edit the selected chapter file.
+
+        The file is read on a worker thread and inserted in chunks from
+        after() so large chapters don't freeze the modal; the text and Save
+        stay disabled until the last chunk is in. Saves are atomic
+        and run on a worker thread; autosave is debounced and skipped when
+        the buffer hash matches what is already on disk. With ``line`` the
+        cursor starts on, and highlights, that line.
+        """
+        log.debug("Entering edit_chapter_file: %s for book: %s", filename, book)
+        if filename in CHAPTER_PLACEHOLDERS:
+            log.debug("Invalid filename, returning")
+            return  # Silently return, no modal for invalid options
 
-        try:
-            # Read file content
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            print(f"[DEBUG] Successfully read {filename}")
-        except Exception as e:
-            print(f"[DEBUG] Failed to read {filename}: {e}")
-            messagebox.showerror("Error", f"Failed to read {filename}: {e}")
-            return
+        file_path = bookshelf.chapter_path(base_path, book, filename)
 
         # Create modal window
         modal = Toplevel(self.root)
@@ -274,337 +1417,613 @@ class BookBuilderUI:
         modal.geometry("1000x1200")  # Increased size
         modal.transient(self.root)  # Make modal stay on top
         modal.grab_set()  # Capture input to modal
-        print(f"[DEBUG] Modal opened for {filename}")
+        log.debug("Modal opened for %s", filename)
 
         # Create frame for textarea and scrollbar
         text_frame = tk.Frame(modal)
         text_frame.pack(padx=10, pady=10, fill='both', expand=True)
 
         # Add textarea with scrollbar
-        textarea = tk.Text(text_frame, wrap='word', height=30, width=80)  # Increased size
+        textarea = tk.Text(text_frame, wrap='word', height=30, width=80, undo=True)  # Increased size
         scrollbar = tk.Scrollbar(text_frame, orient='vertical', command=textarea.yview)
         textarea.configure(yscrollcommand=scrollbar.set)
-        textarea.insert('1.0', content)
         textarea.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
+        textarea.config(state='disabled')
+
+        # Save/Close buttons, autosave toggle and status line
+        button_frame = tk.Frame(modal)
+        button_frame.pack(fill='x')
+        save_button = tk.Button(button_frame, text="Save", state='disabled')
+        save_button.pack(side='left', padx=5, pady=5)
+        close_button = tk.Button(button_frame, text="Close")
+        close_button.pack(side='left', padx=5, pady=5)
+        autosave_var = tk.BooleanVar(modal, value=True)
+        tk.Checkbutton(button_frame, text="Autosave", variable=autosave_var).pack(side='left', padx=5)
+        status_label = tk.Label(button_frame, text="Loading...", anchor='w')
+        status_label.pack(side='left', padx=10, fill='x', expand=True)
+
+        state = {
+            'loaded': False,
+            'saved_hash': None,  # sha256 of the text last read from or written to disk
+            'saving': False,
+            'resave': None,  # Save requested while another was in flight: close_after flag
+            'autosave_id': None,
+        }
+
+        def content_hash(text):
+            return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        def on_read(content):
+            if not modal.winfo_exists():
+                return
+            state['saved_hash'] = content_hash(content)
+            insert_chunk(content, 0)
 
-        # Save and Cancel buttons
-        def save_file():
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(textarea.get('1.0', 'end-1c'))
-                messagebox.showinfo("Success", f"Saved changes to {filename}")
+        def insert_chunk(content, offset):
+            if not modal.winfo_exists():
+                return
+            # Only editable for the insert itself, so typing can't land between chunks
+            textarea.config(state='normal')
+            textarea.insert('end-1c', content[offset:offset + EDITOR_LOAD_CHUNK])
+            textarea.config(state='disabled')
+            offset += EDITOR_LOAD_CHUNK
+            if offset < len(content):
+                status_label.config(text=f"Loading... {offset * 100 // len(content)}%")
+                modal.after(1, insert_chunk, content, offset)
+                return
+            textarea.config(state='normal')
+            textarea.edit_reset()  # Loading shouldn't be undoable
+            textarea.edit_modified(False)
+            if line:
+                textarea.mark_set('insert', f'{line}.0')
+                textarea.tag_configure('search_hit', background='#fff3a0')
+                textarea.tag_add('search_hit', f'{line}.0', f'{line}.0 lineend')
+                textarea.see('insert')
+                textarea.focus_set()
+            else:
+                textarea.mark_set('insert', '1.0')
+            state['loaded'] = True
+            save_button.config(state='normal')
+            status_label.config(text=f"Loaded {len(content):,} characters")
+            log.debug("Successfully read %s", filename)
+
+        def on_read_error(e):
+            log.debug("Failed to read %s: %s", filename, e)
+            if modal.winfo_exists():
                 modal.destroy()
-                print(f"[DEBUG] Saved {filename} and closed modal")
+            messagebox.showerror("Error", f"Failed to read {filename}: {e}")
+
+        def read_file():
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+
+        def write_if_changed(text, saved_hash):
+            text_hash = content_hash(text)
+            if text_hash == saved_hash:
+                return text_hash, False
+            bookshelf.atomic_write(file_path, text)
+            try:
+                self.stats_for(base_path).record_text(book, filename, text)
             except Exception as e:
+                # The chapter is saved; the stats window recounts it from disk next time
+                log.warning("Failed to update word counts for %s/%s: %s", book, filename, e)
+            return text_hash, True
+
+        def save_file(close_after=False):
+            if not state['loaded']:
+                return
+            if state['autosave_id'] is not None:
+                modal.after_cancel(state['autosave_id'])
+                state['autosave_id'] = None
+            if state['saving']:
+                state['resave'] = close_after or bool(state['resave'])
+                return
+            state['saving'] = True
+            status_label.config(text="Saving...")
+            text = textarea.get('1.0', 'end-1c')
+            saved_hash = state['saved_hash']
+
+            def on_saved(result):
+                text_hash, written = result
+                state['saving'] = False
+                state['saved_hash'] = text_hash
+                if written:
+                    log.debug("Saved %s", filename)
+                if not modal.winfo_exists():
+                    return
+                status_label.config(text=f"Saved at {datetime.now().strftime('%H:%M:%S')}" if written else "No changes")
+                if state['resave'] is not None:
+                    close_after_resave = state['resave']
+                    state['resave'] = None
+                    save_file(close_after_resave)
+                elif close_after:
+                    messagebox.showinfo("Success", f"Saved changes to {filename}")
+                    modal.destroy()
+                    log.debug("Saved %s and closed modal", filename)
+
+            def on_save_error(e):
+                state['saving'] = False
+                state['resave'] = None
+                log.debug("Failed to save %s: %s", filename, e)
+                if modal.winfo_exists():
+                    status_label.config(text="Save failed")
                 messagebox.showerror("Error", f"Failed to save {filename}: {e}")
-                print(f"[DEBUG] Failed to save {filename}: {e}")
 
-        tk.Button(modal, text="Save", command=save_file).pack(side='left', padx=5, pady=5)
-        tk.Button(modal, text="Cancel", command=modal.destroy).pack(side='left', padx=5, pady=5)
+            self.run_in_background(lambda: write_if_changed(text, saved_hash), on_saved, on_save_error)
+
+        def on_modified(event=None):
+            if not textarea.edit_modified():
+                return
+            textarea.edit_modified(False)  # Re-arm <<Modified>>
+            if not state['loaded'] or not autosave_var.get():
+                return
+            if state['autosave_id'] is not None:
+                modal.after_cancel(state['autosave_id'])
+            state['autosave_id'] = modal.after(EDITOR_AUTOSAVE_MS, save_file)
+
+        def close():
+            if state['loaded'] and content_hash(textarea.get('1.0', 'end-1c')) != state['saved_hash']:
+                if not messagebox.askyesno("Unsaved Changes", f"Discard unsaved changes to {filename}?", parent=modal):
+                    return
+            if state['autosave_id'] is not None:
+                modal.after_cancel(state['autosave_id'])
+            modal.destroy()
+
+        textarea.bind('<<Modified>>', on_modified)
+        save_button.config(command=lambda: save_file(close_after=True))
+        close_button.config(command=close)
+        modal.protocol("WM_DELETE_WINDOW", close)
+        self.run_in_background(read_file, on_read, on_read_error)
 
     def run_command(self, command, book):
         try:
-            base_path = self.path_var.get()
+            self.index.refresh([book])
+            record = self.index.get(book)
+            if record is None:
+                messagebox.showerror("Error", f"{book} is no longer in books.ini")
+                return
+            base_path = record['base_path']
             work_dir = os.path.join(base_path, 'bookshelf')
-            php_script = os.path.join(work_dir, 'build.php')
             
             if not os.path.isdir(work_dir):
                 messagebox.showerror("Error", f"Directory not found: {work_dir}")
                 return
-            if not os.path.isfile(php_script):
-                messagebox.showerror("Error", f"build.php not found at {php_script}")
+            engine = self.build_engine(base_path)
+            problem = engine.problem(base_path)
+            if problem:
+                messagebox.showerror("Error", f"Cannot {command} with the {engine.name} engine: {problem}")
                 return
 
-            if command == 'build':
-                cmd = ['php', php_script, book]
-            elif command == 'clean':
-                cmd = ['php', php_script, '--clean', book]
-            else:
+            if command not in ('build', 'clean'):
                 messagebox.showerror("Error", f"Unknown command: {command}")
                 return
 
-            print(f"[DEBUG] Running command: {' '.join(cmd)} in {work_dir}")
-            result = subprocess.run(
-                cmd,
-                cwd=work_dir,
-                capture_output=True,
-                text=True,
-                check=False
-            )
+            active_job = self.jobs.active_job_for(book)
+            if active_job is not None:
+                messagebox.showwarning("Busy", f"{active_job.describe()} is still in progress.")
+                return
 
-            if result.returncode == 0:
-                messagebox.showinfo("Success", f"{command.capitalize()} completed for {book}\nOutput:\n{result.stdout}")
-            else:
-                messagebox.showerror(
-                    "Error",
-                    f"{command.capitalize()} failed for {book}\nError:\n{result.stderr}\nOutput:\n{result.stdout}"
-                )
-            print(f"[DEBUG] {command} result: returncode={result.returncode}, stdout={result.stdout}, stderr={result.stderr}")
+            self.submit_book_job(record, command, engine)
 
-        except FileNotFoundError:
-            messagebox.showerror("Error", "PHP executable not found. Ensure PHP is installed and in PATH.")
-            print("[ERROR] PHP executable not found")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to run {command} for {book}: {e}")
-            print(f"[ERROR] Failed to run {command}: {e}")
-
-    def preview_book(self, base_path, book):
-        epub_path = os.path.join(base_path, 'bookshelf', book, f"{book}.epub")
-        if not os.path.isfile(epub_path):
+            log.error("Failed to run %s: %s", command, e)
+
+    def build_engine(self, base_path):
+        return build_engines.select_engine(self.build_engines, self.build_engine_var.get(), base_path)
+
+    def submit_book_job(self, record, command, engine):
+        """Queue a build or clean of one book; builds skip unchanged books unless forced.
+
+        The job is filed under the record's row key, so its status shows on
+        the right row when two shelves have a book of the same name.
+        """
+        base_path, book = record['base_path'], record['book']
+        work_dir = os.path.join(base_path, 'bookshelf')
+        cmd = engine.command(base_path, command, book)
+        skip_if = on_success = None
+        if command == 'build':
+            incremental = IncrementalBuild(base_path, book, record['fields'], force=self.force_rebuild_var.get())
+            skip_if = incremental.skip_reason
+            on_success = epub_verify.verified(self.verify_cache_for(base_path), book, incremental.record)
+
+        log.debug("Queueing command: %s in %s", build_engines.describe_command(cmd), work_dir)
+        job = self.jobs.submit(command, record['key'], cmd, work_dir, skip_if=skip_if, on_success=on_success)
+        self.update_job_row(job)
+        self.update_book_status(job)
+        return job
+
+    def preview_book(self, key):
+        record = self.index.get(key)
+        book = record['book'] if record else key
+        epub_path = bookshelf.epub_path(record['base_path'], book) if record else None
+        if record is None or not record['has_epub']:
             messagebox.showwarning("File Not Found", f"EPUB not found for {book} at {epub_path}")
             return
 
+        preview_window = Toplevel(self.root)
         try:
-            book_obj = epub.read_epub(epub_path)
-            preview_window = Toplevel(self.root)
+            metadata = read_epub_metadata(epub_path)
+            preview_window.title(
+                f"Preview: {epub_meta.first(metadata, 'title', book)} "
+                f"by {epub_meta.first(metadata, 'creator', 'Unknown')}"
+            )
+        except Exception as e:
+            log.warning("Could not read metadata for %s: %s", book, e)
             preview_window.title(f"Preview: {book}")
-            preview_window.geometry("800x600")
-
-            html_view = HTMLScrolledText(preview_window, html="", wrap='word')
-            html_view.pack(expand=True, fill='both')
-
-            title = book_obj.get_metadata('DC', 'title')
-            author = book_obj.get_metadata('DC', 'creator')
-            html_content = f"<h2>{title[0][0] if title else 'Unknown'}</h2>"
-            html_content += f"<h4>by {author[0][0] if author else 'Unknown'}</h4><hr>"
-
-            for item in book_obj.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-                html_content += item.get_content().decode('utf-8') + "<br><br>"
+        preview_window.geometry("800x600")
+        loading = tk.Label(preview_window, text=f"Loading {book}.epub...")
+        loading.pack(expand=True)
 
-            html_view.set_html(html_content)
+        def on_loaded(parsed):
+            if not preview_window.winfo_exists():
+                return
+            loading.destroy()
+            self.show_preview_pages(preview_window, parsed)
 
-        except Exception as e:
+        def on_error(e):
+            if preview_window.winfo_exists():
+                preview_window.destroy()
             messagebox.showerror("Error", f"Failed to read EPUB: {e}")
 
-    def post_to_twitter(self, base_path, book, amazon_us=None, amazon_uk=None):
-        try:
-            epub_path = os.path.join(base_path, 'bookshelf', book, f"{book}.epub")
-            cover_path = os.path.join(base_path, 'bookshelf', book, 'media', 'cover-image-template.jpg')
+        self.run_in_background(lambda: self.preview_cache.load(epub_path), on_loaded, on_error)
 
-            if not os.path.isfile(epub_path):
-                messagebox.showerror("Missing File", "EPUB file not found.")
-                return
+    def show_preview_pages(self, preview_window, parsed):
+        """One chapter per page, rendered on demand, with prev/next and a chapter index."""
+        from tkhtmlview import HTMLScrolledText  # For rendering HTML
 
-            books_config = parse_books_ini(base_path)
-            book_title = books_config[book].get('book[title]', 'unknown')
-            book_subtitle = books_config[book].get('book[subtitle]', 'unknown')
-            amazon_us = books_config[book].get('amazon[us]')
-            amazon_uk = books_config[book].get('amazon[uk]')
+        if not parsed.chapters:
+            tk.Label(preview_window, text="This EPUB has no readable chapters.").pack(expand=True)
+            return
 
-            if not (amazon_us or amazon_uk):
-                messagebox.showwarning(
-                    "Missing Amazon Links",
-                    "Cannot post tweet: At least one of amazon[us] or amazon[uk] is required in books.ini."
-                )
+        nav = tk.Frame(preview_window)
+        nav.pack(fill='x', padx=5, pady=5)
+        html_view = HTMLScrolledText(preview_window, html="", wrap='word')
+        html_view.pack(expand=True, fill='both')
+
+        page = tk.IntVar(value=0)
+        chapter_var = tk.StringVar()
+        labels = [f"{i + 1}. {parsed.chapter_title(i)}" for i in range(len(parsed))]
+
+        def show(index):
+            index = max(0, min(index, len(parsed) - 1))
+            page.set(index)
+            chapter_var.set(labels[index])
+            html_content = ""
+            if index == 0:
+                html_content = f"<h2>{parsed.title}</h2><h4>by {parsed.author}</h4><hr>"
+            with tracing.span('preview.render', chapter=index):
+                html_content += parsed.chapter_html(index)
+                html_view.set_html(html_content)
+                html_view.yview_moveto(0)
+            prev_button.config(state='normal' if index > 0 else 'disabled')
+            next_button.config(state='normal' if index < len(parsed) - 1 else 'disabled')
+            page_label.config(text=f"Chapter {index + 1} of {len(parsed)}")
+
+        prev_button = tk.Button(nav, text="< Prev", command=lambda: show(page.get() - 1))
+        prev_button.pack(side='left')
+        next_button = tk.Button(nav, text="Next >", command=lambda: show(page.get() + 1))
+        next_button.pack(side='left', padx=5)
+        chapter_index = ttk.Combobox(nav, textvariable=chapter_var, values=labels, state='readonly', width=50)
+        chapter_index.pack(side='left', padx=5)
+        chapter_index.bind('<<ComboboxSelected>>', lambda e: show(chapter_index.current()))
+        page_label = tk.Label(nav, text="")
+        page_label.pack(side='right')
+        preview_window.bind('<Prior>', lambda e: show(page.get() - 1))
+        preview_window.bind('<Next>', lambda e: show(page.get() + 1))
+
+        show(0)
+
+    def repost_since(self):
+        return time.time() - self.repost_window_days * 86400
+
+    def enqueue_post(self, kind, book, payload, text):
+        last_sent = self.post_history.last_posted_text(
+            campaign.PLATFORM_FOR_KIND[kind], post_history.post_text(payload), self.repost_since()
+        )
+        if last_sent is not None and not messagebox.askyesno(
+            "Repost?",
+            f"The same text was posted for {book} on {datetime.fromtimestamp(last_sent):%Y-%m-%d %H:%M}. "
+            "Post it again?"
+        ):
+            return None
+        job_id, created = self.post_queue.enqueue(kind, book, payload, social.idempotency_key(kind, book, text))
+        if not created:
+            status = self.post_queue.get(job_id)['status']
+            messagebox.showinfo("Already Queued", f"This post was already queued today (status: {status}).")
+            return None
+        return job_id
+
+    def open_campaign(self, books):
+        """Review generated posts for many books, then queue them over a time window."""
+        if not books:
+            messagebox.showinfo("Campaign", "No books selected.")
+            return
+        self.index.refresh(books)
+
+        window = Toplevel(self.root)
+        window.title(f"Promotion Campaign ({len(books)} books)")
+        window.geometry("1000x650")
+
+        options = tk.Frame(window)
+        options.pack(fill='x', padx=10, pady=5)
+        platform_vars = {
+            social.TWEET: tk.BooleanVar(value=True),
+            social.INSTAGRAM: tk.BooleanVar(value=True),
+        }
+        tk.Checkbutton(options, text="Twitter", variable=platform_vars[social.TWEET]).pack(side='left')
+        tk.Checkbutton(options, text="Instagram", variable=platform_vars[social.INSTAGRAM]).pack(side='left', padx=5)
+        tk.Label(options, text="Spread over (hours):").pack(side='left', padx=(15, 2))
+        window_var = tk.DoubleVar(value=load_config().get('campaign_window_hours', campaign.DEFAULT_WINDOW_HOURS))
+        tk.Spinbox(options, from_=0, to=24 * 14, increment=0.5, width=6, textvariable=window_var).pack(side='left')
+
+        table = ttk.Treeview(window, columns=('book', 'platform', 'state', 'text'), show='headings', height=15)
+        for column, heading, width in (('book', "Book", 180), ('platform', "Platform", 90),
+                                       ('state', "Status", 160), ('text', "Text", 520)):
+            table.heading(column, text=heading)
+            table.column(column, width=width, stretch=column == 'text')
+        table.pack(fill='both', expand=True, padx=10)
+        detail = tk.Text(window, height=8, wrap='word', state='disabled')
+        detail.pack(fill='x', padx=10, pady=5)
+
+        buttons = tk.Frame(window)
+        buttons.pack(fill='x', padx=10, pady=(0, 10))
+        report_var = tk.StringVar(value="Generating posts...")
+        tk.Label(buttons, textvariable=report_var, anchor='w', justify='left').pack(side='left', fill='x', expand=True)
+        send_button = tk.Button(buttons, text="Send", state='disabled')
+        send_button.pack(side='right')
+        remove_button = tk.Button(buttons, text="Remove Selected", command=lambda: table.delete(*table.selection()))
+        remove_button.pack(side='right', padx=5)
+
+        posts = {}  # Table row id -> planned post
+        sent = []  # Campaign id once sent; the table is then frozen
+
+        def show_detail(event=None):
+            selection = table.selection()
+            post = posts.get(selection[0]) if selection else None
+            detail.config(state='normal')
+            detail.delete('1.0', 'end')
+            if post is not None:
+                detail.insert('1.0', post['text'] or post['problem'])
+            detail.config(state='disabled')
+
+        def on_planned(planned):
+            if not window.winfo_exists():
+                return
+            table.delete(*table.get_children())
+            posts.clear()
+            for i, post in enumerate(planned):
+                row_id = str(i)
+                posts[row_id] = post
+                if post['problem']:
+                    state = f"Skip: {post['problem']}"
+                elif post['reposted_at']:
+                    state = f"Repost (sent {datetime.fromtimestamp(post['reposted_at']):%Y-%m-%d})"
+                else:
+                    state = "Ready"
+                table.insert('', 'end', iid=row_id, values=(
+                    post['book'], post['kind'].capitalize(), state, post['text'].replace('\n', ' ')
+                ))
+            ready = sum(1 for post in planned if not post['problem'])
+            report_var.set(f"{ready} posts ready, {len(planned) - ready} skipped. Review, remove any, then Send.")
+            send_button.config(state='normal' if ready else 'disabled')
+
+        def plan():
+            if sent:
                 return
+            platforms = [kind for kind, var in platform_vars.items() if var.get()]
+            send_button.config(state='disabled')
+            history, since = self.post_history, self.repost_since()
+
+            def work():
+                planned = campaign.plan_posts(self.index, books, platforms)
+                for post in planned:
+                    post['reposted_at'] = None if post['problem'] else history.last_posted_text(
+                        campaign.PLATFORM_FOR_KIND[post['kind']], post_history.post_text(post['payload']), since
+                    )
+                return planned
+            self.run_in_background(work, on_planned, lambda e: report_var.set(f"Failed to generate posts: {e}"))
 
-            if book_title == 'unknown' or book_subtitle == 'unknown':
-                messagebox.showwarning(
-                    "Missing Metadata",
-                    "Cannot post tweet: book[title] or book[subtitle] missing in books.ini."
+        def send():
+            rows = [row_id for row_id in table.get_children() if not posts[row_id]['problem']]
+            try:
+                window_seconds = max(0.0, float(window_var.get())) * 3600
+            except (tk.TclError, ValueError):
+                messagebox.showerror("Campaign", "Enter the time window in hours.", parent=window)
+                return
+            reposts = [row_id for row_id in rows if posts[row_id]['reposted_at']]
+            question = f"Queue {len(rows)} posts over {window_seconds / 3600:g} hours?"
+            if reposts:
+                question += (f"\n\n{len(reposts)} of them repeat text posted in the last "
+                             f"{self.repost_window_days:g} days. Yes sends them too; No skips them.")
+                answer = messagebox.askyesnocancel("Send Campaign", question, parent=window)
+                if answer is None:
+                    return
+                if not answer:
+                    for row_id in reposts:
+                        table.set(row_id, 'state', "Skip: recent repost")
+                    rows = [row_id for row_id in rows if row_id not in reposts]
+            elif not messagebox.askyesno("Send Campaign", question, parent=window):
+                return
+            save_config(campaign_window_hours=window_seconds / 3600)
+            campaign_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+            started_at = time.time()
+            planned = [posts[row_id] for row_id in rows]
+            duplicates = 0
+            for row_id, post, delay in zip(rows, planned, campaign.schedule_delays(planned, window_seconds)):
+                payload = dict(post['payload'], campaign=campaign_id)
+                text = payload.get('text') or payload['caption']
+                _, created = self.post_queue.enqueue(
+                    post['kind'], post['book'], payload,
+                    social.idempotency_key(post['kind'], post['book'], text), delay=delay
                 )
+                if created:
+                    table.set(row_id, 'state', "Queued")
+                else:
+                    table.set(row_id, 'state', "Skip: already queued today")
+                    duplicates += 1
+            log.debug("Campaign %s: queued %s posts, %s duplicates", campaign_id, len(rows) - duplicates, duplicates)
+            for widget in (send_button, remove_button):
+                widget.config(state='disabled')
+            sent.append(campaign_id)
+            poll_report(campaign_id, started_at, dict(((posts[r]['book'], posts[r]['kind']), r) for r in rows))
+
+        def poll_report(campaign_id, started_at, rows_by_post):
+            if not window.winfo_exists() or self.post_queue is None:
+                return
+            jobs = campaign.campaign_jobs(self.post_queue, campaign_id)
+            for job in jobs:
+                row_id = rows_by_post.get((job['book'], job['kind']))
+                if row_id is not None:
+                    state = job['status'].capitalize()
+                    if job['last_error']:
+                        state += f" ({job['last_error']})"
+                    table.set(row_id, 'state', state)
+            report = campaign.summarize(jobs, started_at)
+            counts = report['counts']
+            text = (f"Campaign {campaign_id}: {counts['done']} done, {counts['pending']} pending, "
+                    f"{counts['running']} sending, {counts['failed']} failed of {report['total']} "
+                    f"(incl. replies) - {report['per_hour']:.1f} posts/hour")
+            if report['failures']:
+                text += "\nFailed: " + "; ".join(f"{book} {kind}" for book, kind, _ in report['failures'][:5])
+            report_var.set(text)
+            if counts['pending'] or counts['running']:
+                window.after(CAMPAIGN_POLL_MS, lambda: poll_report(campaign_id, started_at, rows_by_post))
+
+        table.bind('<<TreeviewSelect>>', show_detail)
+        send_button.config(command=send)
+        for var in platform_vars.values():
+            var.trace_add('write', lambda *args: plan())
+        plan()
+
+    def post_to_twitter(self, key):
+        try:
+            self.index.refresh([key])
+            record = self.index.get(key)
+            if record is None or not record['has_epub']:
+                messagebox.showerror("Missing File", "EPUB file not found.")
+                return
+            problem = social.tweet_problem(record)
+            if problem:
+                title, message = problem
+                messagebox.showwarning(title, f"Cannot post tweet: {message}")
                 return
 
-            book_obj = epub.read_epub(epub_path)
-            author = book_obj.get_metadata('DC', 'creator')
-
-            base_text = (
-                f"Discover a new book: {book_title}. {book_subtitle}. "
-                f"Written by {author[0][0] if author else 'an unknown author'}. "
-                f"This engaging read is now available for you to explore!"
-            )
-
-            cta_text = "Here's the link to buy:"
-            if amazon_us:
-                cta_text += f"\n🇺🇸 US: {amazon_us}"
-            if amazon_uk:
-                cta_text += f"\n🇬🇧 UK: {amazon_uk}"
-
-            if len(base_text) > 280:
-                base_text = base_text[:277] + "..."
-
-            if len(cta_text) > 280:
-                cta_text = cta_text[:277] + "..."
+            base_path, book = record['base_path'], record['book']
+            metadata = read_epub_metadata(bookshelf.epub_path(base_path, book))
+            payload = social.tweet_payload(base_path, record, epub_meta.first(metadata, 'creator'))
+            base_text, cta_text = payload['text'], payload['reply_text']
 
-            print("[DEBUG] Main Tweet Text:", base_text.encode('utf-8', 'replace').decode())
-            print("[DEBUG] Reply Text:", cta_text.encode('utf-8', 'replace').decode())
+            log.debug("Main Tweet Text: %s", base_text)
+            log.debug("Reply Text: %s", cta_text)
 
-            cover_status = "with cover image" if os.path.isfile(cover_path) else "without cover image"
+            cover_status = "with cover image" if record['has_cover'] else "without cover image"
             preview_message = f"Post this tweet {cover_status}?\n\nMain Tweet:\n{base_text}"
-            preview_message += f"\n\nReply with Links (posted after 60s):\n{cta_text}"
+            preview_message += f"\n\nReply with Links (posted after {social.REPLY_DELAY_SECONDS}s):\n{cta_text}"
             if not messagebox.askyesno("Confirm Tweet", preview_message):
-                print("[DEBUG] Tweet posting cancelled by user")
+                log.debug("Tweet posting cancelled by user")
                 messagebox.showinfo("Cancelled", "Tweet posting cancelled.")
                 return
 
-            consumer_key = os.getenv("TWITTER_API_KEY")
-            consumer_secret = os.getenv("TWITTER_API_SECRET")
-            access_token = os.getenv("TWITTER_ACCESS_TOKEN")
-            access_token_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
-
-            if not all([consumer_key, consumer_secret, access_token, access_token_secret]):
-                raise ValueError("Missing OAuth 1.0a credentials")
-
-            client = tweepy.Client(
-                consumer_key=consumer_key,
-                consumer_secret=consumer_secret,
-                access_token=access_token,
-                access_token_secret=access_token_secret
-            )
-
-            auth = tweepy.OAuth1UserHandler(consumer_key, consumer_secret, access_token, access_token_secret)
-            api = tweepy.API(auth)
-
-            media_id = None
-            if os.path.isfile(cover_path):
-                try:
-                    media = api.media_upload(cover_path)
-                    media_id = media.media_id
-                    print("[DEBUG] Media ID:", media_id)
-                except Exception as media_error:
-                    print("[WARNING] Failed to upload media:", media_error)
-
-            try:
-                user = client.get_me()
-                print("[DEBUG] Authenticated as:", user.data.username)
-            except Exception as auth_error:
-                raise Exception(f"Authentication failed: {auth_error}")
-
-            main_tweet_response = client.create_tweet(text=base_text, media_ids=[media_id] if media_id else None)
-            print("[DEBUG] Main Tweet response:", main_tweet_response)
-            main_tweet_id = main_tweet_response.data['id']
-
-            tweets_file = os.path.join(base_path, 'bookshelf', book, 'tweets.txt')
-            try:
-                with open(tweets_file, 'a', encoding='utf-8') as f:
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    f.write(f"--- Posted at {timestamp} ---\n")
-                    f.write(f"Main Tweet (ID: {main_tweet_id}):\n{main_tweet_response.data['text']}\n")
-                    f.write("\n")
-                print(f"[DEBUG] Saved main tweet to {tweets_file}")
-            except Exception as file_error:
-                print(f"[WARNING] Failed to write to {tweets_file}: {file_error}")
-
-            def post_reply():
-                try:
-                    reply_response = client.create_tweet(
-                        text=cta_text,
-                        in_reply_to_tweet_id=main_tweet_id
-                    )
-                    print("[DEBUG] Reply Tweet response:", reply_response)
-
-                    try:
-                        with open(tweets_file, 'a', encoding='utf-8') as f:
-                            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            f.write(f"--- Reply Posted at {timestamp} ---\n")
-                            f.write(f"Reply (ID: {reply_response.data['id']}):\n{reply_response.data['text']}\n")
-                            f.write("\n")
-                        print(f"[DEBUG] Saved reply to {tweets_file}")
-                    except Exception as file_error:
-                        print(f"[WARNING] Failed to write reply to {tweets_file}: {file_error}")
-
-                    messagebox.showinfo(
-                        "Tweeted!",
-                        "Main tweet and reply of Amazon links successfully posted to Twitter!"
-                    )
-                except Exception as reply_error:
-                    print("[WARNING] Failed to post reply:", reply_error)
-                    messagebox.showwarning(
-                        "Partial Success",
-                        f"Main tweet posted, but failed to post reply of Amazon links: {reply_error}"
-                    )
-
-            self.root.after(60000, post_reply)
-            messagebox.showinfo(
-                "Tweeted!",
-                "Main tweet posted! Reply of Amazon links will be posted in 60 seconds."
-            )
+            if self.enqueue_post(social.TWEET, book, payload, base_text) is not None:
+                messagebox.showinfo(
+                    "Queued",
+                    "Tweet queued! The reply of Amazon links will follow "
+                    f"{social.REPLY_DELAY_SECONDS} seconds after it is posted."
+                )
 
         except Exception as e:
             traceback.print_exc()
-            messagebox.showerror("Twitter Error", f"Failed to tweet: {e}")
+            messagebox.showerror("Twitter Error", f"Failed to queue tweet: {e}")
 
-    def post_to_instagram(self, base_path, book, amazon_us=None, amazon_uk=None):
+    def post_to_instagram(self, key):
         try:
-            epub_path = os.path.join(base_path, 'bookshelf', book, f"{book}.epub")
-            cover_path = os.path.join(base_path, 'bookshelf', book, 'media', 'cover-image-template.jpg')
-
-            if not os.path.isfile(epub_path):
-                messagebox.showerror("Missing File", "EPUB file not found.")
-                return
-            if not os.path.isfile(cover_path):
-                messagebox.showerror("Missing File", "Cover image not found.")
+            self.index.refresh([key])
+            record = self.index.get(key)
+            problem = social.instagram_problem(record) if record else ("Missing File", "EPUB file not found.")
+            if problem:
+                messagebox.showerror(*problem)
                 return
 
-            book_obj = epub.read_epub(epub_path)
-            title = book_obj.get_metadata('DC', 'title')
-            author = book_obj.get_metadata('DC', 'creator')
-
-            base_text = (
-                f"📚 New Book: {title[0][0] if title else book}\n"
-                f"✍️ Author: {author[0][0] if author else 'Unknown'}\n"
-                f"Discover this gem today! #Bookstagram #IndieAuthor #BookLovers "
-                f"#NewRelease #ReadersOfInstagram #BookCommunity #AmazonFinds"
+            base_path, book = record['base_path'], record['book']
+            metadata = read_epub_metadata(bookshelf.epub_path(base_path, book))
+            if not (record['amazon_us'] or record['amazon_uk']):
+                log.debug("No Amazon links provided for this book")
+            payload = social.instagram_payload(
+                base_path, record, epub_meta.first(metadata, 'title'), epub_meta.first(metadata, 'creator')
             )
-            cta_text = ""
-            if amazon_us or amazon_uk:
-                cta_text = "\n📖 Get it now:"
-                if amazon_us:
-                    cta_text += f"\n🇺🇸 US: {amazon_us}"
-                if amazon_uk:
-                    cta_text += f"\n🇬🇧 UK: {amazon_uk}"
-            else:
-                print("[DEBUG] No Amazon links provided for this book")
+            caption = payload['caption']
 
-            caption = base_text + cta_text
-
-            if len(caption) > 2200:
-                max_base_length = 2200 - len(cta_text) - 3
-                base_text = base_text[:max_base_length] + "..."
-                caption = base_text + cta_text
-
-            print("[DEBUG] Instagram Caption:", caption.encode('utf-8', 'replace').decode())
+            log.debug("Instagram Caption: %s", caption)
 
             preview_message = f"Post this to Instagram with cover image?\n\n{caption}"
             if not messagebox.askyesno("Confirm Instagram Post", preview_message):
-                print("[DEBUG] Instagram posting cancelled by user")
+                log.debug("Instagram posting cancelled by user")
                 messagebox.showinfo("Cancelled", "Instagram posting cancelled.")
                 return
 
-            username = os.getenv("INSTAGRAM_USERNAME")
-            password = os.getenv("INSTAGRAM_PASSWORD")
+            if self.enqueue_post(social.INSTAGRAM, book, payload, caption) is not None:
+                messagebox.showinfo("Queued", "Instagram post queued!")
 
-            if not all([username, password]):
-                raise ValueError("Missing Instagram credentials")
+        except Exception as e:
+            traceback.print_exc()
+            messagebox.showerror("Instagram Error", f"Failed to queue Instagram post: {e}")
 
-            client = InstagramClient()
-            try:
-                client.login(username, password)
-                print("[DEBUG] Instagram login successful")
-            except LoginRequired:
-                raise ValueError("Invalid Instagram credentials")
-            except ClientError as auth_error:
-                raise Exception(f"Instagram authentication failed: {auth_error}")
+LAZY_MODULES = ('ebooklib', 'tkhtmlview', 'tweepy', 'instagrapi', 'PIL')
 
-            try:
-                client.photo_upload(
-                    path=cover_path,
-                    caption=caption
-                )
-                print("[DEBUG] Instagram post successful")
-                messagebox.showinfo("Posted!", "Successfully posted to Instagram!")
-            except Exception as upload_error:
-                print("[WARNING] Failed to upload to Instagram:", upload_error)
-                raise Exception(f"Failed to post to Instagram: {upload_error}")
 
-            client.logout()
+def profile_startup(budget=None):
+    """Open the window, report where startup time went, then exit.
 
-        except Exception as e:
-            traceback.print_exc()
-            messagebox.showerror("Instagram Error", f"Failed to post to Instagram: {e}")
+    Returns a non-zero exit status when time-to-window exceeds ``budget``
+    seconds, so it can gate CI.
+    """
+    tk_start = time.perf_counter()
+    root = tk.Tk()
+    ui_start = time.perf_counter()
+    BookBuilderUI(root)
+    paint_start = time.perf_counter()
+    root.update()  # Map the window and run pending idle/paint work
+    painted = time.perf_counter()
+
+    total = painted - _PROCESS_START
+    print("Startup profile (seconds):")
+    print(f"  module imports      {_IMPORTS_DONE - _PROCESS_START:8.3f}")
+    print(f"  Tk init             {ui_start - tk_start:8.3f}")
+    print(f"  UI build + shelf    {paint_start - ui_start:8.3f}")
+    print(f"  first paint         {painted - paint_start:8.3f}")
+    print(f"  time to window      {total:8.3f}")
+    eager = [name for name in LAZY_MODULES if name in sys.modules]
+    if eager:
+        print(f"  WARNING: imported before first use: {', '.join(eager)}")
+    root.destroy()
+
+    if budget is not None and total > budget:
+        print(f"FAIL: time to window {total:.3f}s exceeds budget {budget:.3f}s")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Book Builder UI")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="report import and first-paint timings, then exit")
+    parser.add_argument('--startup-budget', type=float, metavar='SECONDS',
+                        help="with --profile-startup, exit 1 if time to window exceeds this")
+    parser.add_argument('--log-level', default=DEFAULT_LOG_LEVEL,
+                        help="DEBUG, INFO, WARNING or ERROR (default: $BOOK_BUILDER_LOG_LEVEL or INFO)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="record timing spans and write them to FILE as a Chrome trace")
+    args = parser.parse_args(argv)
+
+    tracing.configure_logging(args.log_level)
+    if args.trace:
+        tracing.enable(args.trace)
+
+    if args.profile_startup or args.startup_budget is not None:
+        sys.exit(profile_startup(args.startup_budget))
 
-def main():
     root = tk.Tk()
     app = BookBuilderUI(root)
     root.mainloop()
@@ -0,0 +1,172 @@
+"""Word and character counts for every chapter on the shelf.
+
+Counts are cached per chapter file in ``bookshelf/.bookbuilder/
+stats.json``, keyed by the file's mtime and size, so after the first run
+``update()`` only recounts chapters that changed.  The first count of a
+large shelf runs books in a process pool.  The chapter editor passes the
+text it saves to ``record_text``, so that file is current without being
+read back.
+
+Only Markdown, text and HTML chapters are counted; HTML tags are left out
+of both counts.
+"""
+import concurrent.futures
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+
+import tracing
+from bookshelf import CACHE_DIR_NAME, atomic_write, cache_dir, chapter_path, natural_sort_key, stamp_from_json
+from build_engines import HTML_EXTENSIONS, MARKDOWN_EXTENSIONS
+from search_index import scan_chapters
+
+log = logging.getLogger('book_builder.manuscript_stats')
+
+STATS_FILE_NAME = 'stats.json'
+STATS_VERSION = 2
+PARALLEL_MIN_FILES = 2000  # Below this, starting a spawn pool costs more than it saves
+WORDS_PER_MINUTE = 250
+WORD_RE = re.compile(r"\w[\w'’-]*")  # "don't" and "well-known" are one word each
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def is_counted(filename):
+    return os.path.splitext(filename)[1].lower() in MARKDOWN_EXTENSIONS + HTML_EXTENSIONS
+
+
+def count_text(text, filename=''):
+    """(words, characters) of chapter text; characters exclude line breaks."""
+    if os.path.splitext(filename)[1].lower() in HTML_EXTENSIONS:
+        text = html.unescape(TAG_RE.sub(' ', text))
+    return len(WORD_RE.findall(text)), len(text) - text.count('\n')
+
+
+def count_file(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return count_text(f.read(), path)
+
+
+def count_book_files(base_path, book, filenames):
+    """Count some of a book's chapters; runs in a pool worker."""
+    results = {}
+    for filename in filenames:
+        try:
+            results[filename] = count_file(chapter_path(base_path, book, filename))
+        except OSError as e:
+            log.warning("Cannot count %s/%s: %s", book, filename, e)
+    return book, results
+
+
+def reading_minutes(words):
+    return words / WORDS_PER_MINUTE
+
+
+def format_reading_time(words):
+    minutes = round(reading_minutes(words))
+    return f"{minutes // 60}h {minutes % 60:02d}m" if minutes >= 60 else f"{minutes}m"
+
+
+class ShelfStats:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.files = {}  # (book, filename) -> (stamp, words, characters)
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, base_path):
+        stats = cls(base_path)
+        path = os.path.join(base_path, 'bookshelf', CACHE_DIR_NAME, STATS_FILE_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STATS_VERSION:
+                stats.files = {(book, filename): (stamp_from_json(stamp), int(words), int(characters))
+                               for book, filename, stamp, words, characters in data['files']}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Ignoring unreadable chapter stats %s: %s", path, e)
+        return stats
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            files = [[book, filename, stamp, words, characters]
+                     for (book, filename), (stamp, words, characters) in self.files.items()]
+            data = json.dumps({'version': STATS_VERSION, 'files': files}, separators=(',', ':'))
+            self.dirty = False
+        try:
+            atomic_write(os.path.join(cache_dir(self.base_path), STATS_FILE_NAME), data)
+        except Exception as e:
+            log.warning("Failed to save chapter stats: %s", e)
+
+    def update(self, books, workers=None):
+        """Recount changed chapter files; returns the number of files read.
+
+        ``books`` is every book on the shelf: counts for any other book, or
+        for files that no longer exist, are dropped.
+        """
+        with tracing.span('stats.update', books=len(books)) as span:
+            stale = {}  # book -> [filename]
+            stamps = {}
+            with self._lock:
+                known = {key: entry[0] for key, entry in self.files.items()}
+            for book in books:
+                for filename, stamp in scan_chapters(self.base_path, book).items():
+                    if not is_counted(filename):
+                        continue
+                    stamps[(book, filename)] = stamp
+                    if known.get((book, filename)) != stamp:
+                        stale.setdefault(book, []).append(filename)
+            total = sum(len(names) for names in stale.values())
+            results = self._count(stale, total, workers)
+            with self._lock:
+                removed = [key for key in self.files if key not in stamps]
+                for key in removed:
+                    del self.files[key]
+                for book, counts in results:
+                    for filename, (words, characters) in counts.items():
+                        self.files[(book, filename)] = (stamps[(book, filename)], words, characters)
+                if removed or total:
+                    self.dirty = True
+            span.set(recounted=total, removed=len(removed))
+        return total
+
+    def _count(self, stale, total, workers):
+        if total < PARALLEL_MIN_FILES or len(stale) < 2:
+            return [count_book_files(self.base_path, book, names) for book, names in stale.items()]
+        # spawn, not fork: the caller is a worker thread of a Tk process
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(count_book_files, self.base_path, book, names) for book, names in stale.items()]
+            return [future.result() for future in futures]
+
+    def record_text(self, book, filename, text):
+        """Count text just written to a chapter, stamped with the file as it now is."""
+        if not is_counted(filename):
+            return
+        try:
+            st = os.stat(chapter_path(self.base_path, book, filename))
+        except OSError as e:
+            log.warning("Cannot stat %s/%s: %s", book, filename, e)
+            return
+        words, characters = count_text(text, filename)
+        with self._lock:
+            self.files[(book, filename)] = ((st.st_mtime_ns, st.st_size), words, characters)
+            self.dirty = True
+
+    def by_book(self):
+        """{book: [(filename, words, characters)]} for the counted chapters, in chapter order."""
+        books = {}
+        with self._lock:
+            for (book, filename), (_, words, characters) in self.files.items():
+                books.setdefault(book, []).append((filename, words, characters))
+        for rows in books.values():
+            rows.sort(key=lambda row: natural_sort_key(row[0]))
+        return books
@@ -0,0 +1,243 @@
+"""Append-only log of social posts: what was posted for which book, and when.
+
+Every post the queue sends, or gives up on, is recorded in the
+``post_log`` table of the shelf's ``posts.sqlite3`` with its platform,
+book, post id, time, text, a hash of the text and a status.  Rows are only
+ever inserted.  Indexes on (book, posted_at), (posted_at) and
+(text_hash, posted_at) serve per-book, time-range and duplicate-text
+queries without a table scan.
+
+``tweets.txt`` files, written before this log existed and still appended
+to by ``social.post_tweet``, are imported by ``import_tweet_logs``.  A
+file is re-read only when its mtime or size changed, and post ids make a
+re-import a no-op.  Twitter shortens links, so the text of an imported
+tweet is what Twitter returned, which may not hash like the text sent.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from campaign import PLATFORM_FOR_KIND
+from post_queue import Deferred, PermanentError
+import social
+
+log = logging.getLogger('book_builder.post_history')
+
+POSTED = 'posted'
+FAILED = 'failed'
+SOURCE_QUEUE = 'queue'
+SOURCE_TWEETS_TXT = 'tweets.txt'
+TWEETS_FILE_NAME = 'tweets.txt'
+DEFAULT_REPOST_WINDOW_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS post_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    platform TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    book TEXT NOT NULL,
+    post_id TEXT,
+    posted_at REAL NOT NULL,
+    text TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    source TEXT NOT NULL,
+    job_id INTEGER,
+    error TEXT,
+    UNIQUE (platform, post_id)
+);
+CREATE INDEX IF NOT EXISTS post_log_book ON post_log (book, posted_at);
+CREATE INDEX IF NOT EXISTS post_log_time ON post_log (posted_at);
+CREATE INDEX IF NOT EXISTS post_log_text ON post_log (text_hash, posted_at);
+CREATE TABLE IF NOT EXISTS post_log_imports (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+TWEET_LOG_HEADER_RE = re.compile(r'^--- (.+) at (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) ---$')
+TWEET_LOG_LABEL_RE = re.compile(r'^(.+) \(ID: (\w+)\):$')
+
+
+def text_hash(text):
+    return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+
+def post_text(payload):
+    """The text a post job sends: tweet and reply text, or an Instagram caption."""
+    return payload.get('text') or payload.get('caption') or ''
+
+
+def parse_tweet_log(path):
+    """Entries of a tweets.txt file as dicts with kind, post_id, posted_at and text."""
+    entries = []
+    entry = None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        lines = f.read().splitlines()
+    i = 0
+    while i < len(lines):
+        header = TWEET_LOG_HEADER_RE.match(lines[i])
+        label = TWEET_LOG_LABEL_RE.match(lines[i + 1]) if header and i + 1 < len(lines) else None
+        if header and label:
+            entry = {
+                'kind': social.TWEET_REPLY if header.group(1).startswith('Reply') else social.TWEET,
+                'post_id': label.group(2),
+                'posted_at': datetime.strptime(header.group(2), '%Y-%m-%d %H:%M:%S').timestamp(),
+                'lines': [],
+            }
+            entries.append(entry)
+            i += 2
+            continue
+        if entry is not None:
+            entry['lines'].append(lines[i])
+        i += 1
+    for entry in entries:
+        entry['text'] = "\n".join(entry.pop('lines')).strip()
+    return entries
+
+
+class PostHistory:
+    def __init__(self, db_path, clock=time.time):
+        self.db_path = db_path
+        self.clock = clock
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+    def record(self, platform, kind, book, text, status=POSTED, post_id=None, posted_at=None,
+               job_id=None, error=None, source=SOURCE_QUEUE):
+        """Append a post; returns False if that platform's post id is already logged."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO post_log "
+                "(platform, kind, book, post_id, posted_at, text, text_hash, status, source, job_id, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (platform, kind, book, None if post_id is None else str(post_id),
+                 self.clock() if posted_at is None else posted_at, text, text_hash(text),
+                 status, source, job_id, error)
+            )
+        return cursor.rowcount == 1
+
+    def entries(self, book=None, since=None, until=None, platform=None, statuses=None):
+        """Logged posts, oldest first, narrowed by book, time range, platform and status."""
+        clauses, params = [], []
+        if book is not None:
+            clauses.append("book = ?")
+            params.append(book)
+        if since is not None:
+            clauses.append("posted_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("posted_at < ?")
+            params.append(until)
+        if platform is not None:
+            clauses.append("platform = ?")
+            params.append(platform)
+        if statuses:
+            clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        query = "SELECT * FROM post_log"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY posted_at"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_posted(self):
+        """{book: time of its latest successful post}."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT book, MAX(posted_at) AS posted_at FROM post_log WHERE status = ? GROUP BY book", (POSTED,)
+            ).fetchall()
+        return {row['book']: row['posted_at'] for row in rows}
+
+    def last_posted_text(self, platform, text, since=None):
+        """Time identical text was last posted to the platform (after since), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(posted_at) AS posted_at FROM post_log "
+                "WHERE text_hash = ? AND platform = ? AND status = ? AND posted_at >= ?",
+                (text_hash(text), platform, POSTED, since or 0)
+            ).fetchone()
+        return row['posted_at']
+
+    def import_tweet_logs(self, base_path):
+        """Import every book's tweets.txt that changed since the last import; returns new entries."""
+        shelf = os.path.join(base_path, 'bookshelf')
+        imported = 0
+        try:
+            books = [entry.name for entry in os.scandir(shelf) if entry.is_dir() and not entry.name.startswith('.')]
+        except OSError as e:
+            log.warning("Cannot list %s: %s", shelf, e)
+            return 0
+        with self._lock:
+            known = {row['path']: (row['mtime_ns'], row['size'])
+                     for row in self._db.execute("SELECT * FROM post_log_imports").fetchall()}
+        for book in books:
+            path = os.path.join(shelf, book, TWEETS_FILE_NAME)
+            try:
+                st = os.stat(path)
+                if known.get(path) == (st.st_mtime_ns, st.st_size):
+                    continue
+                entries = parse_tweet_log(path)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                log.warning("Cannot import %s: %s", path, e)
+                continue
+            for entry in entries:
+                imported += self.record(
+                    PLATFORM_FOR_KIND[entry['kind']], entry['kind'], book, entry['text'],
+                    post_id=entry['post_id'], posted_at=entry['posted_at'], source=SOURCE_TWEETS_TXT
+                )
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO post_log_imports (path, mtime_ns, size) VALUES (?, ?, ?)",
+                    (path, st.st_mtime_ns, st.st_size)
+                )
+        if imported:
+            log.info("Imported %s posts from tweets.txt files", imported)
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def recorded(handlers, history):
+    """Wrap PostQueue handlers so sent posts, and posts the queue gives up on, are logged.
+
+    A logging failure is only warned about: raising would make the queue
+    retry a post that already went out.
+    """
+    def log_post(job, kind, **fields):
+        try:
+            history.record(PLATFORM_FOR_KIND.get(kind, kind), kind, job['book'], post_text(job['payload']),
+                           job_id=job['id'], **fields)
+        except sqlite3.Error as e:
+            log.warning("Failed to log %s for %s: %s", kind, job['book'], e)
+
+    def wrap(kind, handler):
+        def run(job, post_queue):
+            try:
+                result = handler(job, post_queue) or {}
+            except Deferred:
+                raise
+            except Exception as e:
+                if isinstance(e, PermanentError) or job['attempts'] >= job['max_attempts']:
+                    log_post(job, kind, status=FAILED, error=str(e))
+                raise
+            log_post(job, kind, post_id=result.get('tweet_id') or result.get('media_id') or None)
+            return result
+        return run
+    return {kind: wrap(kind, handler) for kind, handler in handlers.items()}
@@ -0,0 +1,362 @@
+"""Durable job queue for social posts, backed by SQLite.
+
+Jobs live in ``bookshelf/.bookbuilder/posts.sqlite3`` and are run by a
+background worker thread, so network calls never happen on the Tk thread
+and a delayed job (like the Amazon-links reply) survives an app restart.
+
+Each job has a unique idempotency key: enqueueing the same key twice is a
+no-op.  Handlers are plain callables ``handler(job, queue)`` looked up by
+job kind; they can ``checkpoint`` partial progress (e.g. the id of a tweet
+that was already created) so a retry doesn't repeat side effects.  A
+failing job is retried with exponential backoff unless the handler raises
+``PermanentError``; a handler that raises ``Deferred`` (e.g. when a rate
+limiter has no token) is rescheduled without using up an attempt.
+
+Several queues can share a database (the app and ``cli post``, say).  A
+job is claimed by a conditional update, so only one queue runs it, and a
+claimed job carries its queue's owner id and a lease that the queue's
+heartbeat keeps extending.  ``resume`` only requeues running jobs whose
+lease has run out, i.e. whose queue exited or hung mid-job.  Outcomes
+are written against the claim's token, so a worker that hung past its
+lease can't overwrite the job once it has been requeued or claimed again.
+
+Outcomes are reported on ``PostQueue.events`` for the UI to drain with
+``after()``:
+    ('done', job)
+    ('retry', job, error, delay_seconds)
+    ('failed', job, error)
+"""
+import json
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+log = logging.getLogger('book_builder.post_queue')
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY = 30  # Seconds before the first retry; doubles per attempt
+MAX_RETRY_DELAY = 3600
+IDLE_POLL_SECONDS = 5.0
+LEASE_SECONDS = 120.0  # A running job whose lease is this old is taken to be abandoned
+HEARTBEAT_SECONDS = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS post_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    book TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    run_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    campaign TEXT,
+    claim TEXT
+);
+CREATE INDEX IF NOT EXISTS post_jobs_due ON post_jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS post_jobs_book ON post_jobs (book, created_at);
+"""
+# Columns added after the first release, for databases created before them
+ADDED_COLUMNS = (('owner', 'TEXT'), ('lease_until', 'REAL'), ('campaign', 'TEXT'), ('claim', 'TEXT'))
+# Created once the added columns exist
+ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS post_jobs_campaign ON post_jobs (campaign) WHERE campaign IS NOT NULL;
+"""
+
+
+class PermanentError(Exception):
+    """Raised by a handler when retrying cannot help (bad credentials, missing file)."""
+
+
+class Deferred(Exception):
+    """Raised by a handler to run the job again after delay seconds, not counting an attempt."""
+
+    def __init__(self, delay, reason=''):
+        super().__init__(reason or f"deferred for {delay:.1f}s")
+        self.delay = delay
+
+
+def retry_delay(attempts, base=BASE_RETRY_DELAY, maximum=MAX_RETRY_DELAY):
+    """Exponential backoff with 10% jitter for the given attempt number (1-based)."""
+    delay = min(maximum, base * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.9, 1.1)
+
+
+class PostQueue:
+    def __init__(self, db_path, handlers, clock=time.time, base_delay=BASE_RETRY_DELAY, workers=1,
+                 lease_seconds=LEASE_SECONDS):
+        self.db_path = db_path
+        self.handlers = dict(handlers)
+        self.clock = clock
+        self.base_delay = base_delay
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex  # Marks the jobs this queue has claimed
+        self.events = queue.Queue()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA busy_timeout = 5000')  # Other queues may be writing
+            self._db.executescript(SCHEMA)
+            columns = {row['name'] for row in self._db.execute("PRAGMA table_info(post_jobs)")}
+            for name, sql_type in ADDED_COLUMNS:
+                if name not in columns:
+                    self._db.execute(f"ALTER TABLE post_jobs ADD COLUMN {name} {sql_type}")
+            if 'campaign' not in columns:
+                rows = self._db.execute("SELECT id, payload FROM post_jobs").fetchall()
+                self._db.executemany("UPDATE post_jobs SET campaign = ? WHERE id = ?",
+                                     [(json.loads(row['payload']).get('campaign'), row['id']) for row in rows])
+            self._db.executescript(ADDED_INDEXES)
+
+    def _row_to_job(self, row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else {}
+        return job
+
+    def enqueue(self, kind, book, payload, idempotency_key, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Add a job unless its idempotency key exists; return (job_id, created)."""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for post job kind: {kind}")
+        now = self.clock()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO post_jobs "
+                "(kind, book, payload, idempotency_key, status, run_at, max_attempts, created_at, updated_at, "
+                "campaign) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, book, json.dumps(payload), idempotency_key, PENDING, now + delay, max_attempts, now, now,
+                 payload.get('campaign'))
+            )
+            created = cursor.rowcount == 1
+            if created:
+                job_id = cursor.lastrowid
+            else:
+                job_id = self._db.execute(
+                    "SELECT id FROM post_jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()['id']
+        if created:
+            self._wake.set()
+        return job_id, created
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM post_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def jobs(self, book=None, statuses=None, campaign=None):
+        query = "SELECT * FROM post_jobs"
+        clauses, params = [], []
+        if book is not None:
+            clauses.append("book = ?")
+            params.append(book)
+        if campaign is not None:
+            clauses.append("campaign = ?")
+            params.append(campaign)
+        if statuses:
+            clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def checkpoint(self, job_id, **progress):
+        """Merge progress into a running job's result so retries can resume."""
+        with self._lock:
+            row = self._db.execute("SELECT result FROM post_jobs WHERE id = ?", (job_id,)).fetchone()
+            result = json.loads(row['result']) if row and row['result'] else {}
+            result.update(progress)
+            self._db.execute(
+                "UPDATE post_jobs SET result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result), self.clock(), job_id)
+            )
+
+    def resume(self):
+        """Requeue running jobs whose lease ran out: their queue exited or hung mid-job.
+
+        Jobs another live queue is running keep their lease fresh and are
+        left alone.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE post_jobs SET status = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (PENDING, self.clock(), RUNNING, self.clock())
+            )
+        return cursor.rowcount
+
+    def heartbeat(self):
+        """Extend the lease on every job this queue is running."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE post_jobs SET lease_until = ? WHERE owner = ? AND status = ?",
+                (self.clock() + self.lease_seconds, self.owner, RUNNING)
+            )
+
+    def next_due(self):
+        """Seconds until the next pending job is due (0 if overdue), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(run_at) AS run_at FROM post_jobs WHERE status = ?", (PENDING,)
+            ).fetchone()
+        if row['run_at'] is None:
+            return None
+        return max(0.0, row['run_at'] - self.clock())
+
+    def _claim_due(self):
+        """Claim the next due job, or return None.
+
+        The update only succeeds while the job is still pending, so when
+        another queue on the same database claims it first, this one moves
+        on to the next due job.  Each claim gets its own ``claim`` token,
+        which the job's outcome is written against.
+        """
+        claim = uuid.uuid4().hex
+        with self._lock:
+            while True:
+                row = self._db.execute(
+                    "SELECT * FROM post_jobs WHERE status = ? AND run_at <= ? ORDER BY run_at LIMIT 1",
+                    (PENDING, self.clock())
+                ).fetchone()
+                if row is None:
+                    return None
+                cursor = self._db.execute(
+                    "UPDATE post_jobs SET status = ?, attempts = attempts + 1, owner = ?, claim = ?, lease_until = ?, "
+                    "updated_at = ? WHERE id = ? AND status = ?",
+                    (RUNNING, self.owner, claim, self.clock() + self.lease_seconds, self.clock(), row['id'], PENDING)
+                )
+                if cursor.rowcount == 1:
+                    break
+        job = self._row_to_job(row)
+        job['attempts'] += 1
+        job['status'] = RUNNING
+        job['claim'] = claim
+        return job
+
+    def _finish(self, job, status, error=None, run_at=None, result=None):
+        """Record a claimed job's outcome; False if the claim was lost meanwhile.
+
+        A worker whose lease ran out may finish after the job was requeued
+        or claimed again, and must not overwrite what happened since.
+        """
+        sets = ["status = ?", "updated_at = ?", "last_error = ?"]
+        params = [status, self.clock(), error]
+        if run_at is not None:
+            sets.append("run_at = ?")
+            params.append(run_at)
+        if result is not None:
+            sets.append("result = ?")
+            params.append(json.dumps(result))
+        sets.append("lease_until = NULL")
+        params += [job['id'], RUNNING, job['claim']]
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE post_jobs SET {', '.join(sets)} WHERE id = ? AND status = ? AND claim = ?", params
+            )
+        if cursor.rowcount == 1:
+            return True
+        log.warning("Post job %s lost its lease before it finished; not recording %s", job['id'], status)
+        return False
+
+    def run_job(self, job):
+        handler = self.handlers[job['kind']]
+        try:
+            result = handler(job, self)
+        except Deferred as e:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE post_jobs SET status = ?, attempts = attempts - 1, run_at = ?, updated_at = ?, "
+                    "lease_until = NULL WHERE id = ? AND status = ? AND claim = ?",
+                    (PENDING, self.clock() + e.delay, self.clock(), job['id'], RUNNING, job['claim'])
+                )
+            return
+        except PermanentError as e:
+            if self._finish(job, FAILED, error=str(e)):
+                self.events.put(('failed', self.get(job['id']), str(e)))
+            return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job['attempts'] >= job['max_attempts']:
+                if self._finish(job, FAILED, error=error):
+                    self.events.put(('failed', self.get(job['id']), error))
+            else:
+                delay = retry_delay(job['attempts'], self.base_delay)
+                if self._finish(job, PENDING, error=error, run_at=self.clock() + delay):
+                    self.events.put(('retry', self.get(job['id']), error, delay))
+            return
+        merged = dict(self.get(job['id'])['result'])
+        merged.update(result or {})
+        if self._finish(job, DONE, result=merged):
+            self.events.put(('done', self.get(job['id'])))
+
+    def run_due(self):
+        """Run every job that is currently due; returns how many ran."""
+        count = 0
+        while not self._stop.is_set():
+            job = self._claim_due()
+            if job is None:
+                break
+            self.run_job(job)
+            count += 1
+        return count
+
+    def start(self):
+        resumed = self.resume()
+        if resumed:
+            log.debug("Requeued %s interrupted post jobs", resumed)
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _heartbeat(self):
+        while not self._stop.wait(min(HEARTBEAT_SECONDS, self.lease_seconds / 3)):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                log.warning("Post queue heartbeat failed: %s", e)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                self.resume()  # Pick up jobs a queue that has since exited left running
+                self.run_due()
+                wait = self.next_due()
+            except Exception as e:
+                log.warning("Post queue worker error: %s", e)
+                wait = IDLE_POLL_SECONDS
+            # Workers share the wake event, so one may clear it before another
+            # sees it; the bounded wait keeps that to a short delay.
+            self._wake.wait(IDLE_POLL_SECONDS if wait is None else min(wait, IDLE_POLL_SECONDS))
+            self._wake.clear()
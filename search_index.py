@@ -0,0 +1,276 @@
+"""Full-text search over every chapter file on the shelf.
+
+An inverted index maps each lower-cased word to the chapter files and line
+numbers it appears on.  It is saved as JSON (never a pickle, which would
+run code from anyone able to write the shelf) to ``bookshelf/.bookbuilder/
+search.json`` and ``update()`` only re-reads chapter files whose mtime or
+size changed, so keeping it current costs one ``scandir`` per book.  The
+first build of a large shelf tokenizes books in a process pool.
+
+Searching intersects the postings of the query words (the last word also
+matches as a prefix, so results appear while typing) and only then reads
+the matching lines from disk, so a query takes milliseconds however large
+the shelf is.
+"""
+import bisect
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+
+import tracing
+from bookshelf import CACHE_DIR_NAME, atomic_write, cache_dir, natural_sort_key, stamp_from_json
+
+log = logging.getLogger('book_builder.search_index')
+
+INDEX_FILE_NAME = 'search.json'
+INDEX_VERSION = 2
+PARALLEL_MIN_FILES = 2000  # Below this, starting a spawn pool costs more than it saves
+DEFAULT_LIMIT = 500
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+
+def scan_chapters(base_path, book):
+    """{filename: (mtime_ns, size)} for the files in a book's chapters/ directory."""
+    chapters_dir = os.path.join(base_path, 'bookshelf', book, 'chapters')
+    files = {}
+    try:
+        entries = os.scandir(chapters_dir)
+    except OSError:
+        return files
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+    return files
+
+
+def index_file(path):
+    """{word: [line numbers]} for one chapter file (lines are 1-based)."""
+    words = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line_no, line in enumerate(f, 1):
+            for word in set(tokenize(line)):
+                words.setdefault(word, []).append(line_no)
+    return words
+
+
+def index_book_files(base_path, book, filenames):
+    """Tokenize some of a book's chapters; runs in a pool worker."""
+    chapters_dir = os.path.join(base_path, 'bookshelf', book, 'chapters')
+    results = {}
+    for filename in filenames:
+        try:
+            results[filename] = index_file(os.path.join(chapters_dir, filename))
+        except OSError as e:
+            log.warning("Cannot index %s/%s: %s", book, filename, e)
+    return book, results
+
+
+class SearchHit:
+    __slots__ = ('base_path', 'book', 'filename', 'line', 'text')
+
+    def __init__(self, base_path, book, filename, line, text):
+        self.base_path = base_path
+        self.book = book
+        self.filename = filename
+        self.line = line
+        self.text = text
+
+
+class ChapterSearchIndex:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.files = {}  # file id -> (book, filename, stamp)
+        self.file_ids = {}  # (book, filename) -> file id
+        self.file_words = {}  # file id -> words, to remove its postings on change
+        self.postings = {}  # word -> {file id: [line numbers]}
+        self.next_id = 0
+        self.dirty = False
+        self._vocabulary = None  # Sorted words for prefix lookups, rebuilt lazily
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, base_path):
+        index = cls(base_path)
+        path = os.path.join(base_path, 'bookshelf', CACHE_DIR_NAME, INDEX_FILE_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                files = {int(fid): (book, filename, stamp_from_json(stamp))
+                         for fid, book, filename, stamp in data['files']}
+                postings = {word: {int(fid): list(lines) for fid, lines in entries}
+                            for word, entries in data['postings'].items()}
+                file_words = {fid: [] for fid in files}
+                for word, entries in postings.items():
+                    for fid in entries:
+                        file_words[fid].append(word)
+                index.files = files
+                index.file_words = file_words
+                index.postings = postings
+                index.next_id = int(data['next_id'])
+                index.file_ids = {(book, filename): fid for fid, (book, filename, _) in files.items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Ignoring unreadable search index %s: %s", path, e)
+        return index
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            # Each file's words aren't saved: load() rebuilds them from the postings
+            data = json.dumps({
+                'version': INDEX_VERSION,
+                'files': [[fid, book, filename, stamp] for fid, (book, filename, stamp) in self.files.items()],
+                'postings': {word: list(files.items()) for word, files in self.postings.items()},
+                'next_id': self.next_id,
+            }, separators=(',', ':'))
+            self.dirty = False
+        try:
+            atomic_write(os.path.join(cache_dir(self.base_path), INDEX_FILE_NAME), data)
+        except Exception as e:
+            log.warning("Failed to save search index: %s", e)
+
+    def _remove(self, fid):
+        for word in self.file_words.pop(fid, ()):
+            files = self.postings.get(word)
+            if files is not None:
+                files.pop(fid, None)
+                if not files:
+                    del self.postings[word]
+        book, filename, _ = self.files.pop(fid)
+        del self.file_ids[(book, filename)]
+
+    def _add(self, book, filename, stamp, words):
+        fid = self.next_id
+        self.next_id += 1
+        self.files[fid] = (book, filename, stamp)
+        self.file_ids[(book, filename)] = fid
+        self.file_words[fid] = list(words)
+        for word, lines in words.items():
+            self.postings.setdefault(word, {})[fid] = lines
+
+    def update(self, books, workers=None, complete=True):
+        """Re-index changed chapter files; returns the number of files re-read.
+
+        ``books`` is every book on the shelf: indexed files of any other
+        book, or that no longer exist, are dropped.  With ``complete=False``
+        only those books are rechecked and the rest of the index is kept.
+        """
+        with tracing.span('search.update', books=len(books)) as span:
+            stale = {}  # book -> [filename]
+            stamps = {}
+            seen = set()
+            checked = set(books)
+            for book in checked:
+                for filename, stamp in scan_chapters(self.base_path, book).items():
+                    seen.add((book, filename))
+                    stamps[(book, filename)] = stamp
+                    fid = self.file_ids.get((book, filename))
+                    if fid is None or self.files[fid][2] != stamp:
+                        stale.setdefault(book, []).append(filename)
+            total = sum(len(names) for names in stale.values())
+            results = self._tokenize(stale, total, workers)
+            with self._lock:
+                removed = [fid for key, fid in self.file_ids.items()
+                           if key not in seen and (complete or key[0] in checked)]
+                for fid in removed:
+                    self._remove(fid)
+                for book, words_by_file in results:
+                    for filename, words in words_by_file.items():
+                        fid = self.file_ids.get((book, filename))
+                        if fid is not None:
+                            self._remove(fid)
+                        self._add(book, filename, stamps[(book, filename)], words)
+                if removed or total:
+                    self.dirty = True
+                    self._vocabulary = None
+            span.set(reindexed=total, removed=len(removed))
+        if total or removed:
+            log.debug("Search index: %s files re-read, %s removed", total, len(removed))
+        return total
+
+    def _tokenize(self, stale, total, workers):
+        if total < PARALLEL_MIN_FILES or len(stale) < 2:
+            return [index_book_files(self.base_path, book, names) for book, names in stale.items()]
+        # spawn, not fork: the caller is a worker thread of a Tk process
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(index_book_files, self.base_path, book, names) for book, names in stale.items()]
+            return [future.result() for future in futures]
+
+    def _lines_for(self, word, prefix):
+        """{file id: set(line numbers)} where word (or a word starting with it) occurs."""
+        if not prefix:
+            return {fid: set(lines) for fid, lines in self.postings.get(word, {}).items()}
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        merged = {}
+        start = bisect.bisect_left(self._vocabulary, word)
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(word):
+                break
+            for fid, lines in self.postings[candidate].items():
+                merged.setdefault(fid, set()).update(lines)
+        return merged
+
+    def search(self, query, limit=DEFAULT_LIMIT, books=None):
+        """Lines containing every word of the query, exact-phrase matches first.
+
+        Matching lines are read from disk in book and chapter order until
+        ``limit`` hits are found.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        with tracing.span('search.query', query=query) as span, self._lock:
+            matches = None
+            for i, word in enumerate(words):
+                lines = self._lines_for(word, prefix=i == len(words) - 1)
+                if matches is None:
+                    matches = lines
+                else:
+                    matches = {fid: matches[fid] & lines[fid] for fid in matches.keys() & lines.keys()}
+                    matches = {fid: found for fid, found in matches.items() if found}
+                if not matches:
+                    return []
+            located = sorted(
+                ((self.files[fid][0], self.files[fid][1], fid, sorted(lines)) for fid, lines in matches.items()
+                 if books is None or self.files[fid][0] in books),
+                key=lambda item: (item[0], natural_sort_key(item[1]))
+            )
+            span.set(files=len(located))
+        return self._read_hits(located, query.lower(), limit)
+
+    def _read_hits(self, located, phrase, limit):
+        phrase_hits, other_hits = [], []
+        for book, filename, _fid, line_numbers in located:
+            if len(phrase_hits) + len(other_hits) >= limit:
+                break
+            path = os.path.join(self.base_path, 'bookshelf', book, 'chapters', filename)
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    lines = f.read().splitlines()
+            except OSError:
+                continue
+            for line_no in line_numbers:
+                if line_no > len(lines):
+                    continue
+                text = lines[line_no - 1]
+                hit = SearchHit(self.base_path, book, filename, line_no, text.strip())
+                (phrase_hits if phrase in text.lower() else other_hits).append(hit)
+        return (phrase_hits + other_hits)[:limit]
@@ -0,0 +1,371 @@
+"""Tweet and Instagram post text, clients and post-queue handlers.
+
+The handlers run on the PostQueue worker thread, never on the Tk thread.
+They take their clients from a ``SocialClients`` object, so they can be
+driven by local stubs through a subclass that builds stub clients.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime  # For timestamp in tweets.txt
+
+import bookshelf
+import tracing
+from bookshelf import atomic_write
+from post_queue import PermanentError
+
+log = logging.getLogger('book_builder.social')
+
+TWEET_LIMIT = 280
+CAPTION_LIMIT = 2200
+REPLY_DELAY_SECONDS = 60
+INSTAGRAM_SESSION_FILE = os.path.expanduser("~/.book_builder_instagram_session.json")
+
+TWEET = 'tweet'
+TWEET_REPLY = 'tweet_reply'
+INSTAGRAM = 'instagram'
+
+
+def build_tweet_texts(title, subtitle, author, amazon_us=None, amazon_uk=None):
+    """Return (main tweet, reply with Amazon links), each within the tweet limit."""
+    base_text = (
+        f"Discover a new book: {title}. {subtitle}. "
+        f"Written by {author or 'an unknown author'}. "
+        f"This engaging read is now available for you to explore!"
+    )
+
+    cta_text = "Here's the link to buy:"
+    if amazon_us:
+        cta_text += f"\n🇺🇸 US: {amazon_us}"
+    if amazon_uk:
+        cta_text += f"\n🇬🇧 UK: {amazon_uk}"
+
+    if len(base_text) > TWEET_LIMIT:
+        base_text = base_text[:TWEET_LIMIT - 3] + "..."
+    if len(cta_text) > TWEET_LIMIT:
+        cta_text = cta_text[:TWEET_LIMIT - 3] + "..."
+    return base_text, cta_text
+
+
+def build_instagram_caption(title, author, amazon_us=None, amazon_uk=None):
+    """Caption with hashtags and Amazon links, trimmed to Instagram's limit."""
+    base_text = (
+        f"📚 New Book: {title}\n"
+        f"✍️ Author: {author or 'Unknown'}\n"
+        f"Discover this gem today! #Bookstagram #IndieAuthor #BookLovers "
+        f"#NewRelease #ReadersOfInstagram #BookCommunity #AmazonFinds"
+    )
+    cta_text = ""
+    if amazon_us or amazon_uk:
+        cta_text = "\n📖 Get it now:"
+        if amazon_us:
+            cta_text += f"\n🇺🇸 US: {amazon_us}"
+        if amazon_uk:
+            cta_text += f"\n🇬🇧 UK: {amazon_uk}"
+
+    caption = base_text + cta_text
+    if len(caption) > CAPTION_LIMIT:
+        max_base_length = CAPTION_LIMIT - len(cta_text) - 3
+        caption = base_text[:max_base_length] + "..." + cta_text
+    return caption
+
+
+def idempotency_key(kind, book, text, day=None):
+    """Same post text for the same book on the same day is only queued once."""
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    return f"{kind}:{book}:{digest}:{day or datetime.now().strftime('%Y-%m-%d')}"
+
+
+def tweet_problem(record):
+    """(title, message) explaining why a book can't be tweeted, or None."""
+    if not record['has_epub']:
+        return "Missing File", "EPUB file not found."
+    if not (record['amazon_us'] or record['amazon_uk']):
+        return "Missing Amazon Links", "At least one of amazon[us] or amazon[uk] is required in books.ini."
+    if record['title'] == 'unknown' or record['fields'].get('book[subtitle]', 'unknown') == 'unknown':
+        return "Missing Metadata", "book[title] or book[subtitle] missing in books.ini."
+    return None
+
+
+def instagram_problem(record):
+    """(title, message) explaining why a book can't be posted to Instagram, or None."""
+    if not record['has_epub']:
+        return "Missing File", "EPUB file not found."
+    if not record['has_cover']:
+        return "Missing File", "Cover image not found."
+    return None
+
+
+def tweet_payload(base_path, record, author):
+    """PostQueue payload for a book's main tweet and its Amazon-links reply."""
+    book = record['book']
+    base_text, cta_text = build_tweet_texts(
+        record['title'], record['fields'].get('book[subtitle]', 'unknown'), author,
+        record['amazon_us'], record['amazon_uk']
+    )
+    return {
+        'text': base_text,
+        'reply_text': cta_text,
+        'cover_path': bookshelf.cover_path(base_path, book) if record['has_cover'] else None,
+        'tweets_file': os.path.join(bookshelf.book_dir(base_path, book), 'tweets.txt'),
+    }
+
+
+def instagram_payload(base_path, record, title, author):
+    """PostQueue payload for a book's Instagram cover post."""
+    book = record['book']
+    caption = build_instagram_caption(title or book, author, record['amazon_us'], record['amazon_uk'])
+    return {'caption': caption, 'cover_path': bookshelf.cover_path(base_path, book)}
+
+
+def append_tweet_log(tweets_file, heading, label, tweet_id, text):
+    """Append a posted tweet to the book's tweets.txt; failures are only logged."""
+    try:
+        with open(tweets_file, 'a', encoding='utf-8') as f:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            f.write(f"--- {heading} at {timestamp} ---\n")
+            f.write(f"{label} (ID: {tweet_id}):\n{text}\n")
+            f.write("\n")
+        log.debug("Saved tweet %s to %s", tweet_id, tweets_file)
+    except Exception as file_error:
+        log.warning("Failed to write to %s: %s", tweets_file, file_error)
+
+
+class SocialClients:
+    """Process-wide Twitter and Instagram sessions built from .env credentials.
+
+    Clients are built on first use and then reused, the Twitter identity
+    from ``get_me`` is cached, and the instagrapi session settings are
+    saved to ``session_path`` so a restart reuses the session instead of
+    logging in again.  Use ``with_twitter``/``with_instagram`` to run a call:
+    if the session has expired it logs in again and retries once.
+
+    Instagram calls run one at a time on the shared client, and an expired
+    session is replaced by a new client logged in with the same device
+    ids.  Each replacement bumps ``instagram_generation``, so a call that
+    saw the old session doesn't log in a second time.
+
+    Stub clients can be used by subclassing and overriding
+    ``build_twitter``, ``build_instagram`` and the ``*_auth_errors`` methods.
+    """
+
+    def __init__(self, session_path=INSTAGRAM_SESSION_FILE):
+        self.session_path = session_path
+        self.twitter_username = None
+        self._twitter = None
+        self._instagram = None
+        self.instagram_generation = 0
+        self._lock = threading.RLock()
+        self._instagram_lock = threading.RLock()  # Held for each Instagram call
+
+    def twitter_auth_errors(self):
+        import tweepy
+        return (tweepy.Unauthorized,)
+
+    def instagram_auth_errors(self):
+        from instagrapi.exceptions import LoginRequired
+        return (LoginRequired,)
+
+    def build_twitter(self):
+        consumer_key = os.getenv("TWITTER_API_KEY")
+        consumer_secret = os.getenv("TWITTER_API_SECRET")
+        access_token = os.getenv("TWITTER_ACCESS_TOKEN")
+        access_token_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
+        if not all([consumer_key, consumer_secret, access_token, access_token_secret]):
+            raise PermanentError("Missing OAuth 1.0a credentials")
+
+        import tweepy
+        client = tweepy.Client(
+            consumer_key=consumer_key,
+            consumer_secret=consumer_secret,
+            access_token=access_token,
+            access_token_secret=access_token_secret
+        )
+        auth = tweepy.OAuth1UserHandler(consumer_key, consumer_secret, access_token, access_token_secret)
+        return client, tweepy.API(auth)
+
+    def twitter(self):
+        """Cached (client, api); get_me only runs when the client is first built."""
+        with self._lock:
+            if self._twitter is None:
+                client, api = self.build_twitter()
+                try:
+                    with tracing.span('twitter.get_me', category='network'):
+                        user = client.get_me()
+                except self.twitter_auth_errors() as auth_error:
+                    raise PermanentError(f"Authentication failed: {auth_error}")
+                self.twitter_username = user.data.username
+                log.info("Twitter authenticated as %s", self.twitter_username)
+                self._twitter = (client, api)
+            return self._twitter
+
+    def reset_twitter(self):
+        with self._lock:
+            self._twitter = None
+            self.twitter_username = None
+
+    def with_twitter(self, action, name='twitter.call'):
+        """Return action(client, api), rebuilding the session once if it is rejected."""
+        try:
+            with tracing.span(name, category='network'):
+                return action(*self.twitter())
+        except self.twitter_auth_errors() as auth_error:
+            log.warning("Twitter session rejected (%s); re-authenticating", auth_error)
+            self.reset_twitter()
+        with tracing.span(name, category='network', retry=True):
+            return action(*self.twitter())
+
+    def build_instagram(self, previous=None):
+        """A logged-in instagrapi client.
+
+        It reuses the saved session settings if any; after an expiry,
+        ``previous`` is the expired client, and only its device settings
+        are kept, so the login is a fresh one from the same device.
+        """
+        username = os.getenv("INSTAGRAM_USERNAME")
+        password = os.getenv("INSTAGRAM_PASSWORD")
+        if not all([username, password]):
+            raise PermanentError("Missing Instagram credentials")
+
+        from instagrapi import Client as InstagramClient
+        from instagrapi.exceptions import BadPassword
+        client = InstagramClient()
+        if previous is not None:
+            settings = previous.get_settings()
+            settings.pop('authorization_data', None)
+            settings.pop('cookies', None)
+            client.set_settings(settings)
+        elif os.path.exists(self.session_path):
+            try:
+                client.load_settings(self.session_path)
+                log.debug("Loaded Instagram session from %s", self.session_path)
+            except Exception as e:
+                log.warning("Ignoring unreadable Instagram session %s: %s", self.session_path, e)
+        try:
+            # With loaded settings this only validates the saved session
+            with tracing.span('instagram.login', category='network'):
+                client.login(username, password)
+        except BadPassword:
+            raise PermanentError("Invalid Instagram credentials")
+        log.info("Instagram login successful")
+        return client
+
+    def relogin_instagram(self, generation):
+        """Replace the client whose session expired, unless that was done since ``generation``."""
+        with self._instagram_lock:
+            if generation != self.instagram_generation or self._instagram is None:
+                return  # Another call already logged in again
+            with tracing.span('instagram.relogin', category='network'):
+                client = self.build_instagram(previous=self._instagram)
+            self._instagram = client
+            self.instagram_generation += 1
+            self.save_instagram_session(client)
+
+    def save_instagram_session(self, client):
+        try:
+            atomic_write(self.session_path, json.dumps(client.get_settings(), indent=2))
+            os.chmod(self.session_path, 0o600)  # Session cookies are credentials
+        except Exception as e:
+            log.warning("Failed to save Instagram session to %s: %s", self.session_path, e)
+
+    def instagram(self):
+        with self._instagram_lock:
+            if self._instagram is None:
+                self._instagram = self.build_instagram()
+                self.save_instagram_session(self._instagram)
+            return self._instagram
+
+    def with_instagram(self, action, name='instagram.call'):
+        """Return action(client), logging in again once if the session expired.
+
+        Calls are serialized: the post queue's workers share one client.
+        """
+        with self._instagram_lock:
+            client = self.instagram()
+            generation = self.instagram_generation
+            try:
+                with tracing.span(name, category='network'):
+                    return action(client)
+            except self.instagram_auth_errors() as auth_error:
+                log.warning("Instagram session expired (%s); logging in again", auth_error)
+                self.relogin_instagram(generation)
+            with tracing.span(name, category='network', retry=True):
+                return action(self.instagram())
+
+
+def post_tweet(job, post_queue, clients):
+    """Post the main tweet (with cover if any) and schedule the links reply.
+
+    Progress is checkpointed, so a retry after the tweet went out only
+    schedules the reply instead of tweeting twice.
+    """
+    payload = job['payload']
+    progress = job['result']
+    tweet_id = progress.get('tweet_id')
+    if tweet_id is None:
+        media_id = progress.get('media_id')
+        cover_path = payload.get('cover_path')
+        if media_id is None and cover_path:
+            try:
+                media_id = clients.with_twitter(
+                    lambda client, api: api.media_upload(cover_path).media_id, 'twitter.media_upload'
+                )
+                post_queue.checkpoint(job['id'], media_id=media_id)
+                log.debug("Media ID: %s", media_id)
+            except PermanentError:
+                raise
+            except Exception as media_error:
+                log.warning("Failed to upload media: %s", media_error)
+
+        response = clients.with_twitter(lambda client, api: client.create_tweet(
+            text=payload['text'], media_ids=[media_id] if media_id else None
+        ), 'twitter.create_tweet')
+        log.debug("Main Tweet response: %s", response)
+        tweet_id = response.data['id']
+        post_queue.checkpoint(job['id'], tweet_id=tweet_id)
+        append_tweet_log(payload['tweets_file'], "Posted", "Main Tweet", tweet_id, response.data['text'])
+
+    reply_job_id = None
+    if payload.get('reply_text'):
+        reply_payload = {'text': payload['reply_text'], 'in_reply_to': tweet_id, 'tweets_file': payload['tweets_file']}
+        if 'campaign' in payload:
+            reply_payload['campaign'] = payload['campaign']
+        reply_job_id, _ = post_queue.enqueue(
+            TWEET_REPLY, job['book'], reply_payload,
+            job['idempotency_key'] + ':reply',
+            delay=payload.get('reply_delay', REPLY_DELAY_SECONDS)
+        )
+    return {'tweet_id': tweet_id, 'reply_job_id': reply_job_id}
+
+
+def post_tweet_reply(job, post_queue, clients):
+    payload = job['payload']
+    response = clients.with_twitter(lambda client, api: client.create_tweet(
+        text=payload['text'], in_reply_to_tweet_id=payload['in_reply_to']
+    ), 'twitter.create_reply')
+    log.debug("Reply Tweet response: %s", response)
+    append_tweet_log(payload['tweets_file'], "Reply Posted", "Reply", response.data['id'], response.data['text'])
+    return {'tweet_id': response.data['id']}
+
+
+def post_instagram(job, post_queue, clients):
+    payload = job['payload']
+    if not os.path.exists(payload['cover_path']):
+        raise PermanentError("Cover image not found.")
+    media = clients.with_instagram(
+        lambda client: client.photo_upload(path=payload['cover_path'], caption=payload['caption']),
+        'instagram.photo_upload'
+    )
+    log.debug("Instagram post successful")
+    return {'media_id': str(getattr(media, 'pk', '') or '')}
+
+
+def make_handlers(clients):
+    """PostQueue handlers for every social job kind, bound to clients."""
+    return {
+        TWEET: lambda job, post_queue: post_tweet(job, post_queue, clients),
+        TWEET_REPLY: lambda job, post_queue: post_tweet_reply(job, post_queue, clients),
+        INSTAGRAM: lambda job, post_queue: post_instagram(job, post_queue, clients),
+    }
@@ -0,0 +1,10 @@
+import campaign
+
+
+def test_partial_rate_limit_keeps_the_other_defaults():
+    limiters = campaign.make_limiters({'twitter': {'posts': 50}, 'mastodon': {'posts': 10, 'period': 60}})
+    assert limiters['twitter'].rate == 50 / campaign.DEFAULT_RATE_LIMITS['twitter']['period']
+    assert limiters['twitter'].capacity == campaign.DEFAULT_RATE_LIMITS['twitter']['burst']
+    assert limiters['instagram'].capacity == campaign.DEFAULT_RATE_LIMITS['instagram']['burst']
+    assert limiters['mastodon'].capacity == 1
+    assert campaign.DEFAULT_RATE_LIMITS['twitter']['posts'] == 100
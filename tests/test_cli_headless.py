@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+import bench
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_main_cli_build_needs_no_tkinter(tmp_path):
+    """Native builds run in a spawn pool, whose workers must not import tkinter either."""
+    shelf = os.path.join(tmp_path, 'shelf')
+    bench.make_synthetic_shelf(shelf, books=2, chapters=2, covers=False)
+    no_tk = os.path.join(tmp_path, 'no_tk')
+    os.mkdir(no_tk)
+    with open(os.path.join(no_tk, 'tkinter.py'), 'w') as f:
+        f.write("raise ImportError('tkinter is hidden for this test')\n")
+    env = dict(os.environ, PYTHONPATH=no_tk)
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO, 'main.py'), 'cli', 'build', shelf, '--engine', 'native', '--force'],
+        capture_output=True, text=True, env=env, timeout=120
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    summary = json.loads(result.stdout.splitlines()[-1])
+    assert summary['failed'] == 0 and summary['succeeded'] >= 1
@@ -0,0 +1,17 @@
+import sys
+
+from jobs import JobRunner, SUCCEEDED
+
+
+def test_forget_finished_drops_only_finished_jobs(tmp_path):
+    runner = JobRunner(max_workers=1)
+    done = runner.submit('build', 'one', [sys.executable, '-c', 'print("built")'], str(tmp_path))
+    while runner.events.get()[0] != 'finished':
+        pass
+    queued = runner.submit('build', 'two', [sys.executable, '-c', 'import time; time.sleep(5)'], str(tmp_path))
+    assert done.status == SUCCEEDED
+
+    assert runner.forget_finished() == [done.id]
+    assert runner.get(done.id) is None
+    assert runner.jobs() == [queued]
+    runner.cancel_all()
@@ -0,0 +1,29 @@
+import os
+
+import bench
+from bookshelf import CACHE_DIR_NAME
+from manuscript_stats import STATS_FILE_NAME, ShelfStats
+
+BOOKS = ['book-00000', 'book-00001']
+
+
+def test_saved_counts_load_without_recounting(tmp_path):
+    root = str(tmp_path)
+    bench.make_synthetic_shelf(root, books=2, chapters=3, covers=False)
+    stats = ShelfStats.load(root)
+    assert stats.update(BOOKS) == 6
+    stats.save()
+    loaded = ShelfStats.load(root)
+    assert loaded.update(BOOKS) == 0
+    assert loaded.by_book() == stats.by_book()
+
+
+def test_malformed_counts_are_a_cache_miss(tmp_path):
+    root = str(tmp_path)
+    bench.make_synthetic_shelf(root, books=2, chapters=3, covers=False)
+    os.makedirs(os.path.join(root, 'bookshelf', CACHE_DIR_NAME), exist_ok=True)
+    with open(os.path.join(root, 'bookshelf', CACHE_DIR_NAME, STATS_FILE_NAME), 'w') as f:
+        f.write('{"version": 2, "files": [["book-00000", "Chapter 1.md"]]}')
+    stats = ShelfStats.load(root)
+    assert stats.files == {}
+    assert stats.update(BOOKS) == 6
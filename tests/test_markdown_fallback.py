@@ -0,0 +1,31 @@
+import sys
+
+import pytest
+
+from build_engines import markdown_to_html
+
+
+@pytest.fixture(autouse=True)
+def no_markdown_package(monkeypatch):
+    # None in sys.modules makes `import markdown` raise ImportError, so the fallback runs
+    monkeypatch.setitem(sys.modules, 'markdown', None)
+
+
+def test_heading_line_is_split_from_its_paragraph():
+    assert markdown_to_html("# Chapter 1\nIt was a dark night.") == (
+        "<h1>Chapter 1</h1>\n<p>It was a dark night.</p>")
+
+
+def test_link_url_is_left_alone():
+    assert markdown_to_html("[x](https://example.com/my_page_here)") == (
+        '<p><a href="https://example.com/my_page_here">x</a></p>')
+
+
+def test_underscores_inside_words_are_not_emphasis():
+    assert markdown_to_html("snake_case_name") == "<p>snake_case_name</p>"
+
+
+def test_emphasis_code_and_images():
+    assert markdown_to_html("**bold**, *it*, _u_, `a_b_c` ![a](img/x_y.png)") == (
+        '<p><strong>bold</strong>, <em>it</em>, <em>u</em>, <code>a_b_c</code> '
+        '<img alt="a" src="img/x_y.png"/></p>')
@@ -0,0 +1,41 @@
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip('ebooklib')
+
+from build_engines import build_epub
+from epub_verify import verify_epub
+
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6300010000050001a5f645400000000049454e44ae426082'
+)
+
+
+def test_chapter_media_references_resolve_inside_the_epub(tmp_path):
+    root = str(tmp_path)
+    book_dir = os.path.join(root, 'bookshelf', 'pictures')
+    os.makedirs(os.path.join(book_dir, 'chapters'))
+    os.makedirs(os.path.join(book_dir, 'media'))
+    with open(os.path.join(root, 'bookshelf', 'books.ini'), 'w') as f:
+        f.write("[pictures]\nbook[title] = Pictures\n")
+    for name in ('map.png', 'plan.png'):
+        with open(os.path.join(book_dir, 'media', name), 'wb') as f:
+            f.write(PNG)
+    with open(os.path.join(book_dir, 'chapters', 'Chapter 1.md'), 'w') as f:
+        f.write("# Chapter 1\n\n![The map](media/map.png)\n\n![The plan](plan.png)\n")
+    with open(os.path.join(book_dir, 'chapters', 'Chapter 2.html'), 'w') as f:
+        f.write('<html><body><h1>Chapter 2</h1><p><img src="map.png" alt="map"/>'
+                '<a href="https://example.com/map.png">source</a></p></body></html>')
+
+    assert build_epub(root, 'pictures', lambda line: None) == 0
+    epub_file = os.path.join(book_dir, 'pictures.epub')
+    assert verify_epub(epub_file) == []  # Checks every <img> resolves to an entry in the archive
+    with zipfile.ZipFile(epub_file) as zf:
+        chapters = sorted(name for name in zf.namelist() if '/chapters/' in name)
+        first, second = (zf.read(name).decode('utf-8') for name in chapters)
+    assert 'src="../media/map.png"' in first and 'src="../media/plan.png"' in first
+    assert 'src="../media/map.png"' in second
+    assert 'href="https://example.com/map.png"' in second
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+
+from post_queue import PENDING, RUNNING, DONE, PostQueue
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_queue(db_path, calls, name, **kwargs):
+    def handler(job, queue):
+        calls.append((name, job['id']))
+        return {'by': name}
+    return PostQueue(db_path, {'tweet': handler}, **kwargs)
+
+
+def test_resume_leaves_another_queues_running_job_alone(tmp_path):
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    calls = []
+    a = make_queue(db_path, calls, 'A')
+    b = make_queue(db_path, calls, 'B')
+    job_id, _ = a.enqueue('tweet', 'book', {'text': 'hi'}, 'key-1')
+
+    job = a._claim_due()  # A is mid-post
+    assert b.resume() == 0
+    assert b.get(job_id)['status'] == RUNNING
+    assert b.run_due() == 0
+
+    a.run_job(job)
+    assert calls == [('A', job_id)]
+    assert a.get(job_id)['status'] == DONE
+
+
+def test_claim_skips_a_job_another_queue_claimed(tmp_path):
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    calls = []
+    a = make_queue(db_path, calls, 'A')
+    b = make_queue(db_path, calls, 'B')
+    first, _ = a.enqueue('tweet', 'book', {'text': 'one'}, 'key-1')
+    second, _ = a.enqueue('tweet', 'book', {'text': 'two'}, 'key-2', delay=-1)
+
+    claimed_by_b = b._claim_due()
+    claimed_by_a = a._claim_due()
+    assert {claimed_by_a['id'], claimed_by_b['id']} == {first, second}
+    assert a._claim_due() is None and b._claim_due() is None
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    clock = Clock()
+    calls = []
+    a = make_queue(db_path, calls, 'A', clock=clock, lease_seconds=60)
+    b = make_queue(db_path, calls, 'B', clock=clock, lease_seconds=60)
+    job_id, _ = a.enqueue('tweet', 'book', {'text': 'hi'}, 'key-1')
+    a._claim_due()  # ...and then A's process dies
+
+    clock.now += 30
+    assert b.resume() == 0
+    clock.now += 31
+    assert b.resume() == 1
+    assert b.get(job_id)['status'] == PENDING
+    assert b.run_due() == 1
+    assert calls == [('B', job_id)]
+
+
+def test_stale_worker_cannot_overwrite_a_reclaimed_job(tmp_path):
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    clock = Clock()
+
+    def fail(job, queue):
+        raise RuntimeError("timed out")
+
+    a = PostQueue(db_path, {'tweet': fail}, clock=clock, lease_seconds=60)
+    b = make_queue(db_path, [], 'B', clock=clock, lease_seconds=60)
+    job_id, _ = a.enqueue('tweet', 'book', {'text': 'hi'}, 'key-1')
+    stale = a._claim_due()  # A hangs past its lease...
+    clock.now += 61
+    assert b.resume() == 1
+    fresh = b._claim_due()
+
+    a.run_job(stale)  # ...then fails, while B is still posting
+    assert b.get(job_id)['status'] == RUNNING
+    assert a.events.empty()
+    b.run_job(fresh)
+    assert b.get(job_id)['status'] == DONE
+    a.run_job(stale)  # A late retry of the stale claim doesn't clobber DONE either
+    job = b.get(job_id)
+    assert (job['status'], job['result']) == (DONE, {'by': 'B'})
+
+
+def test_heartbeat_keeps_a_long_job_leased(tmp_path):
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    clock = Clock()
+    a = make_queue(db_path, [], 'A', clock=clock, lease_seconds=60)
+    b = make_queue(db_path, [], 'B', clock=clock, lease_seconds=60)
+    job_id, _ = a.enqueue('tweet', 'book', {'text': 'hi'}, 'key-1')
+    a._claim_due()
+    clock.now += 50
+    a.heartbeat()
+    clock.now += 50
+    assert b.resume() == 0
+    assert b.get(job_id)['status'] == RUNNING
+
+
+def test_two_started_queues_post_each_job_once(tmp_path):
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    calls = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def make(name):
+        def handler(job, queue):
+            with lock:
+                calls.append((name, job['id']))
+            release.wait(5)  # Still posting while the other queue starts
+            return {}
+        return PostQueue(db_path, {'tweet': handler}, workers=2)
+
+    a = make('A')
+    job_ids = [a.enqueue('tweet', 'book', {'text': str(i)}, f'key-{i}')[0] for i in range(5)]
+    a.start()
+    deadline = time.monotonic() + 5
+    while not calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    b = make('B')
+    b.start()
+    release.set()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if all(a.get(job_id)['status'] == DONE for job_id in job_ids):
+            break
+        time.sleep(0.05)
+    a.stop()
+    b.stop()
+    assert sorted(job_id for _, job_id in calls) == job_ids
+
+
+def test_jobs_filters_by_campaign(tmp_path):
+    queue = make_queue(os.path.join(tmp_path, 'posts.sqlite3'), [], 'A')
+    queue.enqueue('tweet', 'one', {'text': 'a', 'campaign': 'c1'}, 'key-1')
+    queue.enqueue('tweet', 'two', {'text': 'b', 'campaign': 'c2'}, 'key-2')
+    queue.enqueue('tweet', 'three', {'text': 'c'}, 'key-3')
+    assert [job['book'] for job in queue.jobs(campaign='c1')] == ['one']
+
+
+def test_campaign_is_backfilled_in_an_older_database(tmp_path):
+    import sqlite3
+    db_path = os.path.join(tmp_path, 'posts.sqlite3')
+    make_queue(db_path, [], 'A').enqueue('tweet', 'one', {'text': 'a', 'campaign': 'c1'}, 'key-1')
+    db = sqlite3.connect(db_path)
+    db.execute("DROP INDEX post_jobs_campaign")  # As created before the column existed
+    db.execute("ALTER TABLE post_jobs DROP COLUMN campaign")
+    db.commit()
+    db.close()
+    assert [job['book'] for job in make_queue(db_path, [], 'B').jobs(campaign='c1')] == ['one']
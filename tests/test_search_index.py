@@ -0,0 +1,43 @@
+import os
+
+import bench
+from bookshelf import CACHE_DIR_NAME
+from search_index import INDEX_FILE_NAME, ChapterSearchIndex
+
+BOOKS = ['book-00000', 'book-00001']
+
+
+def make_index(tmp_path):
+    root = str(tmp_path)
+    bench.make_synthetic_shelf(root, books=2, chapters=3, covers=False)
+    index = ChapterSearchIndex.load(root)
+    index.update(BOOKS)
+    index.save()
+    return root, index
+
+
+def test_saved_index_searches_the_same_without_rereading(tmp_path):
+    root, index = make_index(tmp_path)
+    loaded = ChapterSearchIndex.load(root)
+    assert loaded.update(BOOKS) == 0
+    found = [(hit.book, hit.filename, hit.line) for hit in loaded.search('chapter 2')]
+    assert found == [(hit.book, hit.filename, hit.line) for hit in index.search('chapter 2')]
+    assert found
+
+
+def test_malformed_index_is_a_cache_miss(tmp_path):
+    root, _ = make_index(tmp_path)
+    with open(os.path.join(root, 'bookshelf', CACHE_DIR_NAME, INDEX_FILE_NAME), 'w') as f:
+        f.write('{"version": 2, "files": [[0, "book-00000"]]}')
+    index = ChapterSearchIndex.load(root)
+    assert index.files == {}
+    assert index.update(BOOKS) == 6
+
+
+def test_partial_update_keeps_the_other_books(tmp_path):
+    root, index = make_index(tmp_path)
+    with open(os.path.join(root, 'bookshelf', 'book-00001', 'chapters', 'Chapter 9.md'), 'w') as f:
+        f.write("zebra crossing\n")
+    assert index.update(['book-00001'], complete=False) == 1
+    assert len(index.files) == 7
+    assert [(hit.book, hit.filename) for hit in index.search('zebra')] == [('book-00001', 'Chapter 9.md')]
@@ -0,0 +1,30 @@
+import os
+
+import bench
+from bookshelf import CACHE_DIR_NAME, INDEX_FILE_NAME, ShelfIndex
+
+
+def make_index(tmp_path):
+    root = str(tmp_path)
+    bench.make_synthetic_shelf(root, books=3, chapters=2, covers=False)
+    index = ShelfIndex.load(root)
+    index.refresh()
+    index.save()
+    return root, os.path.join(root, 'bookshelf', CACHE_DIR_NAME, INDEX_FILE_NAME)
+
+
+def test_saved_index_loads_without_rescanning(tmp_path):
+    root, _ = make_index(tmp_path)
+    index = ShelfIndex.load(root)
+    assert len(index.order) == 3
+    assert index.refresh() == set()
+
+
+def test_malformed_index_is_a_cache_miss(tmp_path):
+    root, path = make_index(tmp_path)
+    for junk in (b'\x80\x04\x95 not json', b'{"version": 3, "books": ['):
+        with open(path, 'wb') as f:
+            f.write(junk)
+        index = ShelfIndex.load(root)
+        assert index.order == []
+        assert len(index.refresh()) == 3
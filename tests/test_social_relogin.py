@@ -0,0 +1,129 @@
+import threading
+import types
+
+import pytest
+
+from social import SocialClients
+
+
+class LoginRequired(Exception):
+    pass
+
+
+class StubInstagramClient:
+    def __init__(self, previous=None):
+        self.expired = False
+        self.previous = previous
+
+    def get_settings(self):
+        return {'uuids': {}}
+
+
+class StubTwitterClient:
+    def get_me(self):
+        return types.SimpleNamespace(data=types.SimpleNamespace(username='stub'))
+
+
+class StubClients(SocialClients):
+    def __init__(self, session_path):
+        super().__init__(session_path)
+        self.instagram_builds = []
+        self.twitter_builds = 0
+
+    def instagram_auth_errors(self):
+        return (LoginRequired,)
+
+    def twitter_auth_errors(self):
+        return (LoginRequired,)
+
+    def build_instagram(self, previous=None):
+        client = StubInstagramClient(previous)
+        self.instagram_builds.append(client)
+        return client
+
+    def build_twitter(self):
+        self.twitter_builds += 1
+        return StubTwitterClient(), object()
+
+
+def failing(times):
+    """An action that raises LoginRequired the first `times` calls, then returns 'posted'."""
+    calls = []
+
+    def action(*clients):
+        calls.append(clients)
+        if len(calls) <= times:
+            raise LoginRequired("session expired")
+        return 'posted'
+    return action, calls
+
+
+def post(client):
+    if client.expired:
+        raise LoginRequired("session expired")
+    return 'posted'
+
+
+@pytest.fixture
+def clients(tmp_path):
+    return StubClients(str(tmp_path / 'session.json'))
+
+
+def test_instagram_logs_in_again_once_and_retries(clients):
+    action, calls = failing(1)
+    assert clients.with_instagram(action) == 'posted'
+    assert len(calls) == 2
+    first, second = clients.instagram_builds
+    assert second.previous is first  # The new login keeps the expired client's device settings
+    assert calls[1] == (second,)
+
+
+def test_instagram_second_rejection_is_raised(clients):
+    action, calls = failing(2)
+    with pytest.raises(LoginRequired):
+        clients.with_instagram(action)
+    assert len(calls) == 2
+    assert len(clients.instagram_builds) == 2
+
+
+def test_instagram_logs_in_again_on_each_expiry(clients):
+    for _ in range(2):
+        action, calls = failing(1)
+        assert clients.with_instagram(action) == 'posted'
+    assert len(clients.instagram_builds) == 3
+    assert clients.instagram_generation == 2
+
+
+def test_instagram_expiry_seen_by_several_workers_logs_in_once(clients):
+    clients.instagram().expired = True
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients.with_instagram(post))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['posted'] * 4
+    assert len(clients.instagram_builds) == 2
+
+
+def test_instagram_relogin_for_an_old_generation_is_skipped(clients):
+    clients.instagram()
+    generation = clients.instagram_generation
+    clients.relogin_instagram(generation)
+    clients.relogin_instagram(generation)  # A second worker that saw the same expiry
+    assert len(clients.instagram_builds) == 2
+
+
+def test_twitter_rebuilds_once_and_retries(clients):
+    action, calls = failing(1)
+    assert clients.with_twitter(action) == 'posted'
+    assert len(calls) == 2
+    assert clients.twitter_builds == 2
+
+
+def test_twitter_second_rejection_is_raised(clients):
+    action, calls = failing(2)
+    with pytest.raises(LoginRequired):
+        clients.with_twitter(action)
+    assert len(calls) == 2
+    assert clients.twitter_builds == 2
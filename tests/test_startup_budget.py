@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_BUDGET_SECONDS = 5.0  # Generous: this catches an eager heavy import, not small drift
+
+
+@pytest.fixture
+def display(monkeypatch):
+    if 'DISPLAY' not in os.environ:
+        monkeypatch.delenv('DISPLAY', raising=False)  # Undone after the test; start_display sets it
+    has_display, xvfb = bench.start_display()
+    if not has_display:
+        pytest.skip("no display and no Xvfb")
+    yield
+    if xvfb is not None:
+        xvfb.terminate()
+
+
+def test_window_opens_within_budget(display, tmp_path):
+    # A fresh HOME, so the run reads no saved config and opens no real shelf
+    env = dict(os.environ, HOME=str(tmp_path))
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO, 'main.py'), '--profile-startup',
+         '--startup-budget', str(STARTUP_BUDGET_SECONDS)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'time to window' in result.stdout
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import thumbnails
+from thumbnails import ThumbnailCache
+
+pytestmark = pytest.mark.skipif(not thumbnails.available(), reason="Pillow is not installed")
+
+
+def render(cache, cover):
+    key, path = cache.lookup(cover)
+    assert path is None
+    cache.request('book', cover, key)
+    return key, cache.results.get(timeout=10)
+
+
+def test_undecodable_cover_is_not_retried_until_it_changes(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, 'bookshelf'))
+    cover = os.path.join(root, 'cover.jpg')
+    with open(cover, 'wb') as f:
+        f.write(b'not a jpeg')
+    cache = ThumbnailCache(root)
+    try:
+        key, (_, _, path) = render(cache, cover)
+        assert path is None and cache.failed(key)
+        cache.request('book', cover, key)
+        assert cache.results.empty() and not cache._futures
+
+        from PIL import Image
+        Image.new('RGB', (60, 90), 'red').save(cover, 'JPEG')
+        new_key, (_, _, path) = render(cache, cover)
+        assert new_key != key and not cache.failed(new_key)
+        assert os.path.exists(path)
+    finally:
+        cache.shutdown()
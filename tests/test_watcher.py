@@ -0,0 +1,26 @@
+import os
+
+import bench
+from bookshelf import ShelfSet, scan_root
+from watcher import ShelfWatcher
+
+
+def test_overflow_rechecks_every_book(tmp_path):
+    root = str(tmp_path)
+    bench.make_synthetic_shelf(root, books=3, chapters=2, covers=False)
+    index, _ = scan_root(root)
+    shelf = ShelfSet([root])
+    shelf.attach(root, index)
+
+    # A change whose inotify event was lost in the overflow
+    with open(os.path.join(root, 'bookshelf', 'book-00001', 'chapters', 'Chapter 3.md'), 'w') as f:
+        f.write("# Chapter 3\n")
+    watcher = ShelfWatcher(root, debounce=0)
+    watcher._note(ini=True)  # What the inotify loop does on IN_Q_OVERFLOW
+    watcher._flush_if_quiet()
+
+    books, ini_changed = watcher.drain()
+    assert (books, ini_changed) == (set(), True)
+    assert watcher.drain() is None
+    assert shelf.refresh_root(root, None if ini_changed else books) == {'book-00001'}
+    assert 'Chapter 3.md' in shelf.get('book-00001')['chapters']
@@ -0,0 +1,119 @@
+"""Cover thumbnails for the book list, cached on disk.
+
+Thumbnails are PNGs in ``bookshelf/.bookbuilder/thumbs/`` named by a hash
+of the cover's path, mtime and size and the thumbnail size, so a replaced
+cover gets a new file and an unchanged one is never decoded again.  Misses
+are decoded in a thread pool (Pillow releases the GIL while decoding), in
+JPEG draft mode so a print-resolution cover is decoded at a fraction of
+its size.  Tk's PhotoImage reads PNG itself, so the Tk thread only loads
+the small cached file.
+"""
+import concurrent.futures
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import queue
+import threading
+
+import tracing
+from bookshelf import atomic_write, cache_dir
+
+log = logging.getLogger('book_builder.thumbnails')
+
+THUMBS_DIR_NAME = 'thumbs'
+DEFAULT_SIZE = (36, 48)  # Width, height in pixels
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def available():
+    """Whether Pillow is installed, without paying for importing it."""
+    return importlib.util.find_spec('PIL') is not None
+
+
+def thumbnail_key(path, stamp, size):
+    raw = f"{os.path.abspath(path)}\0{stamp[0]}\0{stamp[1]}\0{size[0]}x{size[1]}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def render_thumbnail(source, size):
+    """PNG bytes of the image at source scaled to fit within size."""
+    from PIL import Image
+    with Image.open(source) as image:
+        image.draft('RGB', (size[0] * 2, size[1] * 2))  # JPEG only: decode at 1/2 to 1/8 scale
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        image.thumbnail(size, Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, 'PNG')
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    """Thumbnails for one shelf; finished renders arrive on ``results``.
+
+    ``results`` yields ``(book, key, png_path)`` tuples, with ``png_path``
+    None if the cover could not be decoded.  A cover that failed isn't
+    tried again until it changes (its key includes the mtime and size).
+    """
+
+    def __init__(self, base_path, size=DEFAULT_SIZE, workers=DEFAULT_WORKERS):
+        self.base_path = base_path
+        self.size = tuple(size)
+        self.directory = os.path.join(cache_dir(base_path), THUMBS_DIR_NAME)
+        os.makedirs(self.directory, exist_ok=True)
+        self.results = queue.Queue()
+        self._futures = {}  # key -> Future for renders not yet finished
+        self._failed = set()  # Keys of covers that could not be decoded
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + '.png')
+
+    def lookup(self, cover):
+        """(key, cached PNG path or None) for a cover file; (None, None) if it is missing."""
+        try:
+            st = os.stat(cover)
+        except OSError:
+            return None, None
+        key = thumbnail_key(cover, (st.st_mtime_ns, st.st_size), self.size)
+        path = self.path_for(key)
+        return key, path if os.path.exists(path) else None
+
+    def failed(self, key):
+        """Whether the cover with this key could not be decoded."""
+        with self._lock:
+            return key in self._failed
+
+    def request(self, book, cover, key):
+        """Render a cover in the pool unless that key is already on its way or has failed."""
+        with self._lock:
+            if key not in self._futures and key not in self._failed:
+                self._futures[key] = self._pool.submit(self._render, book, cover, key)
+
+    def retain(self, keys):
+        """Cancel queued renders not in keys, e.g. for rows scrolled out of view."""
+        with self._lock:
+            for key, future in list(self._futures.items()):
+                if key not in keys and future.cancel():
+                    del self._futures[key]
+
+    def _render(self, book, cover, key):
+        path = self.path_for(key)
+        try:
+            with tracing.span('thumbnail.render', book=book):
+                atomic_write(path, render_thumbnail(cover, self.size))
+        except Exception as e:
+            log.warning("Cannot make a thumbnail of %s: %s", cover, e)
+            path = None
+            with self._lock:
+                self._failed.add(key)
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+        self.results.put((book, key, path))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
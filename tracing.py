@@ -0,0 +1,127 @@
+"""Timing spans around hot paths, exported as a Chrome trace.
+
+    with tracing.span('ini.parse', path=ini_path):
+        ...
+
+Spans are off by default: ``span`` then returns one shared no-op context
+manager, so an instrumented call costs a global lookup and a function
+call.  ``enable(path)`` (``--trace FILE`` on the command line) starts
+recording complete events with their thread, and ``save()`` writes them in
+the Trace Event format that chrome://tracing and https://ui.perfetto.dev
+open.  It also saves at exit.  Each finished span is logged at DEBUG on
+the ``book_builder.trace`` logger.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('book_builder.trace')
+
+_enabled = False
+_path = None
+_events = []
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'category', 'args', 'started')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        event = {
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': (self.started - _origin) * 1e6,
+            'dur': (ended - self.started) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.args,
+        }
+        with _lock:
+            _events.append(event)
+        log.debug("%s took %.2fms %s", self.name, (ended - self.started) * 1000, self.args or '')
+        return False
+
+    def set(self, **args):
+        """Attach results known only at the end of the span, e.g. counts."""
+        self.args.update(args)
+
+
+def span(name, category=None, **args):
+    """Context manager timing a block; a shared no-op unless tracing is enabled."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, category or name.split('.', 1)[0], args)
+
+
+def enabled():
+    return _enabled
+
+
+def enable(path):
+    """Record spans from now on and write them to path at exit (or on save())."""
+    global _enabled, _path
+    _path = path
+    if not _enabled:
+        _enabled = True
+        atexit.register(save)
+    log.info("Tracing spans to %s", path)
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def save(path=None):
+    path = path or _path
+    if not path:
+        return
+    recorded = events()
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    metadata = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': thread_names[tid]}}
+        for tid in {event['tid'] for event in recorded} if tid in thread_names
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': metadata + recorded, 'displayTimeUnit': 'ms'}, f)
+    log.info("Wrote %d trace events to %s", len(recorded), path)
+
+
+def configure_logging(level='INFO'):
+    """Log to stderr as ``[LEVEL] message``, matching the app's old print() output."""
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO),
+                        format='[%(levelname)s] %(message)s')
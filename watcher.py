@@ -0,0 +1,247 @@
+"""Filesystem watcher for a bookshelf.
+
+Watches ``bookshelf/books.ini`` and every ``bookshelf/<book>/`` tree
+(the book directory plus its ``chapters/`` and ``media/``) and reports
+which books changed.  On Linux this uses inotify through ctypes; anywhere
+else, or if inotify can't be set up, it falls back to polling the same
+stats the ShelfIndex keys on.
+
+Bursts of events are debounced into one change set, which is put on
+``ShelfWatcher.events`` as ``(books, ini_changed)`` for the UI to drain
+with ``after()``.  ``ini_changed`` is also set when inotify's queue
+overflowed: events were lost, so every book has to be rechecked.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+from bookshelf import CACHE_DIR_NAME
+
+log = logging.getLogger('book_builder.watcher')
+
+DEBOUNCE_SECONDS = 0.3
+MAX_LATENCY_SECONDS = 2.0  # Flush even if events keep arriving
+POLL_INTERVAL_SECONDS = 2.0
+WATCHED_SUBDIRS = ('chapters', 'media')
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class ShelfWatcher:
+    def __init__(self, base_path, debounce=DEBOUNCE_SECONDS, poll_interval=POLL_INTERVAL_SECONDS):
+        self.base_path = base_path
+        self.shelf_dir = os.path.join(base_path, 'bookshelf')
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.events = queue.Queue()
+        self.backend = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._pending_books = set()
+        self._pending_ini = False
+        self._first_event_at = None
+        self._last_event_at = None
+
+    def start(self):
+        inotify = _Inotify.create() if sys.platform.startswith('linux') else None
+        if inotify is not None:
+            self.backend = 'inotify'
+            target = lambda: self._run_inotify(inotify)
+        else:
+            self.backend = 'polling'
+            target = self._run_polling
+        log.debug("Watching %s with %s", self.shelf_dir, self.backend)
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def drain(self):
+        """Merge the queued change sets: (books, ini_changed), or None if nothing changed."""
+        books = set()
+        ini_changed = False
+        seen = False
+        try:
+            while True:
+                changed_books, changed_ini = self.events.get_nowait()
+                books |= changed_books
+                ini_changed = ini_changed or changed_ini
+                seen = True
+        except queue.Empty:
+            pass
+        return (books, ini_changed) if seen else None
+
+    def _note(self, book=None, ini=False):
+        now = time.monotonic()
+        if self._first_event_at is None:
+            self._first_event_at = now
+        self._last_event_at = now
+        if book:
+            self._pending_books.add(book)
+        if ini:
+            self._pending_ini = True
+
+    def _flush_if_quiet(self):
+        if self._first_event_at is None:
+            return
+        now = time.monotonic()
+        if (now - self._last_event_at >= self.debounce
+                or now - self._first_event_at >= MAX_LATENCY_SECONDS):
+            self.events.put((self._pending_books, self._pending_ini))
+            self._pending_books = set()
+            self._pending_ini = False
+            self._first_event_at = self._last_event_at = None
+
+    def _run_inotify(self, inotify):
+        watches = {}  # wd -> (book, subdir); book is None for the shelf itself
+
+        def watch(path, book, subdir):
+            wd = inotify.add_watch(path, WATCH_MASK)
+            if wd >= 0:
+                watches[wd] = (book, subdir)
+
+        def watch_book(book):
+            book_path = os.path.join(self.shelf_dir, book)
+            watch(book_path, book, None)
+            for subdir in WATCHED_SUBDIRS:
+                if os.path.isdir(os.path.join(book_path, subdir)):
+                    watch(os.path.join(book_path, subdir), book, subdir)
+
+        try:
+            watch(self.shelf_dir, None, None)
+            for entry in os.scandir(self.shelf_dir):
+                if entry.is_dir() and entry.name != CACHE_DIR_NAME:
+                    watch_book(entry.name)
+
+            while not self._stop.is_set():
+                timeout = self.debounce if self._first_event_at is not None else 0.5
+                for wd, mask, name in inotify.read_events(timeout):
+                    if mask & IN_Q_OVERFLOW:
+                        self._note(ini=True)  # Lost events: have the UI recheck everything
+                        continue
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    book, subdir = watches.get(wd, (None, None))
+                    if book is None:
+                        if name == 'books.ini':
+                            self._note(ini=True)
+                        elif name and name != CACHE_DIR_NAME and mask & IN_ISDIR:
+                            if mask & (IN_CREATE | IN_MOVED_TO):
+                                watch_book(name)
+                            self._note(book=name)
+                        continue
+                    if subdir is None and name in WATCHED_SUBDIRS and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        watch(os.path.join(self.shelf_dir, book, name), book, name)
+                    self._note(book=book)
+                self._flush_if_quiet()
+        except Exception as e:
+            log.warning("inotify watcher failed, falling back to polling: %s", e)
+            self.backend = 'polling'
+            self._run_polling()
+        finally:
+            inotify.close()
+
+    def _snapshot(self):
+        def stamp(path):
+            try:
+                st = os.stat(path)
+                return (st.st_mtime_ns, st.st_size)
+            except OSError:
+                return None
+
+        books = {}
+        try:
+            entries = [e.name for e in os.scandir(self.shelf_dir) if e.is_dir() and e.name != CACHE_DIR_NAME]
+        except OSError:
+            entries = []
+        for book in entries:
+            book_path = os.path.join(self.shelf_dir, book)
+            books[book] = (
+                stamp(book_path),
+                stamp(os.path.join(book_path, f"{book}.epub")),
+            ) + tuple(stamp(os.path.join(book_path, subdir)) for subdir in WATCHED_SUBDIRS)
+        return stamp(os.path.join(self.shelf_dir, 'books.ini')), books
+
+    def _run_polling(self):
+        ini_stamp, books = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            new_ini_stamp, new_books = self._snapshot()
+            changed = {book for book in set(books) | set(new_books) if books.get(book) != new_books.get(book)}
+            if changed or new_ini_stamp != ini_stamp:
+                self.events.put((changed, new_ini_stamp != ini_stamp))
+            ini_stamp, books = new_ini_stamp, new_books
+
+
+class _Inotify:
+    """Minimal ctypes binding for inotify_init1/add_watch and event reads."""
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    @classmethod
+    def create(cls):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            log.warning("Cannot watch %s: %s", path, os.strerror(ctypes.get_errno()))
+        return wd
+
+    def read_events(self, timeout):
+        """Yield (wd, mask, name) for events available within timeout seconds."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass